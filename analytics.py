@@ -0,0 +1,143 @@
+# NumPy is optional: without it the rest of the program works and the
+# analytics report that it is missing
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from database import GRADE_BANDS
+from services import id_condition
+
+PERCENTILES = [10, 25, 50, 75, 90]
+HISTOGRAM_BINS = 10
+
+def available():
+    return np is not None
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("Grade analytics need NumPy (pip install numpy)")
+
+class GradeData:
+    # Every grade row in columnar form: parallel arrays of student id, course
+    # id, grade and the credits of the course, the weight of the grade
+    def __init__(self, student_ids, course_ids, grades, credits):
+        self.student_ids = student_ids
+        self.course_ids = course_ids
+        self.grades = grades
+        self.credits = credits
+    
+    def __len__(self):
+        return len(self.grades)
+
+def load(conn, student_ids=None, course_ids=None):
+    # Read the grades, optionally of some students and/or courses only, in one
+    # pass straight into arrays
+    require_numpy()
+    conditions = ["g.grade IS NOT NULL"]
+    params = []
+    for column, ids in (("e.student_id", student_ids), ("e.course_id", course_ids)):
+        if ids is not None:
+            condition, param = id_condition(column, ids)
+            conditions.append(condition)
+            params.append(param)
+    row_type = np.dtype([("student", np.int64), ("course", np.int64), ("grade", np.float64), ("credits", np.float64)])
+    cursor = conn.execute(f'''
+        SELECT e.student_id, e.course_id, g.grade, COALESCE(c.credits, 0)
+        FROM grades g
+        JOIN enrollments e ON g.enrollment_id = e.id
+        JOIN courses c ON e.course_id = c.id
+        WHERE {" AND ".join(conditions)}
+    ''', params)
+    rows = np.fromiter(cursor, dtype=row_type)
+    return GradeData(rows["student"], rows["course"], rows["grade"], rows["credits"])
+
+def grade_points(grades):
+    # 0-100 grades to points on the 4.0 scale
+    require_numpy()
+    bounds = np.array([bound for bound, _ in reversed(GRADE_BANDS)], dtype=np.float64)
+    points = np.array([points for _, points in reversed(GRADE_BANDS)])
+    return points[np.searchsorted(bounds, grades, side="right") - 1]
+
+def group(keys):
+    # Distinct keys and the group number of every row
+    return np.unique(keys, return_inverse=True)
+
+def student_gpa(data):
+    # Credit-weighted average grade and GPA of every student with grades.
+    # Returns arrays of student id, average, GPA and credits counted.
+    students, index = group(data.student_ids)
+    credits = np.bincount(index, weights=data.credits, minlength=len(students))
+    weighted = np.bincount(index, weights=data.credits * data.grades, minlength=len(students))
+    weighted_points = np.bincount(index, weights=data.credits * grade_points(data.grades), minlength=len(students))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = np.where(credits > 0, weighted / credits, np.nan)
+        gpa = np.where(credits > 0, weighted_points / credits, np.nan)
+    return students, average, gpa, credits
+
+def course_stats(data):
+    # Per course: ids, count, mean, median, standard deviation, min and max
+    courses, index = group(data.course_ids)
+    counts = np.bincount(index, minlength=len(courses))
+    sums = np.bincount(index, weights=data.grades, minlength=len(courses))
+    squares = np.bincount(index, weights=data.grades * data.grades, minlength=len(courses))
+    means = sums / counts
+    stddevs = np.sqrt(np.maximum(squares / counts - means * means, 0))
+    
+    # Sorting by course, then grade, puts each course's grades in order in
+    # one contiguous run, so medians, minimums and maximums are lookups
+    order = np.lexsort((data.grades, index))
+    ordered = data.grades[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+    minimums = ordered[starts]
+    maximums = ordered[starts + counts - 1]
+    return courses, counts, means, medians, stddevs, minimums, maximums
+
+def percentiles(values, points=PERCENTILES):
+    require_numpy()
+    if len(values) == 0:
+        return {point: None for point in points}
+    return dict(zip(points, np.percentile(values, points).tolist()))
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    # Counts of grades in equal bins over 0-100 and the bin edges
+    require_numpy()
+    counts, edges = np.histogram(values, bins=bins, range=(0, 100))
+    return counts.tolist(), edges.tolist()
+
+def summary(conn, student_ids=None, course_ids=None, top_students=None):
+    # Everything the Analytics tab shows, as plain Python values that can be
+    # turned into JSON: overall distribution, per-course statistics and
+    # per-student GPA (all students, or the top_students best by GPA),
+    # optionally limited to some students or courses
+    data = load(conn, student_ids, course_ids)
+    
+    result = {
+        "grades": len(data),
+        "mean": float(data.grades.mean()) if len(data) else None,
+        "stddev": float(data.grades.std()) if len(data) else None,
+        "percentiles": percentiles(data.grades),
+        "histogram": histogram(data.grades),
+        "courses": [],
+        "students": [],
+    }
+    if not len(data):
+        return result
+    
+    for row in zip(*course_stats(data)):
+        course_id, count, mean, median, stddev, minimum, maximum = row
+        result["courses"].append({
+            "course_id": int(course_id), "count": int(count), "mean": float(mean), "median": float(median),
+            "stddev": float(stddev), "min": float(minimum), "max": float(maximum),
+        })
+    students = student_gpa(data)
+    if top_students is not None:
+        # Best GPA first, students without credits last
+        best = np.lexsort((-np.nan_to_num(students[1], nan=-1), -np.nan_to_num(students[2], nan=-1)))[:top_students]
+        students = [column[best] for column in students]
+    for student_id, average, gpa, credits in zip(*students):
+        result["students"].append({
+            "student_id": int(student_id), "average": None if np.isnan(average) else float(average),
+            "gpa": None if np.isnan(gpa) else float(gpa), "credits": float(credits),
+        })
+    return result
@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import re
+import signal
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit
+import database
+import services
+
+# A JSON API over the academy for other programs such as the portal and
+# billing, with the standard library only. Reads run on a pool of threads
+# with a read-only connection each; writes go one at a time through a single
+# writer connection, so they never wait on each other for SQLite's lock.
+#
+#   python api.py --port 8080
+#
+#   GET  /students?after=0&limit=100    a page; pass its next_after for the next
+#   GET  /students/search?q=smith
+#   GET  /students/42
+#   GET  /courses, /courses/search?q=algebra, /courses/7
+#   GET  /enrollments?student_id=42&course_id=7,8&after=0&limit=100
+#   GET  /enrollments/1234
+#   GET  /grades?enrollment_id=1234&student_id=42&course_id=7&after=0&limit=100
+#   GET  /stats
+#   POST /enrollments  {"student_id": 42, "course_id": 7}
+#   POST /grades       {"enrollment_id": 1234, "grade": 88.5, "grade_date": "2024-05-01"}
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Reader threads, each with its own connection
+READERS = 4
+
+# Most rows a page may ask for
+MAX_LIMIT = 1000
+
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 16
+
+# Seconds between writes of the buffered audit entries
+AUDIT_FLUSH_SECONDS = 5
+
+# Seconds an idle keep-alive connection stays open
+IDLE_TIMEOUT = 30
+
+# Range of SQLite's integers; larger ids could not be bound to a query
+INTEGER_MIN = -(1 << 63)
+INTEGER_MAX = (1 << 63) - 1
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               409: "Conflict", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+               500: "Internal Server Error"}
+
+class HTTPError(Exception):
+    # An error response: its status, message and any other fields of the
+    # JSON body
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: dict
+    body: bytes
+    keep_alive: bool
+
+async def read_line(reader, status, message):
+    # One line of the request head; a line longer than the stream's limit is
+    # answered with status
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise HTTPError(status, message)
+
+async def read_request(reader):
+    # The next request on a connection, or None once the client is done
+    line = await read_line(reader, 400, "Request line too long")
+    if not line:
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise HTTPError(400, "Malformed request line")
+    method, target, version = parts
+    headers = {}
+    while True:
+        line = await read_line(reader, 431, "Header line too long")
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return Request(method, url.path.rstrip("/") or "/", query, body, keep_alive)
+
+def response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+# Reading parameters
+
+def whole_number(value):
+    # value as an int if it is a JSON integer or a query string of digits
+    # within SQLite's range, else None. Floats and booleans don't count,
+    # int() would quietly turn 1.7 and true into 1.
+    if isinstance(value, str):
+        value = int(value) if re.fullmatch(r"-?\d{1,19}", value) else None
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value if INTEGER_MIN <= value <= INTEGER_MAX else None
+
+def int_param(values, name, default=None):
+    value = values.get(name, default)
+    if value is None:
+        raise HTTPError(400, f"{name} is required")
+    number = whole_number(value)
+    if number is None:
+        raise HTTPError(400, f"{name} must be a whole number, not {json.dumps(value)}")
+    return number
+
+def path_id(value, what):
+    # An id from the path; one too large for SQLite can't exist
+    number = whole_number(value)
+    if number is None:
+        raise HTTPError(404, f"{what} not found")
+    return number
+
+def bool_param(values, name, default):
+    # A JSON true or false; strings such as "false" are refused rather than
+    # taken as true
+    value = values.get(name, default)
+    if not isinstance(value, bool):
+        raise HTTPError(400, f"{name} must be true or false, not {json.dumps(value)}")
+    return value
+
+def ids_param(query, name):
+    # One id, a comma separated list of them, or None if not given
+    if name not in query:
+        return None
+    ids = [whole_number(part) for part in query[name].split(",")]
+    if None in ids:
+        raise HTTPError(400, f"{name} must be an id or a list of ids: {query[name]}")
+    return ids[0] if len(ids) == 1 else ids
+
+def limit_param(query, default):
+    # SQLite reads a negative LIMIT as no limit, so it is refused like one
+    # above MAX_LIMIT
+    limit = int_param(query, "limit", default)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise HTTPError(400, f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def page_params(query):
+    return int_param(query, "after", 0), limit_param(query, services.PAGE_LIMIT)
+
+def json_body(request):
+    try:
+        body = json.loads(request.body or b"{}")
+    except ValueError as e:
+        raise HTTPError(400, f"Invalid JSON: {e}")
+    if not isinstance(body, dict):
+        raise HTTPError(400, "The body must be a JSON object")
+    return body
+
+def page(rows, limit):
+    # A page of rows; next_after is the after of the next page, None at the end
+    return {"items": [row._asdict() for row in rows], "next_after": rows[-1].id if len(rows) == limit else None}
+
+def found(row, what):
+    if row is None:
+        raise HTTPError(404, f"{what} not found")
+    return row._asdict()
+
+def conflict_dict(conflict):
+    return {"kind": conflict.kind, "subject": conflict.subject, "course_id": conflict.course_id,
+            "course": conflict.course, "other_course_id": conflict.other_course_id,
+            "other_course": conflict.other_course, "slot": str(conflict.slot)}
+
+# Handlers, called on a reader or the writer thread with its service
+
+def list_students(academy, request):
+    after, limit = page_params(request.query)
+    return page(academy.students.page(after, limit), limit)
+
+def search_students(academy, request):
+    term = request.query.get("q", "").strip()
+    if not term:
+        raise HTTPError(400, "q is required")
+    limit = limit_param(request.query, services.SEARCH_LIMIT)
+    return {"items": [row._asdict() for row in academy.students.get_many(academy.students.search(term, limit))]}
+
+def get_student(academy, request, student_id):
+    return found(academy.students.get(path_id(student_id, "Student")), "Student")
+
+def list_courses(academy, request):
+    after, limit = page_params(request.query)
+    return page(academy.courses.page(after, limit), limit)
+
+def search_courses(academy, request):
+    term = request.query.get("q", "").strip()
+    if not term:
+        raise HTTPError(400, "q is required")
+    limit = limit_param(request.query, services.SEARCH_LIMIT)
+    return {"items": [row._asdict() for row in academy.courses.get_many(academy.courses.search(term, limit))]}
+
+def get_course(academy, request, course_id):
+    return found(academy.courses.get(path_id(course_id, "Course")), "Course")
+
+def list_enrollments(academy, request):
+    after, limit = page_params(request.query)
+    rows = academy.enrollments.page(after, limit, ids_param(request.query, "student_id"),
+                                    ids_param(request.query, "course_id"))
+    return page(rows, limit)
+
+def get_enrollment(academy, request, enrollment_id):
+    return found(academy.enrollments.get(path_id(enrollment_id, "Enrollment")), "Enrollment")
+
+def list_grades(academy, request):
+    after, limit = page_params(request.query)
+    rows = academy.grades.page(after, limit, ids_param(request.query, "enrollment_id"),
+                               ids_param(request.query, "student_id"), ids_param(request.query, "course_id"))
+    return page(rows, limit)
+
+def get_stats(academy, request):
+    counts, departments = academy.stats()
+    return {"counts": counts, "departments": [{"department": department, "courses": courses, "enrollments": enrollments}
+                                              for department, courses, enrollments in departments]}
+
+def enroll(academy, request):
+    body = json_body(request)
+    student_id = int_param(body, "student_id")
+    course_id = int_param(body, "course_id")
+    student_name = academy.students.full_name(student_id)
+    if student_name is None:
+        raise HTTPError(404, "Student not found")
+    course_name = academy.courses.name(course_id)
+    if course_name is None:
+        raise HTTPError(404, "Course not found")
+    existing = academy.enrollments.find(student_id, course_id)
+    if existing is not None:
+        raise HTTPError(409, "Student is already enrolled in this course", id=existing)
+    enrollment_id = academy.enrollments.enroll(student_id, course_id, bool_param(body, "check_conflicts", True))
+    academy.audit.record(f"Enrolled {student_name} in {course_name} (API)", "enrollments", enrollment_id)
+    return 201, academy.enrollments.get(enrollment_id)._asdict()
+
+def assign_grade(academy, request):
+    body = json_body(request)
+    enrollment = academy.enrollments.get(int_param(body, "enrollment_id"))
+    if enrollment is None:
+        raise HTTPError(404, "Enrollment not found")
+    grade = body.get("grade")
+    if isinstance(grade, bool) or not isinstance(grade, (int, float)):
+        raise HTTPError(400, f"grade must be a number, not {json.dumps(grade)}")
+    grade_date = body.get("grade_date")
+    if grade_date is not None and not isinstance(grade_date, str):
+        raise HTTPError(400, f"grade_date must be a YYYY-MM-DD string, not {json.dumps(grade_date)}")
+    grade_id = academy.grades.assign(enrollment.id, grade, grade_date)
+    grade = next(grade for grade in academy.grades.grades_for(enrollment_id=enrollment.id) if grade.id == grade_id)
+    academy.audit.record(f"Assigned grade {grade.grade} to {academy.students.full_name(enrollment.student_id)} for "
+                         f"{academy.courses.name(enrollment.course_id)} (API)", "grades", grade_id)
+    return 201, grade._asdict()
+
+# (method, path pattern, handler, whether it writes); groups of the pattern
+# are passed to the handler
+ROUTES = [
+    ("GET", "/students", list_students, False),
+    ("GET", "/students/search", search_students, False),
+    ("GET", r"/students/(\d+)", get_student, False),
+    ("GET", "/courses", list_courses, False),
+    ("GET", "/courses/search", search_courses, False),
+    ("GET", r"/courses/(\d+)", get_course, False),
+    ("GET", "/enrollments", list_enrollments, False),
+    ("GET", r"/enrollments/(\d+)", get_enrollment, False),
+    ("GET", "/grades", list_grades, False),
+    ("GET", "/stats", get_stats, False),
+    ("POST", "/enrollments", enroll, True),
+    ("POST", "/grades", assign_grade, True),
+]
+
+class Server:
+    def __init__(self, path=None, readers=READERS):
+        self.path = path
+        self.local = threading.local()
+        self.routes = [(method, re.compile(pattern), handler, writes)
+                       for method, pattern, handler, writes in ROUTES]
+        self.readers = ThreadPoolExecutor(readers, "api-reader", self.open_reader)
+        self.writer = ThreadPoolExecutor(1, "api-writer", self.open_writer)
+    
+    def open_reader(self):
+        conn = database.connect(self.path)
+        # Readers can't write by mistake, every write goes through the writer
+        conn.execute("PRAGMA query_only = ON")
+        self.local.academy = services.AcademyService(conn)
+    
+    def open_writer(self):
+        self.local.academy = services.AcademyService.open(self.path)
+    
+    def run(self, handler, request, args):
+        return handler(self.local.academy, request, *args)
+    
+    def route(self, request):
+        allowed = False
+        for method, pattern, handler, writes in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match:
+                if method == request.method:
+                    return handler, writes, match.groups()
+                allowed = True
+        if allowed:
+            raise HTTPError(405, f"{request.method} is not allowed on {request.path}")
+        raise HTTPError(404, f"No such resource: {request.path}")
+    
+    async def respond(self, request):
+        # The status and JSON payload answering a request
+        try:
+            handler, writes, args = self.route(request)
+            executor = self.writer if writes else self.readers
+            result = await asyncio.get_running_loop().run_in_executor(executor, self.run, handler, request, args)
+        except HTTPError as e:
+            return e.status, dict(error=str(e), **e.details)
+        except services.ScheduleConflict as e:
+            return 409, {"error": str(e), "conflicts": [conflict_dict(conflict) for conflict in e.conflicts]}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            traceback.print_exc()
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        return result if isinstance(result, tuple) else (200, result)
+    
+    async def handle(self, reader, writer):
+        # Answer the requests of one client connection in turn
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # A timer rather than wait_for, which costs a task per request
+                idle = loop.call_later(IDLE_TIMEOUT, writer.close)
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    writer.write(response(e.status, {"error": str(e)}, False))
+                    await writer.drain()
+                    break
+                finally:
+                    idle.cancel()
+                if request is None:
+                    break
+                status, payload = await self.respond(request)
+                writer.write(response(status, payload, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def flush_audit_log(self):
+        while True:
+            await asyncio.sleep(AUDIT_FLUSH_SECONDS)
+            await asyncio.get_running_loop().run_in_executor(self.writer, lambda: self.local.academy.audit.flush())
+    
+    def close_writer(self):
+        self.local.academy.close()
+    
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        # Serve until SIGTERM or until cancelled, e.g. by Ctrl+C, then write
+        # out the audit log. The writer opens first, bringing the schema up to
+        # date before any reader connects. ready(host, port) is called once
+        # the server listens.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.writer, lambda: None)
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_BODY)
+        flusher = asyncio.create_task(self.flush_audit_log())
+        stopped = loop.create_future()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, stopped.set_result, None)
+        except (NotImplementedError, AttributeError):
+            # No signal handlers on Windows
+            pass
+        try:
+            if ready is not None:
+                ready(*server.sockets[0].getsockname()[:2])
+            async with server:
+                await stopped
+        finally:
+            flusher.cancel()
+            await loop.run_in_executor(self.writer, self.close_writer)
+            self.writer.shutdown()
+            self.readers.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the academy records as JSON over HTTP")
+    parser.add_argument("--database", help="database file, instead of the configured one")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--readers", type=int, default=READERS, help="reader threads, each with a connection")
+    args = parser.parse_args(argv)
+    
+    def ready(host, port):
+        print(f"Serving on http://{host}:{port}", flush=True)
+    
+    try:
+        asyncio.run(Server(args.database, args.readers).serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
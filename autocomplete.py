@@ -0,0 +1,85 @@
+import bisect
+import re
+
+# Words of a name, for indexing it from the start of each
+WORD = re.compile(r"\S+")
+
+class PrefixIndex:
+    # Sorted, in-memory index of names by id for type-ahead completion. Every
+    # word of a name is a key, so "love" finds "Ada Lovelace" as well as
+    # "Lovell Smith". Labels carry the id, so rows with the same name stay
+    # distinct and a chosen label resolves straight back to its primary key.
+    def __init__(self, rows=()):
+        self.names = dict(rows)
+        entries = sorted((key, row_id) for row_id, name in self.names.items() for key in self.keys(name))
+        self.sorted_keys = [key for key, row_id in entries]
+        self.sorted_ids = [row_id for key, row_id in entries]
+    
+    def __len__(self):
+        return len(self.names)
+    
+    @staticmethod
+    def keys(name):
+        # The name from the start of each of its words, case-insensitive
+        name = (name or "").casefold()
+        return [name[word.start():] for word in WORD.finditer(name)]
+    
+    @staticmethod
+    def label(row_id, name):
+        return f"{name} (#{row_id})"
+    
+    def add(self, row_id, name):
+        # Add a row, or rename one that is already indexed
+        if row_id in self.names:
+            self.remove(row_id)
+        self.names[row_id] = name
+        for key in self.keys(name):
+            position = bisect.bisect_right(self.sorted_keys, key)
+            self.sorted_keys.insert(position, key)
+            self.sorted_ids.insert(position, row_id)
+    
+    def remove(self, row_id):
+        name = self.names.pop(row_id, None)
+        if name is None:
+            return
+        for key in self.keys(name):
+            start = bisect.bisect_left(self.sorted_keys, key)
+            end = bisect.bisect_right(self.sorted_keys, key, start)
+            position = self.sorted_ids.index(row_id, start, end)
+            del self.sorted_keys[position]
+            del self.sorted_ids[position]
+    
+    def matches(self, prefix, limit):
+        # Ids of up to limit rows with a word starting with prefix, in order
+        # of the matching text
+        prefix = prefix.casefold()
+        ids = []
+        seen = set()
+        position = bisect.bisect_left(self.sorted_keys, prefix)
+        while position < len(self.sorted_keys) and len(ids) < limit:
+            if not self.sorted_keys[position].startswith(prefix):
+                break
+            row_id = self.sorted_ids[position]
+            if row_id not in seen:
+                seen.add(row_id)
+                ids.append(row_id)
+            position += 1
+        return ids
+    
+    def complete(self, text, limit):
+        # Labels for a combobox drop-down. A label that is already complete
+        # keeps matching itself.
+        row_id = self.lookup(text)
+        if row_id is not None:
+            text = self.names[row_id]
+        return [self.label(row_id, self.names[row_id]) for row_id in self.matches(text.strip(), limit)]
+    
+    def lookup(self, label):
+        # The id of a label made by this index, or None
+        label = label.strip()
+        if not label.endswith(")") or " (#" not in label:
+            return None
+        name, _, row_id = label[:-1].rpartition(" (#")
+        if not row_id.isdigit() or self.names.get(int(row_id)) != name:
+            return None
+        return int(row_id)
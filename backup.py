@@ -0,0 +1,265 @@
+import argparse
+import configparser
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import NamedTuple
+import database
+
+# Snapshots of the live database taken with SQLite's online backup API. The
+# copy is made a few pages at a time, releasing the database in between, so
+# the window and other writers carry on while it runs. Snapshots are named
+# after the database and the time they were taken, e.g.
+# backups/academy-20240131-230000.db.gz, and only the newest few are kept.
+#
+#   [backup]
+#   directory = /srv/academy/backups
+#   keep = 14
+#   compress = yes
+
+DEFAULT_DIRECTORY = "backups"
+DEFAULT_KEEP = 10
+
+# Pages copied per step, and the pause between steps in seconds
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+
+# gzip level of compressed snapshots, the fastest: the higher levels save
+# little more on a database at several times the time
+COMPRESS_LEVEL = 1
+
+# Bytes read and written per step when compressing
+COPY_BUFFER = 1 << 20
+
+TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+class Snapshot(NamedTuple):
+    path: str
+    taken: datetime
+    size: int
+    compressed: bool
+
+class Cancelled(Exception):
+    pass
+
+def load_settings():
+    # Defaults, then the [backup] section of the config file. A relative
+    # directory is taken to be next to the database.
+    settings = {"directory": DEFAULT_DIRECTORY, "keep": DEFAULT_KEEP, "compress": False}
+    parser = configparser.ConfigParser()
+    parser.read(os.environ.get("ACADEMY_CONFIG", database.CONFIG_FILE))
+    if parser.has_section("backup"):
+        section = parser["backup"]
+        settings["directory"] = section.get("directory", settings["directory"])
+        settings["keep"] = section.getint("keep", settings["keep"])
+        settings["compress"] = section.getboolean("compress", settings["compress"])
+    return settings
+
+def database_path(conn):
+    # File of the main database of a connection
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+def snapshot_directory(conn, directory=None):
+    directory = directory or load_settings()["directory"]
+    return os.path.join(os.path.dirname(os.path.abspath(database_path(conn))), directory)
+
+def snapshot_pattern(database_file):
+    stem = os.path.splitext(os.path.basename(database_file))[0]
+    return re.compile(rf"{re.escape(stem)}-(\d{{8}}-\d{{6}})(?:-\d+)?\.db(\.gz)?")
+
+def snapshots(conn, directory=None):
+    # The snapshots of a connection's database, oldest first
+    directory = snapshot_directory(conn, directory)
+    if not os.path.isdir(directory):
+        return []
+    pattern = snapshot_pattern(database_path(conn))
+    result = []
+    for name in sorted(os.listdir(directory)):
+        match = pattern.fullmatch(name)
+        if match:
+            path = os.path.join(directory, name)
+            result.append(Snapshot(path, datetime.strptime(match.group(1), TIME_FORMAT), os.path.getsize(path),
+                                   bool(match.group(2))))
+    return result
+
+def copy_database(source, target, progress=None, cancelled=None, pages=BACKUP_PAGES):
+    # Copy one connection's database into another in steps of some pages.
+    # progress(done, total) is called in pages; cancelled() aborts the copy
+    # with Cancelled.
+    def step(status, remaining, total):
+        if cancelled is not None and cancelled():
+            raise Cancelled()
+        if progress is not None:
+            progress(total - remaining, total)
+    
+    # A write from another connection between steps makes SQLite start the
+    # copy over, which under steady writes never finishes. In WAL mode a read
+    # transaction held for the whole copy pins one consistent snapshot
+    # instead, without holding up the writers.
+    wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    if wal and not source.in_transaction:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+    try:
+        source.backup(target, pages=pages, progress=step, sleep=BACKUP_SLEEP)
+    finally:
+        if wal and source.in_transaction:
+            source.rollback()
+
+def backup(conn, directory=None, compress=None, keep=None, progress=None, cancelled=None, pages=BACKUP_PAGES):
+    # Take a snapshot of a connection's database, then delete all but the
+    # newest keep. Returns the snapshot's path, or None if cancelled() became
+    # true; a partial snapshot is never left behind.
+    settings = load_settings()
+    compress = settings["compress"] if compress is None else compress
+    keep = settings["keep"] if keep is None else keep
+    directory = snapshot_directory(conn, directory)
+    os.makedirs(directory, exist_ok=True)
+    
+    stem = os.path.splitext(os.path.basename(database_path(conn)))[0]
+    name = f"{stem}-{datetime.now().strftime(TIME_FORMAT)}"
+    suffix = ".db.gz" if compress else ".db"
+    path = os.path.join(directory, name + suffix)
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(directory, f"{name}-{number}{suffix}")
+    
+    # Written under a temporary name and renamed once complete
+    copy_path = path + ".tmp"
+    try:
+        target = sqlite3.connect(copy_path)
+        try:
+            copy_database(conn, target, progress, cancelled, pages)
+            # A snapshot is one self-contained file
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+        if compress:
+            with open(copy_path, "rb") as source, gzip.open(path + ".gz.tmp", "wb", COMPRESS_LEVEL) as compressed:
+                shutil.copyfileobj(source, compressed, COPY_BUFFER)
+            os.remove(copy_path)
+            copy_path = path + ".gz.tmp"
+        os.replace(copy_path, path)
+    except Cancelled:
+        return None
+    finally:
+        for leftover in (path + ".tmp", path + ".gz.tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    
+    rotate(conn, keep, directory)
+    return path
+
+def rotate(conn, keep, directory=None):
+    # Delete all but the newest keep snapshots (0 keeps them all) and return
+    # the paths deleted
+    old = snapshots(conn, directory)[:-keep] if keep > 0 else []
+    for snapshot in old:
+        os.remove(snapshot.path)
+    return [snapshot.path for snapshot in old]
+
+@contextmanager
+def open_snapshot(path):
+    # A read-only connection to a snapshot, decompressed to a temporary file
+    # first if need be
+    temp_path = None
+    try:
+        if path.endswith(".gz"):
+            handle, temp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+            with os.fdopen(handle, "wb") as target, gzip.open(path, "rb") as source:
+                shutil.copyfileobj(source, target, COPY_BUFFER)
+        conn = sqlite3.connect(f"file:{temp_path or path}?mode=ro", uri=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+def check(conn):
+    # Problems PRAGMA integrity_check finds in a database, none if it is sound
+    rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    return [] if rows == ["ok"] else rows
+
+def verify(path):
+    # Problems found in a snapshot; an unreadable file is one problem
+    try:
+        with open_snapshot(path) as conn:
+            return check(conn)
+    except (sqlite3.DatabaseError, OSError, EOFError) as e:
+        return [f"{os.path.basename(path)} can't be read: {e}"]
+
+def restore(path, conn, progress=None, pages=BACKUP_PAGES, safety_backup=True):
+    # Replace a connection's database with a verified snapshot, taking a
+    # snapshot of the current data first, then bring the restored schema up
+    # to date. Other connections see the restored data from their next
+    # transaction. Returns the path of the safety snapshot, if one was taken.
+    problems = verify(path)
+    if problems:
+        raise ValueError(f"The snapshot failed its integrity check: {problems[0]}")
+    saved = backup(conn, keep=0) if safety_backup else None
+    if conn.in_transaction:
+        conn.commit()
+    with open_snapshot(path) as source:
+        copy_database(source, conn, progress, pages=pages)
+    database.migrate(conn)
+    return saved
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def main(argv=None):
+    # For cron and the like: python backup.py create, list, verify or restore
+    parser = argparse.ArgumentParser(description="Back up and restore the academy database")
+    parser.add_argument("--database", help="database file, instead of the configured one")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="take a snapshot and rotate old ones")
+    create.add_argument("--directory")
+    create.add_argument("--compress", action="store_true", default=None)
+    create.add_argument("--keep", type=int)
+    commands.add_parser("list", help="list the snapshots")
+    verify_command = commands.add_parser("verify", help="check snapshots with PRAGMA integrity_check")
+    verify_command.add_argument("paths", nargs="*", help="snapshots to check, the newest by default")
+    restore_command = commands.add_parser("restore", help="replace the database with a snapshot")
+    restore_command.add_argument("path")
+    args = parser.parse_args(argv)
+    
+    conn = database.connect(args.database)
+    try:
+        if args.command == "create":
+            path = backup(conn, args.directory, args.compress, args.keep)
+            print(path)
+        elif args.command == "list":
+            for snapshot in snapshots(conn):
+                print(f"{snapshot.taken:%Y-%m-%d %H:%M:%S}  {format_size(snapshot.size):>10}  {snapshot.path}")
+        elif args.command == "verify":
+            paths = args.paths or [snapshot.path for snapshot in snapshots(conn)[-1:]]
+            if not paths:
+                print("No snapshots to verify", file=sys.stderr)
+                return 1
+            failed = 0
+            for path in paths:
+                problems = verify(path)
+                print(f"{path}: {'ok' if not problems else problems[0]}")
+                failed += bool(problems)
+            return 1 if failed else 0
+        elif args.command == "restore":
+            saved = restore(args.path, conn)
+            print(f"Restored {args.path}" + (f", previous data saved as {saved}" if saved else ""))
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
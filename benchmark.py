@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+import analytics
+import database
+import exporter
+import generator
+import services
+
+# Times the hot paths of the program against a copy of a database (or a
+# generated one) without a display and writes the results as JSON, so runs
+# of different versions can be compared with --compare.
+
+# Runs of each benchmark; slow ones such as exports run once
+REPEAT = 5
+
+PAGE_SIZE = 100
+
+# Dataset generated when no database is given
+DEFAULT_DATASET = {"students": 5000, "courses": 100, "enrollments_per_student": 5, "grades_per_enrollment": 2}
+
+# A median this much slower than in the compared run is reported as a
+# regression, unless the difference is below the noise floor
+REGRESSION_RATIO = 1.2
+NOISE_MS = 1.0
+
+# The lists of the window: their columns and FROM clause, the same first
+# pages the tabs load, sorted by their key and by one other column
+ENROLLMENT_COLUMNS = "e.id, s.first_name || ' ' || s.last_name, c.name, c.department, e.enrollment_date"
+GRADE_COLUMNS = "g.id, s.first_name || ' ' || s.last_name, c.name, g.grade, g.grade_date"
+LISTS = {
+    "students": "SELECT id, first_name, last_name, email, phone, enrollment_date FROM students",
+    "courses": "SELECT id, code, name, department, credits, instructor FROM courses",
+    "enrollments": f'''
+        SELECT {ENROLLMENT_COLUMNS} FROM enrollments e
+        JOIN students s ON e.student_id = s.id JOIN courses c ON e.course_id = c.id
+    ''',
+    "grades": f'''
+        SELECT {GRADE_COLUMNS} FROM grades g JOIN enrollments e ON g.enrollment_id = e.id
+        JOIN students s ON e.student_id = s.id JOIN courses c ON e.course_id = c.id
+    ''',
+}
+KEYS = {"students": "id", "courses": "id", "enrollments": "e.id", "grades": "g.id"}
+SORTED_LISTS = {
+    "students_by_last_name": ("SELECT id, first_name, last_name, email, phone, enrollment_date FROM students",
+                              "last_name, id"),
+    "enrollments_by_date": (LISTS["enrollments"], "e.enrollment_date, e.id"),
+    "enrollments_by_department": (f'''
+        SELECT {ENROLLMENT_COLUMNS} FROM courses c CROSS JOIN enrollments e ON e.course_id = c.id
+        JOIN students s ON e.student_id = s.id
+    ''', "c.department, c.id, e.id"),
+    "grades_by_grade": (LISTS["grades"], "g.grade, g.id"),
+}
+
+class Context:
+    # The service under test and sample rows picked once from the data
+    def __init__(self, service, seed, work_dir):
+        self.service = service
+        self.conn = service.conn
+        self.work_dir = work_dir
+        rng = random.Random(seed)
+        conn = self.conn
+        self.student_ids = [row[0] for row in conn.execute("SELECT id FROM students")]
+        self.course_ids = [row[0] for row in conn.execute("SELECT id FROM courses")]
+        if not self.student_ids or not self.course_ids:
+            raise ValueError("The database needs students and courses to benchmark")
+        self.student_id = rng.choice(self.student_ids)
+        self.course_id = rng.choice(self.course_ids)
+        self.middle = {table: conn.execute(f"SELECT COALESCE(MAX(id), 0) / 2 FROM {table}").fetchone()[0]
+                       for table in KEYS}
+        self.last_name, self.email = conn.execute("SELECT last_name, email FROM students WHERE id = ?",
+                                                  (self.student_id,)).fetchone()
+        self.course_name = conn.execute("SELECT name FROM courses WHERE id = ?", (self.course_id,)).fetchone()[0]
+        self.enrollment_id = conn.execute("SELECT MIN(id) FROM enrollments WHERE id >= ?",
+                                          (rng.randint(1, max(self.middle["enrollments"] * 2, 1)),)).fetchone()[0]
+        self.rng = rng
+    
+    def unenrolled_pairs(self, count):
+        # (student id, course id) pairs that are not enrolled yet
+        pairs = set()
+        for _ in range(count * 100):
+            if len(pairs) == count:
+                break
+            pair = (self.rng.choice(self.student_ids), self.rng.choice(self.course_ids))
+            if pair not in pairs and self.service.enrollments.find(*pair) is None:
+                pairs.add(pair)
+        return sorted(pairs)
+
+def fetch(conn, query, params=()):
+    return conn.execute(query, params).fetchall()
+
+def list_benchmarks(context):
+    conn = context.conn
+    for table, select in LISTS.items():
+        key = KEYS[table]
+        yield f"load_{table}", lambda select=select, key=key: fetch(
+            conn, f"{select} ORDER BY {key} LIMIT ?", (PAGE_SIZE + 1,))
+        yield f"load_{table}_middle_page", lambda select=select, key=key, table=table: fetch(
+            conn, f"{select} WHERE {key} > ? ORDER BY {key} LIMIT ?", (context.middle[table], PAGE_SIZE + 1))
+    for name, (select, order) in SORTED_LISTS.items():
+        yield f"load_{name}", lambda select=select, order=order: fetch(
+            conn, f"{select} ORDER BY {order} LIMIT ?", (PAGE_SIZE + 1,))
+
+def search_benchmarks(context):
+    students = context.service.students
+    courses = context.service.courses
+    yield "search_students_prefix", lambda: students.search(context.last_name[:2])
+    yield "search_students_name", lambda: students.search(context.last_name)
+    yield "search_students_email", lambda: students.search(context.email)
+    yield "search_students_id", lambda: students.search(str(context.student_id))
+    yield "search_courses_name", lambda: courses.search(context.course_name)
+
+def grade_benchmarks(context):
+    conn = context.conn
+    grades = context.service.grades
+    yield "filter_grades_by_course", lambda: fetch(
+        conn, f"{LISTS['grades']} WHERE c.id = ? ORDER BY g.id LIMIT ?", (context.course_id, PAGE_SIZE + 1))
+    yield "filter_grades_by_student", lambda: fetch(
+        conn, f"{LISTS['grades']} WHERE s.id = ? ORDER BY g.id LIMIT ?", (context.student_id, PAGE_SIZE + 1))
+    yield "grades_for_course", lambda: grades.grades_for(course_id=context.course_id)
+    yield "course_roster", lambda: grades.roster(context.course_id)
+    yield "student_stats", lambda: grades.student_stats(context.student_ids[:1000])
+    yield "course_stats", lambda: grades.course_stats(context.course_ids)
+    yield "student_enrollments", lambda: context.service.students.enrollments(context.student_id)
+
+def dashboard_benchmarks(context):
+    yield "dashboard_counts", context.service.stats
+    yield "recount_stats", lambda: database.recount_stats(context.conn.cursor())
+    yield "schedule_conflicts", context.service.schedule.conflicts, 1
+    if analytics.available():
+        yield "analytics_summary", lambda: analytics.summary(context.conn, top_students=100)
+
+def write_benchmarks(context, repeat):
+    # Each run enrolls pairs that were not enrolled before, the batch runs once
+    enrollments = context.service.enrollments
+    single = iter(context.unenrolled_pairs(repeat))
+    yield "enroll_student", lambda: [enrollments.enroll(*next(single))]
+    batch = context.unenrolled_pairs(1000)
+    yield "enroll_batch_1000", lambda: enrollments.enroll_many(batch), 1
+    yield "assign_grade", lambda: [context.service.grades.assign(context.enrollment_id, 80)]
+
+def export_benchmarks(context):
+    for table in exporter.EXPORTS:
+        path = os.path.join(context.work_dir, f"{table}.csv")
+        yield f"export_{table}", lambda table=table, path=path: exporter.export_csv(context.conn, table, path), 1
+
+def measure(function, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append((time.perf_counter() - start) * 1000)
+    if isinstance(result, int):
+        rows = result
+    elif result is not None and hasattr(result, "__len__"):
+        rows = len(result)
+    else:
+        rows = None
+    return {
+        "runs": repeat,
+        "rows": rows,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+
+def run(conn, repeat=REPEAT, seed=0, only=None, work_dir=None, progress=None):
+    # Run the benchmarks on a connection to a migrated database. Write
+    # benchmarks change the data, so pass a copy. Returns {name: timings}.
+    service = services.AcademyService(conn)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        context = Context(service, seed, work_dir or temp_dir)
+        groups = [list_benchmarks(context), search_benchmarks(context), grade_benchmarks(context),
+                  dashboard_benchmarks(context), write_benchmarks(context, repeat), export_benchmarks(context)]
+        results = {}
+        for group in groups:
+            for name, function, *runs in group:
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                results[name] = measure(function, runs[0] if runs else repeat)
+                if progress is not None:
+                    progress(name, results[name])
+    return results
+
+def dataset(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in database.COUNTED_TABLES}
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    # (name, baseline median, new median, new / baseline) of the benchmarks
+    # in both runs, and the names of those that got slower
+    rows = []
+    regressions = []
+    for name, timings in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["median_ms"]
+        new = timings["median_ms"]
+        rows.append((name, old, new, new / old if old else None))
+        if new > old * ratio and new - old > NOISE_MS:
+            regressions.append(name)
+    return rows, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the academy database without the window")
+    parser.add_argument("--database", help="database to benchmark a copy of; one is generated if not given")
+    parser.add_argument("--students", type=int, default=DEFAULT_DATASET["students"])
+    parser.add_argument("--courses", type=int, default=DEFAULT_DATASET["courses"])
+    parser.add_argument("--enrollments", type=int, default=DEFAULT_DATASET["enrollments_per_student"],
+                        help="courses per student, on average")
+    parser.add_argument("--grades", type=int, default=DEFAULT_DATASET["grades_per_enrollment"],
+                        help="grades per enrollment, on average")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--only", action="append", help="run the benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the JSON results to this file instead of printing them")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "benchmark.db")
+        report = {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        }
+        conn = database.connect(path)
+        try:
+            if args.database:
+                # Work on a copy, the write benchmarks change the data
+                source = sqlite3.connect(args.database)
+                source.backup(conn)
+                source.close()
+                report["database"] = os.path.abspath(args.database)
+                database.migrate(conn)
+            else:
+                database.migrate(conn)
+                report["generator"] = {"students": args.students, "courses": args.courses,
+                                       "enrollments_per_student": args.enrollments,
+                                       "grades_per_enrollment": args.grades, "seed": args.seed}
+                start = time.perf_counter()
+                generator.generate(conn, args.students, args.courses, args.enrollments, args.grades, args.seed)
+                report["generate_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            report["schema_version"] = database.schema_version(conn)
+            report["dataset"] = dataset(conn)
+            
+            def progress(name, timings):
+                print(f"{name:36} {timings['median_ms']:10.3f} ms", file=sys.stderr)
+            
+            report["results"] = run(conn, args.repeat, args.seed, args.only, work_dir, progress)
+        finally:
+            conn.close()
+    
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        rows, regressions = compare(report["results"], baseline.get("results", {}))
+        for name, old, new, change in rows:
+            change = f"{change:6.2f}x" if change is not None else "      "
+            print(f"{name:36} {old:10.3f} -> {new:10.3f} ms {change}{'  SLOWER' if name in regressions else ''}",
+                  file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} benchmarks got slower: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+import database
+
+# Batch jobs and reports without the window, for cron on a server without a
+# display. Never imports tkinter; each command imports only the modules it
+# needs, so starting up costs little more than the interpreter.
+#
+#   python cli.py import students new_students.csv
+#   python cli.py export grades grades.csv
+#   python cli.py enroll-batch --course 12 --course 13 --cohort 4
+#   python cli.py recompute-stats
+#   python cli.py backup --compress
+#   python cli.py vacuum
+#   python cli.py report --format json --output report.json
+
+TABLES = ["students", "courses", "enrollments", "grades"]
+
+# Rejected rows printed after an import; the rest are only counted
+ERRORS_SHOWN = 20
+
+# Students listed in the report by default
+TOP_STUDENTS = 10
+
+def show_progress(text):
+    # Progress on a terminal only, so cron mails stay short
+    if sys.stderr.isatty():
+        print(f"\r{text}", end="", file=sys.stderr, flush=True)
+
+def end_progress():
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+
+def log(conn, message, entity=None):
+    # Record a change in the audit log, like the window does
+    import services
+    audit = services.AuditLog(conn)
+    audit.record(message + " (command line)", entity)
+    audit.flush()
+
+def import_command(conn, args):
+    import importer
+    result = importer.import_csv(conn, args.table, args.file, strict=args.strict,
+                                 progress=lambda done: show_progress(f"{done} rows read"))
+    end_progress()
+    print(f"{args.table.title()} import: {result.summary()}")
+    for line, message in result.errors[:ERRORS_SHOWN]:
+        print(f"  line {line}: {message}")
+    if result.error_count > ERRORS_SHOWN:
+        print(f"  and {result.error_count - ERRORS_SHOWN} more")
+    if result.inserted:
+        log(conn, f"Imported {args.table}: {result.summary()}", args.table)
+    return 1 if result.error_count else 0
+
+def export_command(conn, args):
+    import exporter
+    written = exporter.export_csv(conn, args.table, args.file,
+                                  progress=lambda done, total: show_progress(f"{done} of {total} rows written"))
+    end_progress()
+    print(f"{written} {args.table} written to {args.file}")
+    return 0
+
+def enroll_batch_command(conn, args):
+    import services
+    if args.students is None and args.cohort is None and args.from_course is None:
+        raise ValueError("Give the students with --students, --cohort or --from-course")
+    student_ids = [int(part) for part in args.students.split(",")] if args.students else None
+    new_ids, already = services.EnrollmentRepository(conn).enroll_group(args.course, student_ids, args.cohort,
+                                                                         args.from_course)
+    print(f"{len(new_ids)} new enrollments, {already} already enrolled")
+    if new_ids:
+        log(conn, f"Batch enrolled students in {len(set(args.course))} courses: {len(new_ids)} new enrollments",
+            "enrollments")
+    return 0
+
+def recompute_stats_command(conn, args):
+    # Rebuild the dashboard counters and grade totals from the tables and
+    # list the counters that had drifted
+    with database.transaction(conn) as cursor:
+        mismatches = database.recount_stats(cursor)
+        database.rebuild_grade_stats(cursor)
+    if not mismatches:
+        print("All counters are correct")
+        return 0
+    for name, (stored, actual) in sorted(mismatches.items()):
+        print(f"{name}: {stored} -> {actual}")
+    log(conn, f"Repaired {len(mismatches)} dashboard counters")
+    return 0
+
+def backup_command(conn, args):
+    import backup
+    path = backup.backup(conn, args.directory, args.compress, args.keep,
+                         progress=lambda done, total: show_progress(f"{done} of {total} pages copied"))
+    end_progress()
+    print(path)
+    log(conn, f"Backed up the database to {os.path.basename(path)}")
+    return 0
+
+def file_size(path):
+    # The database with its WAL file, if any
+    return sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name))
+
+def vacuum_command(conn, args):
+    # Rewrite the database without free pages, then let SQLite refresh the
+    # statistics its query planner uses
+    import backup
+    path = backup.database_path(conn)
+    before = file_size(path)
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+    after = file_size(path)
+    print(f"{backup.format_size(before)} -> {backup.format_size(after)}")
+    return 0
+
+def build_report(conn, top):
+    # The dashboard counts, the departments, each course's grades and the
+    # students with the best GPA, from the totals the triggers keep
+    import services
+    academy = services.AcademyService(conn)
+    counts, departments = academy.stats()
+    course_stats = academy.grades.course_stats([course.id for course in academy.courses.page(limit=-1)])
+    courses = {course.id: course for course in academy.courses.get_many(stats.course_id for stats in course_stats)}
+    top_students = academy.grades.top_students(top)
+    students = {student.id: student
+                for student in academy.students.get_many(stats.student_id for stats in top_students)}
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "counts": {table: counts.get(table, 0) for table in TABLES},
+        "departments": [{"department": department, "courses": course_count, "enrollments": enrollments}
+                        for department, course_count, enrollments in departments],
+        "courses": sorted(({"course_id": stats.course_id, "code": courses[stats.course_id].code,
+                            "name": courses[stats.course_id].name, "grades": stats.grades,
+                            "mean": round(stats.mean, 2), "stddev": round(stats.stddev, 2),
+                            "min": stats.minimum, "max": stats.maximum}
+                           for stats in course_stats), key=lambda course: course["code"]),
+        "top_students": [{"student_id": stats.student_id, "name": students[stats.student_id].full_name,
+                          "gpa": round(stats.gpa, 2), "average": round(stats.average, 2), "credits": stats.credits}
+                         for stats in top_students],
+    }
+
+def report_text(report):
+    counts = report["counts"]
+    lines = [f"Academy report, {report['generated'].replace('T', ' ')}",
+             ", ".join(f"{counts[table]} {table}" for table in TABLES), "",
+             f"{'Department':30} {'Courses':>8} {'Enrollments':>12}"]
+    for row in report["departments"]:
+        lines.append(f"{(row['department'] or '(none)')[:30]:30} {row['courses']:8} {row['enrollments']:12}")
+    lines += ["", f"{'Course':40} {'Grades':>7} {'Mean':>6} {'Std dev':>8} {'Min':>6} {'Max':>6}"]
+    for row in report["courses"]:
+        label = f"{row['code']} - {row['name']}"[:40]
+        lines.append(f"{label:40} {row['grades']:7} {row['mean']:6.1f} {row['stddev']:8.1f} {row['min']:6.1f} "
+                     f"{row['max']:6.1f}")
+    lines += ["", f"{'Top students':40} {'GPA':>5} {'Average':>8} {'Credits':>8}"]
+    for row in report["top_students"]:
+        lines.append(f"{row['name'][:40]:40} {row['gpa']:5.2f} {row['average']:8.1f} {row['credits']:8g}")
+    return "\n".join(lines)
+
+def report_command(conn, args):
+    report = build_report(conn, args.top)
+    if args.format == "json":
+        import json
+        text = json.dumps(report, indent=2)
+    else:
+        text = report_text(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Academy batch jobs and reports, without the window")
+    parser.add_argument("--database", help="database file, instead of the configured one")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    
+    command = commands.add_parser("import", help="import rows from a CSV file")
+    command.add_argument("table", choices=TABLES)
+    command.add_argument("file")
+    command.add_argument("--strict", action="store_true", help="import nothing if any row is rejected")
+    command.set_defaults(run=import_command)
+    
+    command = commands.add_parser("export", help="export a table to a CSV file")
+    command.add_argument("table", choices=TABLES)
+    command.add_argument("file")
+    command.set_defaults(run=export_command)
+    
+    command = commands.add_parser("enroll-batch", help="enroll a group of students in courses")
+    command.add_argument("--course", type=int, action="append", required=True, help="course id, repeat for several")
+    command.add_argument("--students", help="comma separated student ids")
+    command.add_argument("--cohort", type=int, help="the students of a saved cohort")
+    command.add_argument("--from-course", type=int, help="the students taking another course")
+    command.set_defaults(run=enroll_batch_command)
+    
+    command = commands.add_parser("recompute-stats", help="rebuild the dashboard counters and grade totals")
+    command.set_defaults(run=recompute_stats_command)
+    
+    command = commands.add_parser("backup", help="take a snapshot of the database, see backup.py")
+    command.add_argument("--directory")
+    command.add_argument("--compress", action="store_true", default=None)
+    command.add_argument("--keep", type=int)
+    command.set_defaults(run=backup_command)
+    
+    command = commands.add_parser("vacuum", help="compact the database and refresh the planner statistics")
+    command.set_defaults(run=vacuum_command)
+    
+    command = commands.add_parser("report", help="counts, departments, course grades and the top students")
+    command.add_argument("--format", choices=["text", "json"], default="text")
+    command.add_argument("--top", type=int, default=TOP_STUDENTS, help="students listed")
+    command.add_argument("--output", help="write the report to this file instead of printing it")
+    command.set_defaults(run=report_command)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = database.connect(args.database)
+    try:
+        database.migrate(conn)
+        return args.run(conn, args)
+    except (ValueError, OSError, database.sqlite3.Error) as e:
+        end_progress()
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,918 @@
+import sqlite3
+import configparser
+import os
+import re
+from contextlib import contextmanager
+import diagnostics
+import schedule
+
+# Connection settings. The database path and profile come from academy.ini
+# (or the file named by ACADEMY_CONFIG) and can be overridden with the
+# ACADEMY_DB and ACADEMY_DB_PROFILE environment variables, e.g.
+#
+#   [database]
+#   path = /srv/academy/academy.db
+#   profile = performance
+#   cache_size = -131072
+DEFAULT_PATH = "academy.db"
+CONFIG_FILE = "academy.ini"
+DEFAULT_PROFILE = "performance"
+
+PROFILES = {
+    # WAL journal so readers never block the writer, and commits only fsync
+    # at checkpoints instead of on every click
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+        "busy_timeout": 5000,
+    },
+    # Rollback journal with full syncing, for network drives where WAL is unsafe
+    "compatible": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "foreign_keys": "ON",
+        "busy_timeout": 5000,
+    },
+}
+
+def load_settings():
+    # Defaults, then the config file, then the environment
+    settings = {"path": DEFAULT_PATH, "profile": DEFAULT_PROFILE, "diagnostics": True,
+                "slow_query_ms": diagnostics.DEFAULT_SLOW_QUERY_MS}
+    overrides = {}
+    
+    parser = configparser.ConfigParser()
+    parser.read(os.environ.get("ACADEMY_CONFIG", CONFIG_FILE))
+    if parser.has_section("diagnostics"):
+        section = parser["diagnostics"]
+        settings["diagnostics"] = section.getboolean("enabled", settings["diagnostics"])
+        settings["slow_query_ms"] = section.getfloat("slow_query_ms", settings["slow_query_ms"])
+    if parser.has_section("database"):
+        section = parser["database"]
+        settings["path"] = section.get("path", settings["path"])
+        settings["profile"] = section.get("profile", settings["profile"])
+        for name in PROFILES[DEFAULT_PROFILE]:
+            if name in section:
+                overrides[name] = section[name]
+    
+    settings["path"] = os.environ.get("ACADEMY_DB", settings["path"])
+    settings["profile"] = os.environ.get("ACADEMY_DB_PROFILE", settings["profile"])
+    
+    if settings["profile"] not in PROFILES:
+        raise ValueError(f"Unknown database profile: {settings['profile']}")
+    settings["pragmas"] = dict(PROFILES[settings["profile"]], **overrides)
+    return settings
+
+def apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        # Values end up in the SQL text, so only allow plain words and numbers
+        if name not in PROFILES[DEFAULT_PROFILE] or not re.fullmatch(r"-?\w+", str(value)):
+            raise ValueError(f"Invalid database setting: {name} = {value}")
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def connect(path=None, profile=None):
+    # Open the configured database with the tuned connection profile
+    settings = load_settings()
+    pragmas = PROFILES[profile] if profile else settings["pragmas"]
+    if settings["diagnostics"]:
+        # Queries of every connection are timed by shape, see diagnostics.py
+        diagnostics.recorder.slow_seconds = settings["slow_query_ms"] / 1000
+        conn = sqlite3.connect(path or settings["path"], factory=diagnostics.InstrumentedConnection)
+    else:
+        conn = sqlite3.connect(path or settings["path"])
+    apply_pragmas(conn, pragmas)
+    return conn
+
+@contextmanager
+def transaction(conn):
+    # Run a block of writes as one transaction, taking the write lock up front
+    # so checks made inside it stay valid until the commit. An explicit BEGIN
+    # also keeps DDL such as dropped triggers inside the transaction.
+    if conn.in_transaction:
+        conn.commit()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+# Schema migrations, applied in order. The position of a migration in this
+# list is its version number, stored in PRAGMA user_version once it has run.
+# To change the schema add a new function to the end of MIGRATIONS, never
+# edit one that has already shipped.
+
+def create_base_tables(cursor):
+    # Create students table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            phone TEXT,
+            dob TEXT,
+            address TEXT,
+            enrollment_date TEXT DEFAULT CURRENT_DATE
+        )
+    ''')
+    
+    # Create courses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            department TEXT,
+            credits INTEGER DEFAULT 3,
+            instructor TEXT,
+            schedule TEXT,
+            room TEXT
+        )
+    ''')
+    
+    # Create enrollments table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enrollments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            enrollment_date TEXT DEFAULT CURRENT_DATE,
+            FOREIGN KEY (student_id) REFERENCES students (id),
+            FOREIGN KEY (course_id) REFERENCES courses (id)
+        )
+    ''')
+    
+    # Create grades table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            enrollment_id INTEGER NOT NULL,
+            grade REAL,
+            grade_date TEXT,
+            FOREIGN KEY (enrollment_id) REFERENCES enrollments (id)
+        )
+    ''')
+
+# Searchable columns of each table with a trigram FTS5 index
+SEARCH_COLUMNS = {
+    "students": ["first_name", "last_name", "email", "phone"],
+    "courses": ["code", "name", "department", "instructor"],
+}
+
+def create_search_index(cursor, table, columns):
+    # Trigram FTS5 index over the searchable columns, kept in sync by triggers
+    fts_table = f"{table}_fts"
+    column_list = ", ".join(columns)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+            {column_list}, content='{table}', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    create_search_triggers(cursor, table)
+    
+    # Index rows that were added before the search index existed
+    cursor.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
+def create_search_triggers(cursor, table):
+    fts_table = f"{table}_fts"
+    columns = SEARCH_COLUMNS[table]
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+
+def create_search_indexes(cursor):
+    for table, columns in SEARCH_COLUMNS.items():
+        create_search_index(cursor, table, columns)
+
+def create_lookup_indexes(cursor):
+    # Merge duplicate enrollments into the oldest one so that the pair can be
+    # made unique, moving their grades across
+    cursor.execute('''
+        UPDATE grades SET enrollment_id = (
+            SELECT MIN(d.id) FROM enrollments e
+            JOIN enrollments d ON d.student_id = e.student_id AND d.course_id = e.course_id
+            WHERE e.id = grades.enrollment_id
+        )
+        WHERE enrollment_id IN (SELECT id FROM enrollments)
+    ''')
+    cursor.execute('''
+        DELETE FROM enrollments
+        WHERE id NOT IN (SELECT MIN(id) FROM enrollments GROUP BY student_id, course_id)
+    ''')
+    
+    # One enrollment per student and course; also serves WHERE student_id=?
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_enrollments_student_course
+        ON enrollments (student_id, course_id)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_enrollments_course ON enrollments (course_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_enrollment ON grades (enrollment_id)")
+    
+    # Name lookups from the comboboxes and grade filters
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_students_full_name
+        ON students (first_name || ' ' || last_name)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_name ON courses (name)")
+
+# Tables whose row counts are kept in the stats table
+COUNTED_TABLES = ["students", "courses", "enrollments", "grades"]
+
+def create_stats_tables(cursor):
+    # Row counts maintained by triggers, so the dashboard doesn't need COUNT(*)
+    # scans. recount_stats repairs them if they ever drift.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS department_stats (
+            department TEXT PRIMARY KEY,
+            courses INTEGER NOT NULL DEFAULT 0,
+            enrollments INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    create_stats_triggers(cursor)
+    recount_stats(cursor)
+
+def create_stats_triggers(cursor):
+    for table in COUNTED_TABLES:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table} BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = '{table}';
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table} BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = '{table}';
+            END
+        ''')
+    
+    # Courses and enrollments per department
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_department_insert AFTER INSERT ON courses BEGIN
+            INSERT INTO department_stats (department, courses) VALUES (COALESCE(new.department, ''), 1)
+            ON CONFLICT (department) DO UPDATE SET courses = courses + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_department_delete AFTER DELETE ON courses BEGIN
+            UPDATE department_stats SET courses = courses - 1 WHERE department = COALESCE(old.department, '');
+            DELETE FROM department_stats
+            WHERE department = COALESCE(old.department, '') AND courses = 0 AND enrollments = 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_department_update AFTER UPDATE OF department ON courses
+        WHEN COALESCE(old.department, '') <> COALESCE(new.department, '') BEGIN
+            UPDATE department_stats
+            SET courses = courses - 1,
+                enrollments = enrollments - (SELECT COUNT(*) FROM enrollments WHERE course_id = old.id)
+            WHERE department = COALESCE(old.department, '');
+            DELETE FROM department_stats
+            WHERE department = COALESCE(old.department, '') AND courses = 0 AND enrollments = 0;
+            INSERT INTO department_stats (department, courses, enrollments)
+            VALUES (COALESCE(new.department, ''), 1, (SELECT COUNT(*) FROM enrollments WHERE course_id = new.id))
+            ON CONFLICT (department) DO UPDATE SET courses = courses + 1, enrollments = enrollments + excluded.enrollments;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS enrollments_department_insert AFTER INSERT ON enrollments BEGIN
+            UPDATE department_stats SET enrollments = enrollments + 1
+            WHERE department = (SELECT COALESCE(department, '') FROM courses WHERE id = new.course_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS enrollments_department_delete AFTER DELETE ON enrollments BEGIN
+            UPDATE department_stats SET enrollments = enrollments - 1
+            WHERE department = (SELECT COALESCE(department, '') FROM courses WHERE id = old.course_id);
+        END
+    ''')
+
+def create_cohort_tables(cursor):
+    # Named groups of students that can be enrolled together
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cohorts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cohort_members (
+            cohort_id INTEGER NOT NULL REFERENCES cohorts (id) ON DELETE CASCADE,
+            student_id INTEGER NOT NULL REFERENCES students (id) ON DELETE CASCADE,
+            PRIMARY KEY (cohort_id, student_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cohort_members_student ON cohort_members (student_id)")
+
+# Lower bound of each letter band on the 0-100 scale and its grade points
+GRADE_BANDS = [(90, 4.0), (80, 3.0), (70, 2.0), (60, 1.0), (0, 0.0)]
+
+def grade_points_sql(grade):
+    # SQL expression for the grade points of a 0-100 grade
+    bands = " ".join(f"WHEN {grade} >= {bound} THEN {points}" for bound, points in GRADE_BANDS)
+    return f"CASE {bands} ELSE 0.0 END"
+
+def create_grade_stats_tables(cursor):
+    # Running totals of the grades per student (weighted by course credits,
+    # for the GPA) and per course, maintained by triggers so transcripts and
+    # course summaries don't aggregate the grades table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS student_grade_stats (
+            student_id INTEGER PRIMARY KEY,
+            grades INTEGER NOT NULL DEFAULT 0,
+            credits REAL NOT NULL DEFAULT 0,
+            weighted_sum REAL NOT NULL DEFAULT 0,
+            weighted_points REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS course_grade_stats (
+            course_id INTEGER PRIMARY KEY,
+            grades INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            total_squares REAL NOT NULL DEFAULT 0,
+            minimum REAL,
+            maximum REAL
+        )
+    ''')
+    create_grade_stats_triggers(cursor)
+    rebuild_grade_stats(cursor)
+
+def add_grade_sql(row):
+    # Statements adding the grade in trigger row "new" or "old" to the totals
+    points = grade_points_sql(f"{row}.grade")
+    return f'''
+        INSERT INTO student_grade_stats (student_id, grades, credits, weighted_sum, weighted_points)
+        SELECT e.student_id, 1, COALESCE(c.credits, 0), COALESCE(c.credits, 0) * {row}.grade,
+               COALESCE(c.credits, 0) * {points}
+        FROM enrollments e JOIN courses c ON c.id = e.course_id
+        WHERE e.id = {row}.enrollment_id AND {row}.grade IS NOT NULL
+        ON CONFLICT (student_id) DO UPDATE SET
+            grades = grades + 1,
+            credits = credits + excluded.credits,
+            weighted_sum = weighted_sum + excluded.weighted_sum,
+            weighted_points = weighted_points + excluded.weighted_points;
+        INSERT INTO course_grade_stats (course_id, grades, total, total_squares, minimum, maximum)
+        SELECT course_id, 1, {row}.grade, {row}.grade * {row}.grade, {row}.grade, {row}.grade
+        FROM enrollments
+        WHERE id = {row}.enrollment_id AND {row}.grade IS NOT NULL
+        ON CONFLICT (course_id) DO UPDATE SET
+            grades = grades + 1,
+            total = total + excluded.total,
+            total_squares = total_squares + excluded.total_squares,
+            minimum = MIN(COALESCE(minimum, excluded.minimum), excluded.minimum),
+            maximum = MAX(COALESCE(maximum, excluded.maximum), excluded.maximum);
+    '''
+
+def remove_grade_sql(row):
+    # Statements taking the grade in trigger row "new" or "old" off the totals.
+    # The minimum and maximum of a course are only looked up again when the
+    # grade removed was one of them.
+    points = grade_points_sql(f"{row}.grade")
+    return f'''
+        UPDATE student_grade_stats SET
+            grades = student_grade_stats.grades - 1,
+            credits = student_grade_stats.credits - w.credits,
+            weighted_sum = student_grade_stats.weighted_sum - w.credits * {row}.grade,
+            weighted_points = student_grade_stats.weighted_points - w.credits * {points}
+        FROM (
+            SELECT e.student_id, COALESCE(c.credits, 0) AS credits
+            FROM enrollments e JOIN courses c ON c.id = e.course_id
+            WHERE e.id = {row}.enrollment_id AND {row}.grade IS NOT NULL
+        ) AS w
+        WHERE student_grade_stats.student_id = w.student_id;
+        DELETE FROM student_grade_stats
+        WHERE grades <= 0 AND student_id = (SELECT student_id FROM enrollments WHERE id = {row}.enrollment_id);
+        UPDATE course_grade_stats SET
+            grades = grades - 1,
+            total = total - {row}.grade,
+            total_squares = total_squares - {row}.grade * {row}.grade
+        WHERE course_id = (SELECT course_id FROM enrollments WHERE id = {row}.enrollment_id)
+          AND {row}.grade IS NOT NULL;
+        UPDATE course_grade_stats SET
+            minimum = (SELECT MIN(g.grade) FROM enrollments e JOIN grades g ON g.enrollment_id = e.id
+                       WHERE e.course_id = course_grade_stats.course_id),
+            maximum = (SELECT MAX(g.grade) FROM enrollments e JOIN grades g ON g.enrollment_id = e.id
+                       WHERE e.course_id = course_grade_stats.course_id)
+        WHERE course_id = (SELECT course_id FROM enrollments WHERE id = {row}.enrollment_id)
+          AND ({row}.grade <= minimum OR {row}.grade >= maximum);
+        DELETE FROM course_grade_stats
+        WHERE grades <= 0 AND course_id = (SELECT course_id FROM enrollments WHERE id = {row}.enrollment_id);
+    '''
+
+def create_grade_stats_triggers(cursor):
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS grades_summary_insert AFTER INSERT ON grades BEGIN
+            {add_grade_sql("new")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS grades_summary_delete AFTER DELETE ON grades BEGIN
+            {remove_grade_sql("old")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS grades_summary_update AFTER UPDATE OF grade, enrollment_id ON grades BEGIN
+            {remove_grade_sql("old")}
+            {add_grade_sql("new")}
+        END
+    ''')
+    
+    # Changing the credits of a course reweighs every grade in it
+    points = grade_points_sql("g.grade")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS courses_credits_update AFTER UPDATE OF credits ON courses
+        WHEN COALESCE(old.credits, 0) <> COALESCE(new.credits, 0) BEGIN
+            UPDATE student_grade_stats SET
+                credits = student_grade_stats.credits + d.grades * (COALESCE(new.credits, 0) - COALESCE(old.credits, 0)),
+                weighted_sum = student_grade_stats.weighted_sum + d.total * (COALESCE(new.credits, 0) - COALESCE(old.credits, 0)),
+                weighted_points = student_grade_stats.weighted_points + d.points * (COALESCE(new.credits, 0) - COALESCE(old.credits, 0))
+            FROM (
+                SELECT e.student_id, COUNT(*) AS grades, SUM(g.grade) AS total, SUM({points}) AS points
+                FROM enrollments e JOIN grades g ON g.enrollment_id = e.id
+                WHERE e.course_id = new.id AND g.grade IS NOT NULL
+                GROUP BY e.student_id
+            ) AS d
+            WHERE student_grade_stats.student_id = d.student_id;
+        END
+    ''')
+
+def create_cascade_triggers(cursor):
+    # Deleting a student or course takes its enrollments with it, and an
+    # enrollment its grades. The foreign keys cascade too, but only after the
+    # parent row is gone, too late for the delete triggers above that look up
+    # the enrollment and course of a grade, so these go first.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_cascade_delete BEFORE DELETE ON students BEGIN
+            DELETE FROM enrollments WHERE student_id = old.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_cascade_delete BEFORE DELETE ON courses BEGIN
+            DELETE FROM enrollments WHERE course_id = old.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS enrollments_cascade_delete BEFORE DELETE ON enrollments BEGIN
+            DELETE FROM grades WHERE enrollment_id = old.id;
+        END
+    ''')
+
+def add_delete_cascades(cursor):
+    # SQLite can't alter a foreign key, so enrollments and grades are copied
+    # into new tables declared with ON DELETE CASCADE. migrate runs this with
+    # foreign key enforcement off, as the tables are briefly missing.
+    delete_orphans(cursor)
+    
+    # Renaming a table fails while any trigger names a missing one, so all but
+    # the search index triggers are dropped and made again at the end
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name NOT LIKE '%fts%'")
+    for (trigger,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER {trigger}")
+    cursor.execute("SELECT name, seq FROM sqlite_sequence WHERE name IN ('enrollments', 'grades')")
+    sequences = cursor.fetchall()
+    
+    cursor.execute('''
+        CREATE TABLE enrollments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            enrollment_date TEXT DEFAULT CURRENT_DATE,
+            FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE grades_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            enrollment_id INTEGER NOT NULL,
+            grade REAL,
+            grade_date TEXT,
+            FOREIGN KEY (enrollment_id) REFERENCES enrollments (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO enrollments_new (id, student_id, course_id, enrollment_date)
+        SELECT id, student_id, course_id, enrollment_date FROM enrollments
+    ''')
+    cursor.execute('''
+        INSERT INTO grades_new (id, enrollment_id, grade, grade_date)
+        SELECT id, enrollment_id, grade, grade_date FROM grades
+    ''')
+    cursor.execute("DROP TABLE grades")
+    cursor.execute("DROP TABLE enrollments")
+    cursor.execute("ALTER TABLE enrollments_new RENAME TO enrollments")
+    cursor.execute("ALTER TABLE grades_new RENAME TO grades")
+    
+    # Ids of deleted rows at the end of a table are still not reused
+    for name, seq in sequences:
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (name,))
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, seq))
+    
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_enrollments_student_course
+        ON enrollments (student_id, course_id)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_enrollments_course ON enrollments (course_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_enrollment ON grades (enrollment_id)")
+    create_stats_triggers(cursor)
+    create_grade_stats_triggers(cursor)
+    create_cascade_triggers(cursor)
+
+def create_audit_log(cursor):
+    # Persistent record of the changes made, looked up by the entity changed
+    # or by time. Local "YYYY-MM-DD HH:MM:SS" times sort as text.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY,
+            logged_at TEXT NOT NULL,
+            entity TEXT,
+            entity_id INTEGER,
+            message TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_time ON audit_log (logged_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log (entity, entity_id, logged_at)")
+
+def create_sort_indexes(cursor):
+    # Indexes on the columns the lists can be sorted and filtered by, so that
+    # each page of a sorted list is read in order from an index instead of
+    # sorting the whole table. Names sort with the lookup indexes above.
+    for table, column in (
+        ("students", "first_name"),
+        ("students", "last_name"),
+        ("students", "phone"),
+        ("students", "enrollment_date"),
+        ("courses", "department"),
+        ("courses", "credits"),
+        ("courses", "instructor"),
+        ("enrollments", "enrollment_date"),
+        ("grades", "grade"),
+        ("grades", "grade_date"),
+    ):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+def create_schedule_tables(cursor):
+    # Weekly meeting slots of each course, parsed from courses.schedule (see
+    # schedule.py). The course's room and instructor are copied onto its
+    # slots, so that the bookings of a room or instructor around a time are
+    # one index range.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS course_slots (
+            course_id INTEGER NOT NULL REFERENCES courses (id) ON DELETE CASCADE,
+            day INTEGER NOT NULL,
+            start_minute INTEGER NOT NULL,
+            end_minute INTEGER NOT NULL,
+            room TEXT COLLATE NOCASE,
+            instructor TEXT COLLATE NOCASE
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_course_slots_course ON course_slots (course_id, day, start_minute)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_course_slots_room ON course_slots (room, day, start_minute)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_course_slots_instructor ON course_slots (instructor, day, start_minute)")
+    # Finds the longest slot, which bounds how far back an overlap can start
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_course_slots_length ON course_slots (end_minute - start_minute)")
+    create_schedule_triggers(cursor)
+    index_schedules(cursor)
+
+def create_schedule_triggers(cursor):
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_slots_update AFTER UPDATE OF room, instructor ON courses BEGIN
+            UPDATE course_slots SET room = NULLIF(TRIM(new.room), ''), instructor = NULLIF(TRIM(new.instructor), '')
+            WHERE course_id = new.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS courses_slots_delete AFTER DELETE ON courses BEGIN
+            DELETE FROM course_slots WHERE course_id = old.id;
+        END
+    ''')
+
+def index_schedules(cursor, condition="1", params=()):
+    # Parse the schedules of the courses matching a condition into
+    # course_slots. Schedules that can't be read get no slots; returns the
+    # ids of those courses.
+    cursor.execute(f"DELETE FROM course_slots WHERE course_id IN (SELECT id FROM courses WHERE {condition})", params)
+    cursor.execute(f'''
+        SELECT id, schedule, NULLIF(TRIM(room), ''), NULLIF(TRIM(instructor), '')
+        FROM courses WHERE {condition}
+    ''', params)
+    rows = []
+    unreadable = []
+    for course_id, text, room, instructor in cursor.fetchall():
+        try:
+            slots = schedule.parse(text)
+        except ValueError:
+            unreadable.append(course_id)
+            continue
+        rows += [(course_id, slot.day, slot.start, slot.end, room, instructor) for slot in slots]
+    cursor.executemany('''
+        INSERT INTO course_slots (course_id, day, start_minute, end_minute, room, instructor)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return unreadable
+
+MIGRATIONS = [
+    create_base_tables,
+    create_search_indexes,
+    create_lookup_indexes,
+    create_stats_tables,
+    create_cohort_tables,
+    create_grade_stats_tables,
+    add_delete_cascades,
+    create_audit_log,
+    create_sort_indexes,
+    create_schedule_tables,
+]
+
+# Per-row insert triggers of each table, other than the search index ones
+INSERT_TRIGGERS = {
+    "students": ["students_stats_insert"],
+    "courses": ["courses_stats_insert", "courses_department_insert"],
+    "enrollments": ["enrollments_stats_insert", "enrollments_department_insert"],
+    "grades": ["grades_stats_insert", "grades_summary_insert"],
+}
+
+def suspend_insert_triggers(cursor, table):
+    # For bulk inserts inside a transaction: keeping the search index and the
+    # counters up to date row by row is several times slower than catching up
+    # on all the new rows at once in resume_insert_triggers. Returns the id
+    # the new rows will start after.
+    triggers = list(INSERT_TRIGGERS[table])
+    if table in SEARCH_COLUMNS:
+        triggers.append(f"{table}_fts_insert")
+    for trigger in triggers:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    return cursor.fetchone()[0]
+
+def resume_insert_triggers(cursor, table, last_id):
+    # Index and count the rows added since suspend_insert_triggers, then put
+    # the triggers back
+    if table in SEARCH_COLUMNS:
+        column_list = ", ".join(SEARCH_COLUMNS[table])
+        cursor.execute(f'''
+            INSERT INTO {table}_fts (rowid, {column_list})
+            SELECT id, {column_list} FROM {table} WHERE id > ?
+        ''', (last_id,))
+        create_search_triggers(cursor, table)
+    
+    cursor.execute(f"UPDATE stats SET value = value + (SELECT COUNT(*) FROM {table} WHERE id > ?) WHERE name = ?",
+                   (last_id, table))
+    if table == "courses":
+        cursor.execute('''
+            INSERT INTO department_stats (department, courses)
+            SELECT COALESCE(department, ''), COUNT(*) FROM courses WHERE id > ?
+            GROUP BY COALESCE(department, '')
+            ON CONFLICT (department) DO UPDATE SET courses = courses + excluded.courses
+        ''', (last_id,))
+        index_schedules(cursor, "id > ?", (last_id,))
+    elif table == "enrollments":
+        cursor.execute('''
+            INSERT INTO department_stats (department, enrollments)
+            SELECT COALESCE(c.department, ''), COUNT(*)
+            FROM enrollments e JOIN courses c ON c.id = e.course_id
+            WHERE e.id > ?
+            GROUP BY COALESCE(c.department, '')
+            ON CONFLICT (department) DO UPDATE SET enrollments = enrollments + excluded.enrollments
+        ''', (last_id,))
+    elif table == "grades":
+        add_grade_stats(cursor, last_id)
+        create_grade_stats_triggers(cursor)
+    create_stats_triggers(cursor)
+
+def add_grade_stats(cursor, after_id=0):
+    # Add the grades with ids after after_id to the per student and per course
+    # totals, a whole batch at a time
+    points = grade_points_sql("g.grade")
+    cursor.execute(f'''
+        INSERT INTO student_grade_stats (student_id, grades, credits, weighted_sum, weighted_points)
+        SELECT e.student_id, COUNT(*), SUM(COALESCE(c.credits, 0)), SUM(COALESCE(c.credits, 0) * g.grade),
+               SUM(COALESCE(c.credits, 0) * {points})
+        FROM grades g
+        JOIN enrollments e ON g.enrollment_id = e.id
+        JOIN courses c ON c.id = e.course_id
+        WHERE g.id > ? AND g.grade IS NOT NULL
+        GROUP BY e.student_id
+        ON CONFLICT (student_id) DO UPDATE SET
+            grades = grades + excluded.grades,
+            credits = credits + excluded.credits,
+            weighted_sum = weighted_sum + excluded.weighted_sum,
+            weighted_points = weighted_points + excluded.weighted_points
+    ''', (after_id,))
+    cursor.execute('''
+        INSERT INTO course_grade_stats (course_id, grades, total, total_squares, minimum, maximum)
+        SELECT e.course_id, COUNT(*), SUM(g.grade), SUM(g.grade * g.grade), MIN(g.grade), MAX(g.grade)
+        FROM grades g
+        JOIN enrollments e ON g.enrollment_id = e.id
+        WHERE g.id > ? AND g.grade IS NOT NULL
+        GROUP BY e.course_id
+        ON CONFLICT (course_id) DO UPDATE SET
+            grades = grades + excluded.grades,
+            total = total + excluded.total,
+            total_squares = total_squares + excluded.total_squares,
+            minimum = MIN(COALESCE(minimum, excluded.minimum), excluded.minimum),
+            maximum = MAX(COALESCE(maximum, excluded.maximum), excluded.maximum)
+    ''', (after_id,))
+
+def bulk_delete_grades(cursor, condition, params):
+    # Delete the grades of the enrollments "e" matching a condition, taking
+    # them off the grade totals in one grouped pass instead of row by row in
+    # the delete trigger, which looks up a course's minimum and maximum again
+    # every time one of them goes
+    grades = f"SELECT g.grade, e.student_id, e.course_id, COALESCE(c.credits, 0) AS credits " \
+             f"FROM grades g JOIN enrollments e ON g.enrollment_id = e.id JOIN courses c ON c.id = e.course_id " \
+             f"WHERE ({condition}) AND g.grade IS NOT NULL"
+    points = grade_points_sql("grade")
+    cursor.execute(f'''
+        UPDATE student_grade_stats SET
+            grades = student_grade_stats.grades - d.grades,
+            credits = student_grade_stats.credits - d.credits,
+            weighted_sum = student_grade_stats.weighted_sum - d.weighted_sum,
+            weighted_points = student_grade_stats.weighted_points - d.weighted_points
+        FROM (
+            SELECT student_id, COUNT(*) AS grades, SUM(credits) AS credits, SUM(credits * grade) AS weighted_sum,
+                   SUM(credits * {points}) AS weighted_points
+            FROM ({grades}) GROUP BY student_id
+        ) AS d
+        WHERE student_grade_stats.student_id = d.student_id
+    ''', params)
+    cursor.execute(f'''
+        UPDATE course_grade_stats SET
+            grades = course_grade_stats.grades - d.grades,
+            total = course_grade_stats.total - d.total,
+            total_squares = course_grade_stats.total_squares - d.total_squares
+        FROM (
+            SELECT course_id, COUNT(*) AS grades, SUM(grade) AS total, SUM(grade * grade) AS total_squares
+            FROM ({grades}) GROUP BY course_id
+        ) AS d
+        WHERE course_grade_stats.course_id = d.course_id
+    ''', params)
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS changed_courses (course_id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM changed_courses")
+    cursor.execute(f"INSERT INTO changed_courses SELECT DISTINCT course_id FROM ({grades})", params)
+    
+    cursor.execute("DROP TRIGGER IF EXISTS grades_summary_delete")
+    cursor.execute(f"DELETE FROM grades WHERE enrollment_id IN (SELECT e.id FROM enrollments e WHERE {condition})", params)
+    create_grade_stats_triggers(cursor)
+    
+    cursor.execute('''
+        UPDATE course_grade_stats SET
+            minimum = (SELECT MIN(g.grade) FROM enrollments e JOIN grades g ON g.enrollment_id = e.id
+                       WHERE e.course_id = course_grade_stats.course_id),
+            maximum = (SELECT MAX(g.grade) FROM enrollments e JOIN grades g ON g.enrollment_id = e.id
+                       WHERE e.course_id = course_grade_stats.course_id)
+        WHERE course_id IN (SELECT course_id FROM changed_courses) AND grades > 0
+    ''')
+    cursor.execute("DELETE FROM student_grade_stats WHERE grades <= 0")
+    cursor.execute("DELETE FROM course_grade_stats WHERE grades <= 0")
+    cursor.execute("DROP TABLE changed_courses")
+
+def rebuild_grade_stats(cursor):
+    # Recompute the grade totals from scratch, e.g. after editing the grades
+    # table by hand. Sums kept incrementally can differ from a fresh sum in the
+    # last bits, so unlike the counters there is nothing to compare.
+    cursor.execute("DELETE FROM student_grade_stats")
+    cursor.execute("DELETE FROM course_grade_stats")
+    add_grade_stats(cursor)
+
+def delete_orphans(cursor):
+    # Delete grades whose enrollment is gone, enrollments whose student or
+    # course is gone and cohort members who are no longer students, left
+    # behind by deletes made with foreign keys off. Each is one set-based
+    # statement; the grade totals and counters are rebuilt afterwards rather
+    # than adjusted row by row. Returns the number of rows deleted per table.
+    valid_enrollments = '''
+        SELECT e.id FROM enrollments e
+        JOIN students s ON s.id = e.student_id
+        JOIN courses c ON c.id = e.course_id
+    '''
+    deleted = {}
+    cursor.execute("DROP TRIGGER IF EXISTS grades_summary_delete")
+    cursor.execute(f"DELETE FROM grades WHERE enrollment_id NOT IN ({valid_enrollments})")
+    deleted["grades"] = cursor.rowcount
+    create_grade_stats_triggers(cursor)
+    cursor.execute('''
+        DELETE FROM enrollments
+        WHERE student_id NOT IN (SELECT id FROM students) OR course_id NOT IN (SELECT id FROM courses)
+    ''')
+    deleted["enrollments"] = cursor.rowcount
+    cursor.execute("DELETE FROM cohort_members WHERE student_id NOT IN (SELECT id FROM students)")
+    deleted["cohort_members"] = cursor.rowcount
+    
+    if deleted["grades"]:
+        rebuild_grade_stats(cursor)
+    if deleted["grades"] or deleted["enrollments"]:
+        recount_stats(cursor)
+    return deleted
+
+def read_stats(cursor):
+    # Counters by name, plus (department, courses, enrollments) rows
+    cursor.execute("SELECT name, value FROM stats")
+    counts = dict(cursor.fetchall())
+    cursor.execute('''
+        SELECT department, courses, enrollments FROM department_stats
+        ORDER BY enrollments DESC, department
+    ''')
+    return counts, cursor.fetchall()
+
+def recount_stats(cursor):
+    # Recompute every counter from the tables in one pass each and return the
+    # ones that were wrong as {name: (stored, actual)}
+    stored, stored_departments = read_stats(cursor)
+    
+    cursor.execute("DELETE FROM stats")
+    for table in COUNTED_TABLES:
+        cursor.execute(f"INSERT INTO stats (name, value) SELECT '{table}', COUNT(*) FROM {table}")
+    cursor.execute("DELETE FROM department_stats")
+    cursor.execute('''
+        INSERT INTO department_stats (department, courses, enrollments)
+        SELECT COALESCE(c.department, ''), COUNT(DISTINCT c.id), COUNT(e.id)
+        FROM courses c
+        LEFT JOIN enrollments e ON e.course_id = c.id
+        GROUP BY COALESCE(c.department, '')
+    ''')
+    actual, actual_departments = read_stats(cursor)
+    
+    mismatches = {}
+    for name in COUNTED_TABLES:
+        if stored.get(name) != actual[name]:
+            mismatches[name] = (stored.get(name), actual[name])
+    stored_departments = {row[0]: row[1:] for row in stored_departments}
+    actual_departments = {row[0]: row[1:] for row in actual_departments}
+    for department in set(stored_departments) | set(actual_departments):
+        before = stored_departments.get(department, (0, 0))
+        after = actual_departments.get(department, (0, 0))
+        if before != after:
+            mismatches[f"department:{department}"] = (before, after)
+    return mismatches
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    # Bring the database up to the latest schema version, one migration per
+    # transaction so a failure leaves the database at the last good version
+    version = schema_version(conn)
+    if version > len(MIGRATIONS):
+        raise sqlite3.DatabaseError(
+            f"Database schema version {version} is newer than this program supports ({len(MIGRATIONS)})")
+    
+    conn.commit()
+    cursor = conn.cursor()
+    
+    # Migrations that rebuild a table need foreign keys off while it is being
+    # replaced, which can only be switched outside a transaction. They are
+    # checked before each commit instead, from add_delete_cascades on: older
+    # databases can hold orphans, which that migration deletes first.
+    checked_from = MIGRATIONS.index(add_delete_cascades) + 1
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            cursor.execute("BEGIN")
+            try:
+                migration(cursor)
+                if number >= checked_from:
+                    cursor.execute("PRAGMA foreign_key_check")
+                    if cursor.fetchone() is not None:
+                        raise sqlite3.IntegrityError(f"Migration {number} left rows with missing references")
+                cursor.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    return schema_version(conn)
@@ -0,0 +1,303 @@
+import bisect
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from time import perf_counter
+
+# Query instrumentation. database.connect() hands out InstrumentedConnection
+# objects, whose cursors time every statement from execute to the last row
+# fetched and add it to the process-wide recorder under its shape: the SQL
+# with literals and IN lists folded, so every page of a list counts as one
+# query. Statements slower than the threshold are also kept with their
+# EXPLAIN QUERY PLAN. Turned off or tuned in academy.ini:
+#
+#   [diagnostics]
+#   enabled = yes
+#   slow_query_ms = 100
+
+DEFAULT_SLOW_QUERY_MS = 100
+
+# Slow queries kept, the oldest are dropped first
+SLOW_QUERIES = 200
+
+# Upper edges of the latency histogram buckets in milliseconds; slower
+# queries go in one last bucket
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Plans of this many statements are kept, so a query that is often slow is
+# explained once
+PLAN_CACHE = 256
+
+# Parameters of a slow query are shown up to this many characters
+PARAMETERS_SHOWN = 200
+
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NUMBER_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+SPACE_PATTERN = re.compile(r"\s+")
+LIST_PATTERN = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+EXPLAINED_PATTERN = re.compile(r"\s*(?:SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def query_shape(sql):
+    # The statement with literals replaced by ? and IN lists of them by
+    # IN (?, ...)
+    shape = STRING_PATTERN.sub("?", sql)
+    shape = NUMBER_PATTERN.sub("?", shape)
+    shape = SPACE_PATTERN.sub(" ", shape).strip()
+    return LIST_PATTERN.sub("IN (?, ...)", shape)
+
+def full_scans(plan):
+    # Steps of a plan that read a whole table: SCAN without an index, other
+    # than of a virtual table such as json_each or the search index
+    return [detail for detail in plan if detail.startswith("SCAN ") and " USING " not in detail
+            and "VIRTUAL TABLE" not in detail and "CONSTANT ROW" not in detail]
+
+def bucket_label(index):
+    return f"<= {BUCKETS[index]:g} ms" if index < len(BUCKETS) else f"> {BUCKETS[-1]:g} ms"
+
+class QueryStats:
+    # Calls, rows and latencies of one query shape
+    def __init__(self, shape):
+        self.shape = shape
+        self.calls = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+    
+    def add(self, elapsed, rows):
+        self.calls += 1
+        self.rows += rows
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.histogram[bisect.bisect_left(BUCKETS, elapsed * 1000)] += 1
+    
+    def percentile(self, fraction):
+        # Upper edge of the bucket holding the given fraction of the calls, in
+        # milliseconds; the slowest bucket reports the maximum
+        wanted = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= wanted:
+                return BUCKETS[index] if index < len(BUCKETS) else self.max * 1000
+        return 0.0
+    
+    def to_dict(self):
+        return {
+            "query": self.shape,
+            "calls": self.calls,
+            "rows": self.rows,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max * 1000, 3),
+            "histogram": {bucket_label(index): count for index, count in enumerate(self.histogram) if count},
+        }
+
+class Recorder:
+    # Statistics of every query shape and the recent slow queries, shared by
+    # the connections of all threads
+    def __init__(self, slow_query_ms=DEFAULT_SLOW_QUERY_MS):
+        self.lock = threading.Lock()
+        self.slow_seconds = slow_query_ms / 1000
+        self.started = datetime.now()
+        self.queries = {}
+        self.slow = deque(maxlen=SLOW_QUERIES)
+        self.plans = {}
+    
+    def record(self, conn, sql, parameters, elapsed, rows, caller):
+        shape = query_shape(sql)
+        with self.lock:
+            stats = self.queries.get(shape)
+            if stats is None:
+                stats = self.queries[shape] = QueryStats(shape)
+            stats.add(elapsed, rows)
+        if elapsed >= self.slow_seconds:
+            self.record_slow(conn, sql, shape, parameters, elapsed, rows, caller)
+    
+    def record_slow(self, conn, sql, shape, parameters, elapsed, rows, caller):
+        plan = self.explain(conn, sql, parameters)
+        code, line = caller
+        self.slow.append({
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "ms": round(elapsed * 1000, 3),
+            "rows": rows,
+            "query": shape,
+            "sql": sql.strip(),
+            "parameters": repr(parameters)[:PARAMETERS_SHOWN] if parameters is not None else None,
+            "origin": f"{os.path.basename(code.co_filename)}:{line} in {code.co_name}",
+            "plan": plan,
+            "full_scans": full_scans(plan),
+        })
+    
+    def explain(self, conn, sql, parameters):
+        # EXPLAIN QUERY PLAN of a statement run on conn, on a plain cursor so
+        # it isn't recorded itself
+        plan = self.plans.get(sql)
+        if plan is not None:
+            return plan
+        if parameters is None or not EXPLAINED_PATTERN.match(sql):
+            return []
+        try:
+            cursor = sqlite3.Cursor(conn)
+            try:
+                plan = [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+            finally:
+                cursor.close()
+        except sqlite3.Error as e:
+            return [f"(no plan: {e})"]
+        with self.lock:
+            if len(self.plans) >= PLAN_CACHE:
+                self.plans.clear()
+            self.plans[sql] = plan
+        return plan
+    
+    def reset(self):
+        with self.lock:
+            self.started = datetime.now()
+            self.queries = {}
+            self.slow.clear()
+            self.plans = {}
+    
+    def query_stats(self):
+        # Statistics of each query shape, the most total time first
+        with self.lock:
+            stats = [stats.to_dict() for stats in self.queries.values()]
+        return sorted(stats, key=lambda stats: stats["total_ms"], reverse=True)
+    
+    def slow_queries(self):
+        # The recent slow queries, newest first
+        return list(reversed(self.slow))
+    
+    def to_dict(self):
+        return {
+            "started": self.started.strftime("%Y-%m-%d %H:%M:%S"),
+            "dumped": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "slow_query_ms": self.slow_seconds * 1000,
+            "queries": self.query_stats(),
+            "slow_queries": self.slow_queries(),
+        }
+    
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+recorder = Recorder()
+
+# Called for every row, so looked up once
+next_row = sqlite3.Cursor.__next__
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times its statement from execute until the rows run out, the cursor is
+    # reused or closed; only the time spent inside SQLite counts, not the
+    # caller's work between fetches
+    sql = None
+    
+    def execute(self, sql, parameters=()):
+        return self.run(sql, parameters, sys._getframe(1))
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.run_many(sql, seq_of_parameters, sys._getframe(1))
+    
+    def run(self, sql, parameters, caller):
+        self.finish()
+        start = perf_counter()
+        super().execute(sql, parameters)
+        self.begin(sql, parameters, perf_counter() - start, caller)
+        if self.description is None:
+            # Not a query: done, rows are the ones changed
+            self.rows = max(self.rowcount, 0)
+            self.finish()
+        return self
+    
+    def run_many(self, sql, seq_of_parameters, caller):
+        self.finish()
+        start = perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        # Not explained, the parameters may have been a generator
+        self.begin(sql, None, perf_counter() - start, caller)
+        self.rows = max(self.rowcount, 0)
+        self.finish()
+        return self
+    
+    def begin(self, sql, parameters, elapsed, caller):
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = elapsed
+        self.rows = 0
+        self.caller = (caller.f_code, caller.f_lineno)
+    
+    def finish(self):
+        if self.sql is not None:
+            sql, self.sql = self.sql, None
+            recorder.record(self.connection, sql, self.parameters, self.elapsed, self.rows, self.caller)
+    
+    def __next__(self):
+        start = perf_counter()
+        try:
+            row = next_row(self)
+        except StopIteration:
+            self.elapsed += perf_counter() - start
+            self.finish()
+            raise
+        self.elapsed += perf_counter() - start
+        self.rows += 1
+        return row
+    
+    def fetchone(self):
+        start = perf_counter()
+        row = super().fetchone()
+        self.elapsed += perf_counter() - start
+        if row is None:
+            self.finish()
+        else:
+            self.rows += 1
+        return row
+    
+    def fetchmany(self, size=None):
+        start = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.elapsed += perf_counter() - start
+        self.rows += len(rows)
+        if not rows:
+            self.finish()
+        return rows
+    
+    def fetchall(self):
+        start = perf_counter()
+        rows = super().fetchall()
+        self.elapsed += perf_counter() - start
+        self.rows += len(rows)
+        self.finish()
+        return rows
+    
+    def close(self):
+        self.finish()
+        super().close()
+    
+    def __del__(self):
+        # A cursor dropped before its last row, e.g. after one fetchone()
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() doesn't go through cursor(), so both are overridden
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+    
+    def execute(self, sql, parameters=()):
+        return InstrumentedCursor(self).run(sql, parameters, sys._getframe(1))
+    
+    def executemany(self, sql, seq_of_parameters):
+        return InstrumentedCursor(self).run_many(sql, seq_of_parameters, sys._getframe(1))
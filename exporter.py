@@ -0,0 +1,74 @@
+import csv
+import os
+
+# Rows fetched from SQLite and written to the file per step
+BATCH_SIZE = 5000
+
+# Header, row query and count query for each exportable table
+EXPORTS = {
+    "students": (
+        ["ID", "First Name", "Last Name", "Email", "Phone", "Date of Birth", "Address", "Enrollment Date"],
+        "SELECT id, first_name, last_name, email, phone, dob, address, enrollment_date FROM students ORDER BY id",
+        "SELECT COUNT(*) FROM students",
+    ),
+    "courses": (
+        ["ID", "Code", "Name", "Department", "Credits", "Instructor", "Schedule", "Room"],
+        "SELECT id, code, name, department, credits, instructor, schedule, room FROM courses ORDER BY id",
+        "SELECT COUNT(*) FROM courses",
+    ),
+    "enrollments": (
+        ["ID", "Student ID", "Student", "Email", "Course Code", "Course", "Department", "Enrollment Date"],
+        '''
+            SELECT e.id, s.id, s.first_name || ' ' || s.last_name, s.email, c.code, c.name, c.department, e.enrollment_date
+            FROM enrollments e
+            JOIN students s ON e.student_id = s.id
+            JOIN courses c ON e.course_id = c.id
+            ORDER BY e.id
+        ''',
+        "SELECT COUNT(*) FROM enrollments",
+    ),
+    "grades": (
+        ["ID", "Enrollment ID", "Student", "Email", "Course Code", "Course", "Grade", "Date"],
+        '''
+            SELECT g.id, e.id, s.first_name || ' ' || s.last_name, s.email, c.code, c.name, g.grade, g.grade_date
+            FROM grades g
+            JOIN enrollments e ON g.enrollment_id = e.id
+            JOIN students s ON e.student_id = s.id
+            JOIN courses c ON e.course_id = c.id
+            ORDER BY g.id
+        ''',
+        "SELECT COUNT(*) FROM grades",
+    ),
+}
+
+def export_csv(conn, table, file_path, progress=None, cancelled=None, batch_size=BATCH_SIZE):
+    # Stream a table to CSV in fetchmany batches so memory use does not grow
+    # with the table. progress(written, total) is called after every batch;
+    # when cancelled() returns True the partial file is removed and None is
+    # returned instead of the number of rows written.
+    header, query, count_query = EXPORTS[table]
+    total = conn.execute(count_query).fetchone()[0]
+    
+    cursor = conn.execute(query)
+    written = 0
+    finished = False
+    try:
+        with open(file_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            while cancelled is None or not cancelled():
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    finished = True
+                    break
+                writer.writerows(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress(written, total)
+    finally:
+        cursor.close()
+        # Don't leave a half written file behind
+        if not finished and os.path.exists(file_path):
+            os.remove(file_path)
+    
+    return written if finished else None
@@ -0,0 +1,189 @@
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+from itertools import islice
+import database
+
+# Synthetic academies for benchmarks and load tests. The same sizes and seed
+# always produce the same database.
+
+# Rows inserted per executemany call
+BATCH_SIZE = 10000
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Christopher", "Lisa", "Daniel", "Nancy", "Matthew", "Betty", "Anthony", "Sandra", "Mark", "Margaret",
+    "Wei", "Mei", "Hiroshi", "Yuki", "Aarav", "Priya", "Mohammed", "Fatima", "Olusegun", "Amara",
+    "Mateo", "Sofia", "Lucas", "Camila", "Noah", "Emma", "Liam", "Olivia", "Ethan", "Ava",
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+    "Wang", "Li", "Zhang", "Chen", "Kim", "Nguyen", "Sato", "Patel", "Singh", "Khan",
+    "Okafor", "Mensah", "Silva", "Santos", "Muller", "Schmidt", "Rossi", "Novak", "Kowalski", "Ivanova",
+]
+
+# Department, code prefix, relative size and course subjects
+DEPARTMENTS = [
+    ("Computer Science", "CS", 18, ["Programming", "Data Structures", "Algorithms", "Databases", "Networks",
+                                    "Operating Systems", "Machine Learning", "Compilers"]),
+    ("Business", "BUS", 15, ["Accounting", "Marketing", "Finance", "Management", "Economics", "Business Law"]),
+    ("Mathematics", "MATH", 12, ["Calculus", "Linear Algebra", "Statistics", "Discrete Mathematics",
+                                 "Probability", "Number Theory"]),
+    ("Engineering", "ENG", 12, ["Statics", "Thermodynamics", "Circuits", "Materials", "Fluid Mechanics"]),
+    ("Biology", "BIO", 10, ["Cell Biology", "Genetics", "Ecology", "Microbiology", "Physiology"]),
+    ("Psychology", "PSY", 9, ["Cognitive Psychology", "Social Psychology", "Developmental Psychology",
+                              "Research Methods"]),
+    ("English", "ENGL", 7, ["Composition", "Literature", "Creative Writing", "Rhetoric"]),
+    ("Physics", "PHYS", 6, ["Mechanics", "Electromagnetism", "Quantum Physics", "Optics"]),
+    ("Chemistry", "CHEM", 5, ["General Chemistry", "Organic Chemistry", "Biochemistry", "Physical Chemistry"]),
+    ("History", "HIST", 4, ["World History", "Modern Europe", "American History", "Ancient Civilizations"]),
+    ("Art", "ART", 2, ["Drawing", "Art History", "Sculpture", "Photography"]),
+]
+
+LEVELS = ["Introduction to", "", "Intermediate", "Advanced", "Topics in"]
+
+# Meeting patterns and start times of generated schedules
+MEETING_DAYS = ["Mon/Wed/Fri", "Mon/Wed", "Tue/Thu", "Mon", "Tue", "Wed", "Thu", "Fri"]
+START_TIMES = ["08:00", "09:30", "11:00", "12:30", "14:00", "15:30", "17:00", "18:30"]
+
+BUILDINGS = ["A", "B", "C", "D", "E", "F"]
+
+# Grades are normal around this mean, shifted by each student's ability
+GRADE_MEAN = 76
+GRADE_SPREAD = 10
+ABILITY_SPREAD = 8
+
+# Dates fall in this range, fixed so that a seed always gives the same data
+FIRST_DATE = date(2015, 1, 1)
+LAST_DATE = date(2025, 12, 31)
+
+def random_date(rng):
+    return (FIRST_DATE + timedelta(days=rng.randrange((LAST_DATE - FIRST_DATE).days))).isoformat()
+
+def student_rows(rng, count, first_number):
+    first_weights = [1 / (rank + 1) ** 0.7 for rank in range(len(FIRST_NAMES))]
+    last_weights = [1 / (rank + 1) ** 0.7 for rank in range(len(LAST_NAMES))]
+    for number in range(first_number, first_number + count):
+        first_name = rng.choices(FIRST_NAMES, first_weights)[0]
+        last_name = rng.choices(LAST_NAMES, last_weights)[0]
+        born = date(rng.randint(1980, 2006), rng.randint(1, 12), rng.randint(1, 28))
+        yield (first_name, last_name, f"{first_name}.{last_name}.{number}@example.edu".lower(),
+               f"555-{rng.randrange(10000):04d}", born.isoformat(), f"{rng.randint(1, 999)} {rng.choice(LAST_NAMES)} Street",
+               random_date(rng))
+
+def course_rows(rng, count):
+    # Courses spread over the departments by their size
+    weights = [size for _, _, size, _ in DEPARTMENTS]
+    numbers = {}
+    for _ in range(count):
+        department, prefix, _, subjects = rng.choices(DEPARTMENTS, weights)[0]
+        numbers[prefix] = numbers.get(prefix, 100) + rng.randint(1, 9)
+        level = rng.choice(LEVELS)
+        name = f"{level} {rng.choice(subjects)}".strip()
+        days = rng.choice(MEETING_DAYS)
+        start = rng.choice(START_TIMES)
+        hours, minutes = map(int, start.split(":"))
+        end = hours * 60 + minutes + (50 if days.count("/") == 2 else 75)
+        yield (f"{prefix}{numbers[prefix]}", name, department, rng.choice([1, 2, 3, 3, 3, 4, 4, 5]),
+               f"Dr. {rng.choice(LAST_NAMES)}", f"{days} {start}-{end // 60:02d}:{end % 60:02d}",
+               f"{rng.choice(BUILDINGS)}{rng.randint(1, 4)}{rng.randint(1, 30):02d}")
+
+def enrollment_rows(rng, student_ids, course_ids, per_student):
+    # Each student takes about per_student courses, the popular ones more often
+    popularity = [rng.paretovariate(1.5) for _ in course_ids]
+    for student_id in student_ids:
+        wanted = min(max(round(rng.gauss(per_student, per_student / 3)), 0), len(course_ids))
+        taken = set()
+        while len(taken) < wanted:
+            taken.update(rng.choices(course_ids, popularity, k=wanted - len(taken)))
+        for course_id in sorted(taken):
+            yield (student_id, course_id, random_date(rng))
+
+def grade_rows(rng, enrollments, per_enrollment):
+    # About per_enrollment grades per enrollment, dated after it
+    ability = {}
+    for enrollment_id, student_id, enrollment_date in enrollments:
+        offset = ability.setdefault(student_id, rng.gauss(0, ABILITY_SPREAD))
+        count = min(max(round(rng.gauss(per_enrollment, per_enrollment / 2)), 0), per_enrollment * 3)
+        enrolled = date.fromisoformat(enrollment_date)
+        for _ in range(count):
+            grade = min(max(rng.gauss(GRADE_MEAN + offset, GRADE_SPREAD), 0), 100)
+            yield (enrollment_id, round(grade, 1), (enrolled + timedelta(days=rng.randint(14, 120))).isoformat())
+
+def insert(cursor, table, insert_sql, rows, batch_size):
+    # Stream rows into a table with the per-row triggers suspended, like a
+    # bulk import. Returns the number of rows inserted.
+    last_id = database.suspend_insert_triggers(cursor, table)
+    inserted = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        cursor.executemany(insert_sql, batch)
+        inserted += cursor.rowcount
+    database.resume_insert_triggers(cursor, table, last_id)
+    return inserted
+
+def generate(conn, students=1000, courses=50, enrollments_per_student=5, grades_per_enrollment=2, seed=0,
+             batch_size=BATCH_SIZE):
+    # Add a synthetic academy to a migrated database in one transaction and
+    # return the number of rows added to each table
+    rng = random.Random(seed)
+    counts = {}
+    with database.transaction(conn) as cursor:
+        # Numbered e-mail addresses stay unique when adding to generated data
+        first_number = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM students").fetchone()[0]
+        counts["students"] = insert(cursor, "students", '''
+            INSERT INTO students (first_name, last_name, email, phone, dob, address, enrollment_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', student_rows(rng, students, first_number), batch_size)
+        counts["courses"] = insert(cursor, "courses", '''
+            INSERT INTO courses (code, name, department, credits, instructor, schedule, room)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', course_rows(rng, courses), batch_size)
+        
+        student_ids = [row[0] for row in cursor.execute("SELECT id FROM students ORDER BY id")]
+        course_ids = [row[0] for row in cursor.execute("SELECT id FROM courses ORDER BY id")]
+        last_enrollment = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM enrollments").fetchone()[0]
+        counts["enrollments"] = insert(cursor, "enrollments", '''
+            INSERT INTO enrollments (student_id, course_id, enrollment_date) VALUES (?, ?, ?)
+            ON CONFLICT (student_id, course_id) DO NOTHING
+        ''', enrollment_rows(rng, student_ids, course_ids, enrollments_per_student), batch_size)
+        
+        # Grade the new enrollments, read back from a cursor of their own
+        enrollments = conn.execute('''
+            SELECT id, student_id, enrollment_date FROM enrollments WHERE id > ? ORDER BY id
+        ''', (last_enrollment,))
+        counts["grades"] = insert(cursor, "grades", '''
+            INSERT INTO grades (enrollment_id, grade, grade_date) VALUES (?, ?, ?)
+        ''', grade_rows(rng, enrollments, grades_per_enrollment), batch_size)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create a synthetic academy database")
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--enrollments", type=int, default=5, help="courses per student, on average")
+    parser.add_argument("--grades", type=int, default=2, help="grades per enrollment, on average")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    conn = database.connect(args.path)
+    try:
+        database.migrate(conn)
+        counts = generate(conn, args.students, args.courses, args.enrollments, args.grades, args.seed)
+    finally:
+        conn.close()
+    print(", ".join(f"{count} {table}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    sys.exit(main())
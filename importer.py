@@ -0,0 +1,299 @@
+import csv
+import re
+from datetime import date
+from itertools import islice
+import database
+import schedule
+
+# Rows validated and inserted per executemany call
+BATCH_SIZE = 10000
+
+# Per-row errors kept for the report; the rest are only counted
+MAX_ERRORS = 1000
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Accepted spellings of column headers, after lower-casing and replacing
+# spaces with underscores. The headers written by exporter.py import as-is.
+ALIASES = {
+    "date_of_birth": "dob",
+    "student_email": "email",
+    "grade_date": "date",
+}
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+        self.unreadable_schedules = 0
+        self.cancelled = False
+    
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+    
+    def summary(self):
+        text = f"{self.inserted} rows imported, {self.error_count} rejected"
+        if self.skipped:
+            text += f", {self.skipped} already present"
+        if self.unreadable_schedules:
+            text += f", {self.unreadable_schedules} with schedules that could not be read"
+        return text
+
+def valid_date(value):
+    if not DATE_PATTERN.fullmatch(value):
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+# Validators turn the values of one CSV row (in the order of the table's
+# fields) into the parameters for the insert, or report why they can't.
+# Each gets a context built once per import with the lookups it needs.
+
+def student_context(conn):
+    return {"emails": {row[0] for row in conn.execute("SELECT email FROM students")}}
+
+def validate_student(values, line, context, result):
+    first_name, last_name, email, phone, dob, address, enrollment_date = values
+    if not first_name or not last_name or not email:
+        result.error(line, "First name, last name, and email are required")
+        return None
+    if email in context["emails"]:
+        result.error(line, f"Email must be unique: {email}")
+        return None
+    if dob and not valid_date(dob):
+        result.error(line, f"Date of birth must be YYYY-MM-DD: {dob}")
+        return None
+    if enrollment_date and not valid_date(enrollment_date):
+        result.error(line, f"Enrollment date must be YYYY-MM-DD: {enrollment_date}")
+        return None
+    context["emails"].add(email)
+    return (first_name, last_name, email, phone, dob, address, enrollment_date or None)
+
+def course_context(conn):
+    return {"codes": {row[0] for row in conn.execute("SELECT code FROM courses")}}
+
+def validate_course(values, line, context, result):
+    code, name, department, credits, instructor, meetings, room = values
+    if not code or not name:
+        result.error(line, "Course code and name are required")
+        return None
+    if code in context["codes"]:
+        result.error(line, f"Course code must be unique: {code}")
+        return None
+    try:
+        credits = int(credits) if credits else 3
+    except ValueError:
+        result.error(line, f"Credits must be a number: {credits}")
+        return None
+    try:
+        schedule.parse(meetings)
+    except ValueError:
+        # Imported as typed, like "TBA", without slots
+        result.unreadable_schedules += 1
+    context["codes"].add(code)
+    return (code, name, department, credits, instructor, meetings, room)
+
+def lookup_context(conn):
+    return {
+        "students": dict(conn.execute("SELECT email, id FROM students")),
+        "courses": dict(conn.execute("SELECT code, id FROM courses")),
+        "cursor": conn.cursor(),
+    }
+
+def resolve(values, line, context, result):
+    email, code = values[0], values[1]
+    student_id = context["students"].get(email)
+    if student_id is None:
+        result.error(line, f"Unknown student email: {email}")
+        return None, None
+    course_id = context["courses"].get(code)
+    if course_id is None:
+        result.error(line, f"Unknown course code: {code}")
+        return None, None
+    return student_id, course_id
+
+def validate_enrollment(values, line, context, result):
+    enrollment_date = values[2]
+    student_id, course_id = resolve(values, line, context, result)
+    if student_id is None:
+        return None
+    if enrollment_date and not valid_date(enrollment_date):
+        result.error(line, f"Enrollment date must be YYYY-MM-DD: {enrollment_date}")
+        return None
+    return (student_id, course_id, enrollment_date or None)
+
+def validate_grade(values, line, context, result):
+    grade, grade_date = values[2], values[3]
+    student_id, course_id = resolve(values, line, context, result)
+    if student_id is None:
+        return None
+    try:
+        grade = float(grade)
+    except ValueError:
+        result.error(line, f"Grade must be a number: {grade}")
+        return None
+    if not 0 <= grade <= 100:
+        result.error(line, f"Grade must be between 0 and 100: {grade}")
+        return None
+    if grade_date and not valid_date(grade_date):
+        result.error(line, f"Grade date must be YYYY-MM-DD: {grade_date}")
+        return None
+    
+    cursor = context["cursor"]
+    cursor.execute("SELECT id FROM enrollments WHERE student_id=? AND course_id=?", (student_id, course_id))
+    enrollment = cursor.fetchone()
+    if enrollment is None:
+        result.error(line, f"Student {values[0]} is not enrolled in {values[1]}")
+        return None
+    return (enrollment[0], grade, grade_date or date.today().isoformat())
+
+# Fields read from the file, required fields, context, validator and insert
+IMPORTS = {
+    "students": (
+        ["first_name", "last_name", "email", "phone", "dob", "address", "enrollment_date"],
+        ["first_name", "last_name", "email"],
+        student_context,
+        validate_student,
+        '''
+            INSERT INTO students (first_name, last_name, email, phone, dob, address, enrollment_date)
+            VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_DATE))
+        ''',
+    ),
+    "courses": (
+        ["code", "name", "department", "credits", "instructor", "schedule", "room"],
+        ["code", "name"],
+        course_context,
+        validate_course,
+        '''
+            INSERT INTO courses (code, name, department, credits, instructor, schedule, room)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''',
+    ),
+    "enrollments": (
+        ["email", "course_code", "enrollment_date"],
+        ["email", "course_code"],
+        lookup_context,
+        validate_enrollment,
+        # Pairs that are already enrolled are counted as skipped
+        '''
+            INSERT INTO enrollments (student_id, course_id, enrollment_date)
+            VALUES (?, ?, COALESCE(?, CURRENT_DATE))
+            ON CONFLICT (student_id, course_id) DO NOTHING
+        ''',
+    ),
+    "grades": (
+        ["email", "course_code", "grade", "date"],
+        ["email", "course_code", "grade"],
+        lookup_context,
+        validate_grade,
+        "INSERT INTO grades (enrollment_id, grade, grade_date) VALUES (?, ?, ?)",
+    ),
+}
+
+def normalize_header(name):
+    name = name.strip().lower().replace(" ", "_")
+    return ALIASES.get(name, name)
+
+def import_csv(conn, table, file_path, strict=False, progress=None, cancelled=None, batch_size=BATCH_SIZE):
+    # Stream a CSV file into a table: rows are validated as they are read and
+    # inserted with executemany, all inside one transaction. Invalid rows are
+    # reported in the result; with strict=True any invalid row rolls back the
+    # whole import. progress(rows_read) is called after every batch.
+    fields, required, make_context, validate, insert = IMPORTS[table]
+    result = ImportResult()
+    
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError("The file is empty")
+        
+        positions = {}
+        for index, name in enumerate(header):
+            positions.setdefault(normalize_header(name), index)
+        missing = [name for name in required if name not in positions]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        columns = [positions.get(name) for name in fields]
+        
+        # Take the write lock first so the uniqueness checks below can't be
+        # invalidated by another connection before the rows are inserted
+        if conn.in_transaction:
+            conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            context = make_context(conn)
+            
+            def rows():
+                # Line 1 is the header
+                for line, record in enumerate(reader, start=2):
+                    values = [record[index].strip() if index is not None and index < len(record) else ""
+                              for index in columns]
+                    params = validate(values, line, context, result)
+                    if params is not None:
+                        yield params
+            
+            last_id = database.suspend_insert_triggers(cursor, table)
+            
+            batches = rows()
+            while True:
+                if cancelled is not None and cancelled():
+                    result.cancelled = True
+                    break
+                batch = list(islice(batches, batch_size))
+                if not batch:
+                    break
+                cursor.executemany(insert, batch)
+                result.inserted += cursor.rowcount
+                result.skipped += len(batch) - cursor.rowcount
+                if progress is not None:
+                    progress(reader.line_num - 1)
+            
+            if result.cancelled or (strict and result.error_count):
+                conn.rollback()
+                result.inserted = 0
+                result.skipped = 0
+            else:
+                database.resume_insert_triggers(cursor, table, last_id)
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    
+    return result
+
+def read_grade_sheet(file_path):
+    # Grades for one course from a CSV file: a student_id or email column, a
+    # grade column and an optional date column. Returns (line, student id,
+    # email, grade, date) for each row, leaving validation to the caller.
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError("The file is empty")
+        positions = {}
+        for index, name in enumerate(header):
+            positions.setdefault(normalize_header(name), index)
+        if "grade" not in positions or ("student_id" not in positions and "email" not in positions):
+            raise ValueError("The file needs a grade column and a student_id or email column")
+        
+        def value(record, name):
+            index = positions.get(name)
+            return record[index].strip() if index is not None and index < len(record) else ""
+        
+        rows = []
+        for line, record in enumerate(reader, start=2):
+            if not any(field.strip() for field in record):
+                continue
+            student_id = value(record, "student_id")
+            rows.append((line, int(student_id) if student_id.isdigit() else None,
+                         value(record, "email"), value(record, "grade"), value(record, "date")))
+        return rows
@@ -1,104 +1,759 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import sqlite3
+import database
+import services
+from autocomplete import PrefixIndex
+from worker import DatabaseWorker
 from datetime import datetime
-import csv
 import os
+import threading
+import time
+import exporter
+import importer
+import analytics
+import backup
+import diagnostics
+import schedule
 from tkinter import filedialog
 
+# Rows fetched per page and number of pages kept in a Treeview at once
+PAGE_SIZE = 100
+MAX_CACHED_PAGES = 5
+
+# Pause in typing before a search runs
+SEARCH_DELAY_MS = 250
+
+# Matches listed in a combobox drop-down while typing
+CHOICE_LIMIT = 50
+
+# Students listed in the Analytics tab, best GPA first
+TOP_STUDENTS = 100
+
+# How often finished background queries are picked up, in milliseconds
+WORKER_POLL_MS = 20
+
+# How often buffered audit log entries are written, in milliseconds
+AUDIT_FLUSH_MS = 5000
+
+# Entries shown in the dashboard's recent activity list
+RECENT_ACTIVITY = 20
+
+# Rows listed in the schedule conflicts report; the counts cover them all
+CONFLICT_ROWS = 2000
+
+# Time from start until the window is ready that the startup report flags as
+# too slow, in milliseconds
+STARTUP_BUDGET_MS = 1000
+
+# Operators a column filter may start with; other text matches the values
+# that start with it
+FILTER_OPERATORS = ["<=", ">=", "<>", "!=", "<", ">", "="]
+
+def filter_value(text):
+    # Numbers compare as numbers, everything else as text
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+def sort_value(value):
+    # SQLite's order: NULL, then numbers, then text
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value)
+
+class VirtualTable:
+    # Shows a sliding window of a keyset-paginated query in a Treeview instead
+    # of inserting every row. columns are the SQL expressions of the tree's
+    # columns, the first being the key, and source is the FROM clause.
+    # Clicking a heading sorts by that column in the database: pages continue
+    # from the (column, key) values of the last row, so every page is an index
+    # seek. sorts maps a column to the expressions it is really ordered by
+    # (with tie-breakers that let an index or a join produce rows in order)
+    # and the FROM clause whose join order does so, or None for source.
+    # With a DatabaseWorker, pages are fetched off the UI thread.
+    def __init__(self, tree, cursor, columns, source, key, sorts=None, page_size=PAGE_SIZE, max_pages=MAX_CACHED_PAGES,
+                 worker=None):
+        self.tree = tree
+        self.cursor = cursor
+        self.columns = list(columns)
+        self.source = source
+        self.key = key
+        self.sorts = sorts or {}
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.worker = worker
+        self.where = ""
+        self.params = ()
+        self.filters = {}
+        self.sort_column = 0
+        self.descending = False
+        self.pages = []
+        self.has_before = False
+        self.has_after = False
+        self.fetching = False
+        self.loading = False
+        self.pending = []
+        self.ranked = False
+        self.ranked_ids = []
+        self.scrollbar = None
+        
+        self.headings = [tree.heading(column)["text"] for column in tree["columns"]]
+        for index, column in enumerate(tree["columns"]):
+            tree.heading(column, command=lambda index=index: self.sort_by(index))
+        
+    def attach_scrollbar(self, scrollbar):
+        self.scrollbar = scrollbar
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        
+    def run_query(self, parts, callback):
+        # Read (query, params) parts in turn until there is a page and one more
+        # row. Fetch rows on the worker when there is one. A newer request for
+        # this table supersedes any that is still in flight.
+        def fetch(execute):
+            rows = []
+            for query, params in parts:
+                rows += execute(query, params).fetchall()
+                if len(rows) > self.page_size:
+                    break
+            return rows
+        
+        if self.worker is None:
+            callback(fetch(self.cursor.execute))
+            return
+        
+        def done(rows):
+            self.loading = False
+            callback(rows)
+            self.apply_pending()
+        
+        def failed(error):
+            self.loading = False
+            self.fetching = False
+            self.pending = []
+            messagebox.showerror("Error", f"Error loading data: {str(error)}")
+        
+        self.loading = True
+        self.worker.submit(lambda conn: fetch(conn.execute), done, failed, key=self)
+        
+    def apply_pending(self):
+        # Row updates that arrived while a page was loading
+        pending, self.pending = self.pending, []
+        for update in pending:
+            update()
+        
+    def reload(self, where="", params=()):
+        self.where = where
+        self.params = tuple(params)
+        self.ranked = False
+        self.fetching = False
+        
+        def show(rows):
+            rows, self.has_after = self.split_page(rows, False)
+            self.tree.delete(*self.tree.get_children())
+            self.pages = [rows] if rows else []
+            self.has_before = False
+            for row in rows:
+                self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+            self.tree.yview_moveto(0)
+        
+        self.run_query(self.page_query(True), show)
+        
+    def show_ids(self, ids):
+        # Show a fixed, already ranked list of keys (e.g. search results) in
+        # the given order, or sorted by the sort column, instead of paging
+        # through the table
+        ids = list(ids)
+        self.where = f"{self.key} IN ({', '.join('?' for _ in ids)})" if ids else "0"
+        self.params = tuple(ids)
+        self.ranked = True
+        self.ranked_ids = ids
+        self.fetching = False
+        query, params = self.build_query([], [])
+        
+        def show(rows):
+            if self.sort_column == 0:
+                found = {row[0]: row for row in rows}
+                rows = [found[row_id] for row_id in ids if row_id in found]
+            else:
+                rows.sort(key=lambda row: [sort_value(value) for value in self.order_values(row)],
+                          reverse=self.descending)
+            self.tree.delete(*self.tree.get_children())
+            self.pages = [rows] if rows else []
+            self.has_before = False
+            self.has_after = False
+            for row in rows:
+                self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+            self.tree.yview_moveto(0)
+        
+        self.run_query([(query, params)], show)
+    
+    def refresh(self):
+        # Read the current view again, e.g. after the filters changed
+        if self.ranked:
+            self.show_ids(self.ranked_ids)
+        else:
+            self.reload(self.where, self.params)
+    
+    def sort_by(self, index):
+        # Sort by a column, or reverse the order when it is already sorted by
+        # it. Search results are then sorted rather than ranked.
+        if index == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = index
+            self.descending = False
+        for position, column in enumerate(self.tree["columns"]):
+            arrow = (" ▼" if self.descending else " ▲") if position == index else ""
+            self.tree.heading(column, text=self.headings[position] + arrow)
+        self.reload(self.where, self.params)
+    
+    def set_filters(self, filters):
+        # {column index: filter text}, see filter_conditions
+        if filters != self.filters:
+            self.filters = dict(filters)
+            self.refresh()
+    
+    def filter_conditions(self):
+        conditions = []
+        params = []
+        for index, text in sorted(self.filters.items()):
+            column = self.columns[index]
+            for operator in FILTER_OPERATORS:
+                if text.startswith(operator):
+                    conditions.append(f"{column} {operator} ?")
+                    params.append(filter_value(text[len(operator):].strip()))
+                    break
+            else:
+                pattern = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                conditions.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append(pattern + "%")
+        return conditions, params
+    
+    def sort_terms(self):
+        # Expressions the rows are ordered by ahead of the key, and the FROM
+        # clause to read them with
+        if self.sort_column == 0:
+            return [], self.source
+        terms, source = self.sorts.get(self.sort_column, ([self.columns[self.sort_column]], None))
+        return list(terms), source or self.source
+        
+    def build_query(self, conditions, params):
+        # Combine extra conditions with the active filters. The sort terms are
+        # selected after the columns, to continue from the last row.
+        conditions = list(conditions)
+        params = list(params)
+        if self.where:
+            conditions.append(f"({self.where})")
+            params.extend(self.params)
+        filters, filter_params = self.filter_conditions()
+        conditions += filters
+        params += filter_params
+        
+        terms, source = self.sort_terms()
+        query = f"SELECT {', '.join(self.columns + terms)} FROM {source}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return query, params
+    
+    def page_query(self, after, row=None):
+        # The (query, params) parts to read for the page after or before a row
+        # in the current order, or for the first page. Pages before a row are
+        # read backwards. SQLite sorts NULLs first, so from a row with a value
+        # the NULLs of the first sort term are read as a part of their own,
+        # and from one without the values are; both parts are index seeks.
+        terms, _ = self.sort_terms()
+        ascending = after != self.descending
+        op = ">" if ascending else "<"
+        direction = "ASC" if ascending else "DESC"
+        order = ", ".join(f"{term} {direction}" for term in terms + [self.key])
+        
+        def part(conditions, params):
+            query, params = self.build_query(conditions, params)
+            return query + f" ORDER BY {order} LIMIT ?", params + [self.page_size + 1]
+        
+        if row is None:
+            return [part([], [])]
+        values = self.order_values(row)
+        if not terms:
+            return [part([f"{self.key} {op} ?"], [values[-1]])]
+        
+        first = terms[0]
+        if values[0] is None:
+            rest = terms[1:] + [self.key]
+            nulls = part([f"{first} IS NULL", f"({', '.join(rest)}) {op} ({', '.join('?' for _ in rest)})"],
+                         list(values[1:]))
+            return [nulls, part([f"{first} IS NOT NULL"], [])] if ascending else [nulls]
+        
+        # The first term alone narrows the seek when the terms span tables
+        placeholders = ", ".join("?" for _ in values)
+        later = part([f"{first} {op}= ?", f"({', '.join(terms + [self.key])}) {op} ({placeholders})"],
+                     [values[0]] + list(values))
+        return [later] if ascending else [later, part([f"{first} IS NULL"], [])]
+    
+    def split_page(self, rows, backwards):
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+        return rows, more
+    
+    def order_values(self, row):
+        # The sort term values of a row and its key
+        terms, _ = self.sort_terms()
+        start = len(self.columns)
+        return tuple(row[start:start + len(terms)]) + (row[0],)
+    
+    def comes_before(self, row, other):
+        before = [sort_value(value) for value in self.order_values(row)] < \
+                 [sort_value(value) for value in self.order_values(other)]
+        return before != self.descending
+        
+    def on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        if self.fetching or self.loading or not self.pages:
+            return
+        
+        # Fetch the neighbouring page once the view gets close to an edge
+        if float(last) >= 0.9 and self.has_after:
+            self.fetching = True
+            self.tree.after_idle(self.load_next_page)
+        elif float(first) <= 0.1 and self.has_before:
+            self.fetching = True
+            self.tree.after_idle(self.load_previous_page)
+            
+    def top_index(self):
+        first = self.tree.yview()[0]
+        return int(round(first * len(self.tree.get_children())))
+        
+    def load_next_page(self):
+        if not self.pages:
+            self.fetching = False
+            return
+        
+        def show(rows):
+            self.fetching = False
+            rows, self.has_after = self.split_page(rows, False)
+            if not rows:
+                return
+            top = self.top_index()
+            self.pages.append(rows)
+            for row in rows:
+                self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+            
+            # Drop the page furthest away and keep the same rows in view
+            if len(self.pages) > self.max_pages:
+                dropped = self.pages.pop(0)
+                self.tree.delete(*[str(row[0]) for row in dropped])
+                self.has_before = True
+                top -= len(dropped)
+            self.tree.yview_moveto(max(top, 0) / max(len(self.tree.get_children()), 1))
+        
+        self.run_query(self.page_query(True, self.pages[-1][-1]), show)
+            
+    def load_previous_page(self):
+        if not self.pages:
+            self.fetching = False
+            return
+        
+        def show(rows):
+            self.fetching = False
+            rows, self.has_before = self.split_page(rows, True)
+            if not rows:
+                return
+            top = self.top_index() + len(rows)
+            self.pages.insert(0, rows)
+            for index, row in enumerate(rows):
+                self.tree.insert("", index, iid=str(row[0]), values=row)
+            
+            if len(self.pages) > self.max_pages:
+                dropped = self.pages.pop()
+                self.tree.delete(*[str(row[0]) for row in dropped])
+                self.has_after = True
+            self.tree.yview_moveto(top / max(len(self.tree.get_children()), 1))
+        
+        self.run_query(self.page_query(False, self.pages[0][0]), show)
+    
+    # Row level updates
+    def refresh_rows(self, ids):
+        # Re-read the given keys and insert, update or remove just those rows
+        ids = list(ids)
+        if not ids:
+            return
+        if self.loading:
+            self.pending.append(lambda: self.refresh_rows(ids))
+            return
+        placeholders = ", ".join("?" for _ in ids)
+        query, params = self.build_query([f"{self.key} IN ({placeholders})"], ids)
+        self.cursor.execute(query, params)
+        found = {row[0]: row for row in self.cursor.fetchall()}
+        
+        for row_id in ids:
+            row = found.get(row_id)
+            if row is None:
+                self.remove_row(row_id)
+            elif self.tree.exists(str(row_id)):
+                self.replace_row(row)
+            else:
+                self.insert_row(row)
+    
+    def refresh_related(self, condition, params):
+        # Re-read rows in the current window that match a condition, e.g. all
+        # enrollments showing a renamed student
+        if self.loading:
+            self.pending.append(lambda: self.refresh_related(condition, params))
+            return
+        keys = [row[0] for page in self.pages for row in page]
+        if not keys:
+            return
+        query, params = self.build_query(
+            [f"{self.key} IN ({', '.join('?' for _ in keys)})", f"({condition})"],
+            keys + list(params))
+        self.cursor.execute(query, params)
+        for row in self.cursor.fetchall():
+            if self.tree.exists(str(row[0])):
+                self.replace_row(row)
+    
+    def find_row(self, row_id):
+        for page in self.pages:
+            for position, row in enumerate(page):
+                if row[0] == row_id:
+                    return page, position
+        return None, None
+    
+    def replace_row(self, row):
+        page, position = self.find_row(row[0])
+        if page is not None and self.order_values(page[position]) != self.order_values(row):
+            # The change moved the row in the sort order
+            self.remove_row(row[0])
+            self.insert_row(row)
+            return
+        if page is not None:
+            page[position] = row
+        self.tree.item(str(row[0]), values=row)
+    
+    def remove_row(self, row_id):
+        page, position = self.find_row(row_id)
+        if page is not None:
+            page.pop(position)
+            if not page:
+                self.pages.remove(page)
+        if self.tree.exists(str(row_id)):
+            self.tree.delete(str(row_id))
+    
+    def insert_row(self, row):
+        key = row[0]
+        if self.ranked:
+            # Search results are a fixed set of rows
+            return
+        if not self.pages:
+            # Empty window, only show the row if nothing else is outside it
+            if self.has_before or self.has_after:
+                return
+            self.pages.append([row])
+            self.tree.insert("", tk.END, iid=str(key), values=row)
+            return
+        
+        # Rows outside the loaded range show up when their page is fetched
+        if self.comes_before(row, self.pages[0][0]) and self.has_before:
+            return
+        if self.comes_before(self.pages[-1][-1], row) and self.has_after:
+            return
+        
+        index = 0
+        target = self.pages[0]
+        for page in self.pages:
+            if self.comes_before(row, page[0]):
+                break
+            if target is not page:
+                index += len(target)
+            target = page
+        position = 0
+        while position < len(target) and self.comes_before(target[position], row):
+            position += 1
+        target.insert(position, row)
+        self.tree.insert("", index + position, iid=str(key), values=row)
+
+class ColumnFilters:
+    # A row of entries filtering a VirtualTable by its columns in the
+    # database as you type: "smi" matches values starting with smi, and
+    # ">= 2024-01-01", "< 60" or "= 3" compare
+    def __init__(self, parent, table, delay=SEARCH_DELAY_MS):
+        self.table = table
+        self.delay = delay
+        self.job = None
+        self.frame = tk.Frame(parent, bg="#f0f2f5")
+        self.entries = []
+        for heading in table.headings:
+            tk.Label(self.frame, text=f"{heading}:", bg="#f0f2f5").pack(side=tk.LEFT)
+            entry = tk.Entry(self.frame, width=12)
+            entry.pack(side=tk.LEFT, padx=(2, 8))
+            entry.bind("<KeyRelease>", self.on_key)
+            self.entries.append(entry)
+        tk.Button(self.frame, text="Clear", command=self.clear).pack(side=tk.LEFT)
+    
+    def on_key(self, event):
+        # Wait for typing to pause
+        if self.job:
+            self.frame.after_cancel(self.job)
+        self.job = self.frame.after(self.delay, self.apply)
+    
+    def apply(self):
+        self.job = None
+        self.table.set_filters({index: entry.get().strip() for index, entry in enumerate(self.entries)
+                                if entry.get().strip()})
+    
+    def clear(self):
+        for entry in self.entries:
+            entry.delete(0, tk.END)
+        self.apply()
+
+class ChoiceBox:
+    # A combobox choosing a row by id from a PrefixIndex. Typing narrows the
+    # drop-down to the best matches instead of listing every row, and the
+    # chosen label resolves to its id without going back to the database.
+    def __init__(self, combobox, index, limit=CHOICE_LIMIT):
+        self.combobox = combobox
+        self.index = index
+        self.limit = limit
+        combobox.configure(postcommand=self.update_choices)
+        combobox.bind("<KeyRelease>", self.on_key)
+    
+    def set_index(self, index):
+        self.index = index
+        self.update_choices()
+    
+    def update_choices(self):
+        self.combobox['values'] = self.index.complete(self.combobox.get(), self.limit)
+    
+    def on_key(self, event):
+        # Keys that move around the drop-down don't change the text
+        if event.keysym not in ("Up", "Down", "Return", "Escape", "Tab"):
+            self.update_choices()
+    
+    def selected_id(self):
+        return self.index.lookup(self.combobox.get())
+    
+    def text(self):
+        return self.combobox.get().strip()
+
+class GradeSheet:
+    # Spreadsheet-style editing of one column of a Treeview: an Entry is laid
+    # over the cell, Return/Tab/Down move on to the next row and Up back.
+    # Every value is checked by validate(row_id, text), which returns an error
+    # message or None, and invalid cells are highlighted where they are.
+    def __init__(self, tree, column, validate, on_change=None):
+        self.tree = tree
+        self.column = column
+        self.validate = validate
+        self.on_change = on_change
+        self.values = {}
+        self.errors = {}
+        self.editor = None
+        self.editing = None
+        tree.tag_configure("changed", background="#d5f5e3")
+        tree.tag_configure("invalid", background="#fadbd8")
+        tree.bind("<Double-1>", self.on_double_click)
+        tree.bind("<Return>", lambda event: self.edit(tree.focus()))
+    
+    def on_double_click(self, event):
+        row_id = self.tree.identify_row(event.y)
+        if row_id:
+            self.edit(row_id)
+    
+    def edit(self, row_id):
+        self.finish()
+        if not row_id:
+            return
+        self.tree.see(row_id)
+        self.tree.update_idletasks()
+        bbox = self.tree.bbox(row_id, self.column)
+        if not bbox:
+            return
+        x, y, width, height = bbox
+        self.editing = row_id
+        self.editor = tk.Entry(self.tree)
+        self.editor.insert(0, self.values.get(row_id, ""))
+        self.editor.select_range(0, tk.END)
+        self.editor.place(x=x, y=y, width=width, height=height)
+        self.editor.focus_set()
+        self.editor.bind("<Return>", lambda event: self.move(1))
+        self.editor.bind("<Tab>", lambda event: self.move(1))
+        self.editor.bind("<Down>", lambda event: self.move(1))
+        self.editor.bind("<Up>", lambda event: self.move(-1))
+        self.editor.bind("<Escape>", lambda event: self.finish(save=False))
+        self.editor.bind("<FocusOut>", lambda event: self.finish())
+    
+    def move(self, step):
+        row_id = self.editing
+        self.finish()
+        rows = self.tree.get_children()
+        position = rows.index(row_id) + step
+        if 0 <= position < len(rows):
+            self.tree.selection_set(rows[position])
+            self.tree.focus(rows[position])
+            self.edit(rows[position])
+        return "break"
+    
+    def finish(self, save=True):
+        if self.editor is None:
+            return
+        editor, row_id = self.editor, self.editing
+        self.editor = None
+        self.editing = None
+        if save:
+            self.set_value(row_id, editor.get())
+        editor.destroy()
+        self.tree.focus_set()
+    
+    def set_value(self, row_id, text):
+        text = text.strip()
+        self.values.pop(row_id, None)
+        self.errors.pop(row_id, None)
+        tags = ()
+        if text:
+            self.values[row_id] = text
+            error = self.validate(row_id, text)
+            if error:
+                self.errors[row_id] = error
+                tags = ("invalid",)
+            else:
+                tags = ("changed",)
+        self.tree.set(row_id, self.column, text)
+        self.tree.item(row_id, tags=tags)
+        if self.on_change is not None:
+            self.on_change()
+
 class AcademyManagementSystem:
     def __init__(self, root):
+        # Startup stages and their durations, for the startup report
+        self.startup_times = []
+        self.startup_clock = time.perf_counter()
+        
         self.root = root
         self.root.title("Academy Management System")
         self.root.geometry("1100x700")
         self.root.configure(bg="#f0f2f5")
         
         # Create database connection
-        self.conn = sqlite3.connect('academy.db')
+        self.conn = database.connect()
         self.cursor = self.conn.cursor()
+        self.service = services.AcademyService(self.conn)
         self.create_tables()
+        self.time_startup("database")
+        
+        # Background thread with its own connection for queries that can be slow
+        self.worker = DatabaseWorker(database.connect, self.show_worker_error)
+        self.root.after(WORKER_POLL_MS, self.poll_worker)
+        self.root.after(AUDIT_FLUSH_MS, self.flush_audit_log)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        
+        # Dashboard counters and combobox names, kept up to date by apply_changes
+        self.counts = {}
+        self.student_index = PrefixIndex()
+        self.course_index = PrefixIndex()
+        
+        # Pending debounced searches
+        self.student_search_job = None
+        self.course_search_job = None
         
         # Create main notebook (tabs)
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Create frames for each section
-        self.dashboard_frame = self.create_dashboard_frame()
-        self.students_frame = self.create_students_frame()
-        self.courses_frame = self.create_courses_frame()
-        self.enrollments_frame = self.create_enrollments_frame()
-        self.grades_frame = self.create_grades_frame()
-        
-        # Add frames to notebook
-        self.notebook.add(self.dashboard_frame, text='Dashboard')
-        self.notebook.add(self.students_frame, text='Students')
-        self.notebook.add(self.courses_frame, text='Courses')
-        self.notebook.add(self.enrollments_frame, text='Enrollments')
-        self.notebook.add(self.grades_frame, text='Grades')
-        
-        # Initialize data
-        self.load_students()
-        self.load_courses()
-        self.load_enrollments()
-        self.update_dashboard()
+        # One page per section. A page is built and its rows loaded the first
+        # time it is shown, so startup doesn't grow with the database; the
+        # dashboard only reads the counters kept by triggers.
+        self.tabs = {}
+        self.built_tabs = set()
+        for name, title, build, load in [
+            ("dashboard", "Dashboard", self.create_dashboard_frame, self.update_dashboard),
+            ("students", "Students", self.create_students_frame, lambda: self.reload_table("students")),
+            ("courses", "Courses", self.create_courses_frame, lambda: self.reload_table("courses")),
+            ("enrollments", "Enrollments", self.create_enrollments_frame, lambda: self.reload_table("enrollments")),
+            ("grades", "Grades", self.create_grades_frame, lambda: self.reload_table("grades")),
+            # The analytics are computed in on_tab_changed
+            ("analytics", "Analytics", self.create_analytics_frame, None),
+        ]:
+            frame = tk.Frame(self.root, bg="#f0f2f5")
+            setattr(self, f"{name}_frame", frame)
+            self.tabs[str(frame)] = (name, build, load)
+            self.notebook.add(frame, text=title)
+        
+        self.build_tab(str(self.dashboard_frame))
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.time_startup("dashboard")
+        
+        # Names for the comboboxes are indexed on the worker meanwhile
+        self.update_student_comboboxes()
+        self.update_course_comboboxes()
+        self.root.after_idle(self.report_startup)
         
     def create_tables(self):
-        # Create students table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                phone TEXT,
-                dob TEXT,
-                address TEXT,
-                enrollment_date TEXT DEFAULT CURRENT_DATE
-            )
-        ''')
-        
-        # Create courses table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS courses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                department TEXT,
-                credits INTEGER DEFAULT 3,
-                instructor TEXT,
-                schedule TEXT,
-                room TEXT
-            )
-        ''')
-        
-        # Create enrollments table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS enrollments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL,
-                course_id INTEGER NOT NULL,
-                enrollment_date TEXT DEFAULT CURRENT_DATE,
-                FOREIGN KEY (student_id) REFERENCES students (id),
-                FOREIGN KEY (course_id) REFERENCES courses (id)
-            )
-        ''')
-        
-        # Create grades table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS grades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                enrollment_id INTEGER NOT NULL,
-                grade REAL,
-                grade_date TEXT,
-                FOREIGN KEY (enrollment_id) REFERENCES enrollments (id)
-            )
-        ''')
-        
-        self.conn.commit()
+        # Create the schema or upgrade an existing database to the latest version
+        database.migrate(self.conn)
+    
+    def time_startup(self, stage):
+        now = time.perf_counter()
+        self.startup_times.append((stage, (now - self.startup_clock) * 1000))
+        self.startup_clock = now
+    
+    def report_startup(self):
+        # Runs once the window is first idle: show how long startup took on the
+        # dashboard, and keep a record in the activity log when over budget
+        self.time_startup("window")
+        total = sum(ms for stage, ms in self.startup_times)
+        report = f"Started in {total:.0f} ms (" + ", ".join(f"{stage} {ms:.0f} ms" for stage, ms in self.startup_times) + ")"
+        over_budget = total > STARTUP_BUDGET_MS
+        self.startup_label.config(text=report, fg="#e74c3c" if over_budget else "#7f8c8d")
+        if over_budget:
+            self.log_activity(f"Slow startup, budget {STARTUP_BUDGET_MS} ms: {report}")
+    
+    def build_tab(self, tab):
+        # Build a notebook page and load its rows, the first time only
+        name, build, load = self.tabs[tab]
+        if name in self.built_tabs:
+            return
+        self.built_tabs.add(name)
+        build(self.root.nametowidget(tab))
+        if load is not None:
+            load()
+    
+    def reload_table(self, name):
+        # Pages that haven't been built yet load their rows when first shown
+        if name in self.built_tabs:
+            getattr(self, f"{name}_table").reload()
+    
+    def poll_worker(self):
+        # Hand finished background queries to their callbacks on the Tk thread
+        self.worker.deliver()
+        self.root.after(WORKER_POLL_MS, self.poll_worker)
+    
+    def show_worker_error(self, error):
+        messagebox.showerror("Error", f"Database error: {str(error)}")
+    
+    def flush_audit_log(self):
+        # Write the activity logged since the last flush in one transaction
+        try:
+            self.service.audit.flush()
+        except Exception:
+            # E.g. the database is locked; the entries stay buffered and are
+            # written next time
+            pass
+        self.root.after(AUDIT_FLUSH_MS, self.flush_audit_log)
+    
+    def close(self):
+        self.worker.stop()
+        self.service.close()
+        self.root.destroy()
     
     # Dashboard Frame
-    def create_dashboard_frame(self):
-        frame = tk.Frame(self.root, bg="#f0f2f5")
+    def create_dashboard_frame(self, frame):
         
         # Header
         header = tk.Label(frame, text="Academy Dashboard", font=("Arial", 24, "bold"), bg="#f0f2f5", fg="#2c3e50")
@@ -112,22 +767,44 @@ class AcademyManagementSystem:
         self.student_count_label = self.create_stat_card(stats_frame, "Total Students", "0", "#3498db")
         self.course_count_label = self.create_stat_card(stats_frame, "Available Courses", "0", "#2ecc71")
         self.enrollment_count_label = self.create_stat_card(stats_frame, "Active Enrollments", "0", "#e74c3c")
+        self.grade_count_label = self.create_stat_card(stats_frame, "Grades Recorded", "0", "#f39c12")
+        
+        tk.Button(stats_frame, text="Check Counters", command=self.recount_stats).pack(side=tk.RIGHT, padx=10)
+        tk.Button(stats_frame, text="Clean Up Orphans", command=self.delete_orphans).pack(side=tk.RIGHT, padx=10)
+        tk.Button(stats_frame, text="Backups...", command=self.show_backups).pack(side=tk.RIGHT, padx=10)
+        tk.Button(stats_frame, text="Back Up Now", command=self.back_up_now).pack(side=tk.RIGHT, padx=10)
+        tk.Button(stats_frame, text="Diagnostics...", command=self.show_diagnostics).pack(side=tk.RIGHT, padx=10)
+        
+        # Department breakdown
+        department_frame = tk.LabelFrame(frame, text="Departments", font=("Arial", 12, "bold"), 
+                                        bg="#f0f2f5", fg="#2c3e50", padx=15, pady=10)
+        department_frame.pack(side=tk.RIGHT, pady=20, padx=(0, 20), fill='y')
+        
+        columns = ("Department", "Courses", "Enrollments")
+        self.departments_tree = ttk.Treeview(department_frame, columns=columns, show="headings", height=8)
+        for col in columns:
+            self.departments_tree.heading(col, text=col)
+            self.departments_tree.column(col, width=100, anchor=tk.W)
+        self.departments_tree.column("Department", width=160)
+        self.departments_tree.pack(fill='both', expand=True)
         
         # Recent activity frame
         activity_frame = tk.LabelFrame(frame, text="Recent Activity", font=("Arial", 12, "bold"), 
                                       bg="#f0f2f5", fg="#2c3e50", padx=15, pady=10)
         activity_frame.pack(pady=20, padx=20, fill='both', expand=True)
         
-        # Activity listbox
+        tk.Button(activity_frame, text="Audit Log...", command=self.show_audit_log).pack(anchor='e')
+        
+        # Activity listbox, starting with the latest entries of the audit log
         self.activity_listbox = tk.Listbox(activity_frame, height=8, font=("Arial", 10), 
                                          bg="white", fg="#333333", bd=0, highlightthickness=0)
         self.activity_listbox.pack(fill='both', expand=True, padx=5, pady=5)
+        for entry in self.service.audit.entries(limit=RECENT_ACTIVITY):
+            self.activity_listbox.insert(tk.END, f"[{entry.logged_at}] {entry.message}")
         
-        # Add sample activities
-        self.activity_listbox.insert(tk.END, "System initialized successfully")
-        self.activity_listbox.insert(tk.END, "Welcome to Academy Management System")
-        
-        return frame
+        # Filled in by report_startup
+        self.startup_label = tk.Label(frame, bg="#f0f2f5", fg="#7f8c8d", font=("Arial", 9), anchor='w')
+        self.startup_label.pack(fill='x', padx=20, pady=(0, 5))
     
     def create_stat_card(self, parent, title, value, color):
         card = tk.Frame(parent, bg="white", bd=1, relief=tk.RAISED, padx=20, pady=15)
@@ -142,8 +819,7 @@ class AcademyManagementSystem:
         return value_label
     
     # Students Frame
-    def create_students_frame(self):
-        frame = tk.Frame(self.root, bg="#f0f2f5")
+    def create_students_frame(self, frame):
         
         # Header
         header = tk.Label(frame, text="Student Management", font=("Arial", 18, "bold"), bg="#f0f2f5", fg="#2c3e50")
@@ -163,6 +839,8 @@ class AcademyManagementSystem:
                  command=self.add_student).pack(side=tk.RIGHT, padx=5)
         tk.Button(search_frame, text="Export CSV", bg="#27ae60", fg="white", font=("Arial", 10, "bold"), 
                  command=self.export_students_csv).pack(side=tk.RIGHT, padx=5)
+        tk.Button(search_frame, text="Import CSV", bg="#8e44ad", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.import_students_csv).pack(side=tk.RIGHT, padx=5)
         
         # Treeview for students
         columns = ("ID", "First Name", "Last Name", "Email", "Phone", "Enrollment Date")
@@ -177,8 +855,12 @@ class AcademyManagementSystem:
         self.students_tree.column("Enrollment Date", width=120)
         
         scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.students_tree.yview)
-        self.students_tree.configure(yscrollcommand=scrollbar.set)
+        self.students_table = VirtualTable(self.students_tree, self.cursor,
+                                  ["id", "first_name", "last_name", "email", "phone", "enrollment_date"], "students",
+                                  "id", worker=self.worker)
+        self.students_table.attach_scrollbar(scrollbar)
         
+        ColumnFilters(frame, self.students_table).frame.pack(fill='x', padx=20)
         self.students_tree.pack(fill='both', expand=True, padx=20, pady=10)
         scrollbar.pack(side=tk.RIGHT, fill='y')
         
@@ -187,13 +869,13 @@ class AcademyManagementSystem:
         self.student_menu.add_command(label="View Details", command=self.view_student_details)
         self.student_menu.add_command(label="Edit Student", command=self.edit_student)
         self.student_menu.add_command(label="Delete Student", command=self.delete_student)
+        self.student_menu.add_separator()
+        self.student_menu.add_command(label="Enroll Selected in Courses...", command=self.enroll_selected_students)
+        self.student_menu.add_command(label="Save Selection as Cohort...", command=self.save_cohort)
         self.students_tree.bind("<Button-3>", self.show_student_context_menu)
-        
-        return frame
     
     # Courses Frame
-    def create_courses_frame(self):
-        frame = tk.Frame(self.root, bg="#f0f2f5")
+    def create_courses_frame(self, frame):
         
         # Header
         header = tk.Label(frame, text="Course Management", font=("Arial", 18, "bold"), bg="#f0f2f5", fg="#2c3e50")
@@ -213,6 +895,10 @@ class AcademyManagementSystem:
                  command=self.add_course).pack(side=tk.RIGHT, padx=5)
         tk.Button(search_frame, text="Export CSV", bg="#27ae60", fg="white", font=("Arial", 10, "bold"), 
                  command=self.export_courses_csv).pack(side=tk.RIGHT, padx=5)
+        tk.Button(search_frame, text="Import CSV", bg="#8e44ad", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.import_courses_csv).pack(side=tk.RIGHT, padx=5)
+        tk.Button(search_frame, text="Conflicts", bg="#c0392b", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.show_schedule_conflicts).pack(side=tk.RIGHT, padx=5)
         
         # Treeview for courses
         columns = ("ID", "Code", "Name", "Department", "Credits", "Instructor")
@@ -227,8 +913,12 @@ class AcademyManagementSystem:
         self.courses_tree.column("Credits", width=70)
         
         scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.courses_tree.yview)
-        self.courses_tree.configure(yscrollcommand=scrollbar.set)
+        self.courses_table = VirtualTable(self.courses_tree, self.cursor,
+                                  ["id", "code", "name", "department", "credits", "instructor"], "courses", "id",
+                                  worker=self.worker)
+        self.courses_table.attach_scrollbar(scrollbar)
         
+        ColumnFilters(frame, self.courses_table).frame.pack(fill='x', padx=20)
         self.courses_tree.pack(fill='both', expand=True, padx=20, pady=10)
         scrollbar.pack(side=tk.RIGHT, fill='y')
         
@@ -238,12 +928,9 @@ class AcademyManagementSystem:
         self.course_menu.add_command(label="Edit Course", command=self.edit_course)
         self.course_menu.add_command(label="Delete Course", command=self.delete_course)
         self.courses_tree.bind("<Button-3>", self.show_course_context_menu)
-        
-        return frame
     
     # Enrollments Frame
-    def create_enrollments_frame(self):
-        frame = tk.Frame(self.root, bg="#f0f2f5")
+    def create_enrollments_frame(self, frame):
         
         # Header
         header = tk.Label(frame, text="Enrollment Management", font=("Arial", 18, "bold"), bg="#f0f2f5", fg="#2c3e50")
@@ -258,16 +945,24 @@ class AcademyManagementSystem:
         self.enrollment_student_var = tk.StringVar()
         self.student_combobox = ttk.Combobox(controls_frame, textvariable=self.enrollment_student_var, width=30)
         self.student_combobox.pack(side=tk.LEFT, padx=5)
+        self.student_choice = ChoiceBox(self.student_combobox, self.student_index)
         
         # Course selection
         tk.Label(controls_frame, text="Course:", bg="#f0f2f5").pack(side=tk.LEFT, padx=(20, 0))
         self.enrollment_course_var = tk.StringVar()
         self.course_combobox = ttk.Combobox(controls_frame, textvariable=self.enrollment_course_var, width=30)
         self.course_combobox.pack(side=tk.LEFT, padx=5)
+        self.course_choice = ChoiceBox(self.course_combobox, self.course_index)
         
         # Enroll button
         tk.Button(controls_frame, text="Enroll Student", bg="#3498db", fg="white", 
                  command=self.enroll_student).pack(side=tk.RIGHT, padx=5)
+        tk.Button(controls_frame, text="Batch Enroll", bg="#3498db", fg="white", 
+                 command=self.batch_enroll).pack(side=tk.RIGHT, padx=5)
+        tk.Button(controls_frame, text="Export CSV", bg="#27ae60", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.export_enrollments_csv).pack(side=tk.RIGHT, padx=5)
+        tk.Button(controls_frame, text="Import CSV", bg="#8e44ad", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.import_enrollments_csv).pack(side=tk.RIGHT, padx=5)
         
         # Treeview for enrollments
         columns = ("ID", "Student", "Course", "Department", "Enrollment Date")
@@ -283,8 +978,23 @@ class AcademyManagementSystem:
         self.enrollments_tree.column("Enrollment Date", width=120)
         
         scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.enrollments_tree.yview)
-        self.enrollments_tree.configure(yscrollcommand=scrollbar.set)
-        
+        # Sorting by student or course reads that table's index first and
+        # joins the enrollments to it, CROSS JOIN keeping SQLite to that order
+        by_student = "students s CROSS JOIN enrollments e ON e.student_id = s.id JOIN courses c ON e.course_id = c.id"
+        by_course = "courses c CROSS JOIN enrollments e ON e.course_id = c.id JOIN students s ON e.student_id = s.id"
+        self.enrollments_table = VirtualTable(
+            self.enrollments_tree, self.cursor,
+            ["e.id", "s.first_name || ' ' || s.last_name", "c.name", "c.department", "e.enrollment_date"],
+            "enrollments e JOIN students s ON e.student_id = s.id JOIN courses c ON e.course_id = c.id", "e.id",
+            sorts={
+                1: (["s.first_name || ' ' || s.last_name", "s.id", "e.course_id"], by_student),
+                2: (["c.name", "c.id"], by_course),
+                3: (["c.department", "c.id"], by_course),
+            },
+            worker=self.worker)
+        self.enrollments_table.attach_scrollbar(scrollbar)
+        
+        ColumnFilters(frame, self.enrollments_table).frame.pack(fill='x', padx=20)
         self.enrollments_tree.pack(fill='both', expand=True, padx=20, pady=10)
         scrollbar.pack(side=tk.RIGHT, fill='y')
         
@@ -294,12 +1004,9 @@ class AcademyManagementSystem:
         self.enrollment_menu.add_command(label="View Grades", command=self.view_grades)
         self.enrollment_menu.add_command(label="Unenroll", command=self.unenroll_student)
         self.enrollments_tree.bind("<Button-3>", self.show_enrollment_context_menu)
-        
-        return frame
     
     # Grades Frame
-    def create_grades_frame(self):
-        frame = tk.Frame(self.root, bg="#f0f2f5")
+    def create_grades_frame(self, frame):
         
         # Header
         header = tk.Label(frame, text="Grade Management", font=("Arial", 18, "bold"), bg="#f0f2f5", fg="#2c3e50")
@@ -315,6 +1022,8 @@ class AcademyManagementSystem:
         self.grade_course_combobox = ttk.Combobox(filter_frame, textvariable=self.grade_course_var, width=30)
         self.grade_course_combobox.pack(side=tk.LEFT, padx=5)
         self.grade_course_combobox.bind("<<ComboboxSelected>>", self.filter_grades)
+        self.grade_course_combobox.bind("<Return>", self.filter_grades)
+        self.grade_course_choice = ChoiceBox(self.grade_course_combobox, self.course_index)
         
         # Student filter
         tk.Label(filter_frame, text="Filter by Student:", bg="#f0f2f5").pack(side=tk.LEFT, padx=(20, 0))
@@ -322,6 +1031,15 @@ class AcademyManagementSystem:
         self.grade_student_combobox = ttk.Combobox(filter_frame, textvariable=self.grade_student_var, width=30)
         self.grade_student_combobox.pack(side=tk.LEFT, padx=5)
         self.grade_student_combobox.bind("<<ComboboxSelected>>", self.filter_grades)
+        self.grade_student_combobox.bind("<Return>", self.filter_grades)
+        self.grade_student_choice = ChoiceBox(self.grade_student_combobox, self.student_index)
+        
+        tk.Button(filter_frame, text="Export CSV", bg="#27ae60", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.export_grades_csv).pack(side=tk.RIGHT, padx=5)
+        tk.Button(filter_frame, text="Enter Grades", bg="#3498db", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.enter_grades).pack(side=tk.RIGHT, padx=5)
+        tk.Button(filter_frame, text="Import CSV", bg="#8e44ad", fg="white", font=("Arial", 10, "bold"), 
+                 command=self.import_grades_csv).pack(side=tk.RIGHT, padx=5)
         
         # Treeview for grades
         columns = ("ID", "Student", "Course", "Grade", "Date")
@@ -337,117 +1055,439 @@ class AcademyManagementSystem:
         self.grades_tree.column("Grade", width=80)
         
         scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.grades_tree.yview)
-        self.grades_tree.configure(yscrollcommand=scrollbar.set)
-        
+        self.grades_table = VirtualTable(
+            self.grades_tree, self.cursor,
+            ["g.id", "s.first_name || ' ' || s.last_name", "c.name", "g.grade", "g.grade_date"],
+            "grades g JOIN enrollments e ON g.enrollment_id = e.id JOIN students s ON e.student_id = s.id "
+            "JOIN courses c ON e.course_id = c.id", "g.id",
+            sorts={
+                1: (["s.first_name || ' ' || s.last_name", "s.id", "e.course_id"],
+                    "students s CROSS JOIN enrollments e ON e.student_id = s.id "
+                    "CROSS JOIN grades g ON g.enrollment_id = e.id JOIN courses c ON e.course_id = c.id"),
+                2: (["c.name", "c.id", "e.id"],
+                    "courses c CROSS JOIN enrollments e ON e.course_id = c.id "
+                    "CROSS JOIN grades g ON g.enrollment_id = e.id JOIN students s ON e.student_id = s.id"),
+            },
+            worker=self.worker)
+        self.grades_table.attach_scrollbar(scrollbar)
+        
+        ColumnFilters(frame, self.grades_table).frame.pack(fill='x', padx=20)
         self.grades_tree.pack(fill='both', expand=True, padx=20, pady=10)
         scrollbar.pack(side=tk.RIGHT, fill='y')
+    
+    # Analytics Frame
+    def create_analytics_frame(self, frame):
+        self.analytics_loaded = False
+        
+        # Header
+        header = tk.Label(frame, text="Grade Analytics", font=("Arial", 18, "bold"), bg="#f0f2f5", fg="#2c3e50")
+        header.pack(pady=10)
         
-        return frame
+        controls_frame = tk.Frame(frame, bg="#f0f2f5")
+        controls_frame.pack(fill='x', padx=20, pady=5)
+        self.analytics_summary_label = tk.Label(controls_frame, bg="#f0f2f5", font=("Arial", 10), anchor='w', justify=tk.LEFT)
+        self.analytics_summary_label.pack(side=tk.LEFT, fill='x', expand=True)
+        recompute_button = tk.Button(controls_frame, text="Recompute", bg="#3498db", fg="white",
+                                     font=("Arial", 10, "bold"), command=self.update_analytics)
+        recompute_button.pack(side=tk.RIGHT, padx=5)
+        
+        if not analytics.available():
+            # Said once here in the tab rather than each time it is shown
+            self.analytics_summary_label.config(text="Grade analytics need NumPy. Install it with: pip install numpy")
+            recompute_button.config(state=tk.DISABLED)
+            return
+        
+        # Grade distribution
+        distribution_frame = tk.LabelFrame(frame, text="Grade Distribution", font=("Arial", 12, "bold"), 
+                                          bg="#f0f2f5", fg="#2c3e50", padx=10, pady=5)
+        distribution_frame.pack(fill='x', padx=20, pady=5)
+        self.histogram_canvas = tk.Canvas(distribution_frame, height=140, bg="white", highlightthickness=0)
+        self.histogram_canvas.pack(fill='x', expand=True)
+        
+        tables_frame = tk.Frame(frame, bg="#f0f2f5")
+        tables_frame.pack(fill='both', expand=True, padx=20, pady=5)
+        
+        # Per-course statistics
+        course_frame = tk.LabelFrame(tables_frame, text="Courses", font=("Arial", 12, "bold"), 
+                                    bg="#f0f2f5", fg="#2c3e50", padx=10, pady=5)
+        course_frame.pack(side=tk.LEFT, fill='both', expand=True, padx=(0, 10))
+        columns = ("Code", "Course", "Grades", "Mean", "Median", "Std Dev", "Min", "Max")
+        self.course_stats_tree = ttk.Treeview(course_frame, columns=columns, show="headings", height=10)
+        for col in columns:
+            self.course_stats_tree.heading(col, text=col)
+            self.course_stats_tree.column(col, width=60, anchor=tk.E)
+        self.course_stats_tree.column("Code", width=70, anchor=tk.W)
+        self.course_stats_tree.column("Course", width=150, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(course_frame, orient="vertical", command=self.course_stats_tree.yview)
+        self.course_stats_tree.configure(yscrollcommand=scrollbar.set)
+        self.course_stats_tree.pack(side=tk.LEFT, fill='both', expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+        
+        # Students with the best GPA
+        student_frame = tk.LabelFrame(tables_frame, text=f"Top {TOP_STUDENTS} Students", font=("Arial", 12, "bold"), 
+                                     bg="#f0f2f5", fg="#2c3e50", padx=10, pady=5)
+        student_frame.pack(side=tk.LEFT, fill='both', expand=True)
+        columns = ("Student", "GPA", "Average", "Credits")
+        self.gpa_tree = ttk.Treeview(student_frame, columns=columns, show="headings", height=10)
+        for col in columns:
+            self.gpa_tree.heading(col, text=col)
+            self.gpa_tree.column(col, width=70, anchor=tk.E)
+        self.gpa_tree.column("Student", width=180, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(student_frame, orient="vertical", command=self.gpa_tree.yview)
+        self.gpa_tree.configure(yscrollcommand=scrollbar.set)
+        self.gpa_tree.pack(side=tk.LEFT, fill='both', expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+    
+    def on_tab_changed(self, event):
+        self.build_tab(self.notebook.select())
+        
+        # The analytics are computed the first time the tab is shown
+        if self.notebook.select() == str(self.analytics_frame) and not self.analytics_loaded:
+            self.update_analytics()
+    
+    def update_analytics(self):
+        if not analytics.available():
+            return
+        self.analytics_loaded = True
+        self.analytics_summary_label.config(text="Computing...")
+        
+        def compute(conn):
+            report = analytics.summary(conn, top_students=TOP_STUDENTS)
+            courses = services.CourseRepository(conn)
+            students = services.StudentRepository(conn)
+            for course in report["courses"]:
+                found = courses.get(course["course_id"])
+                course["code"], course["name"] = (found.code, found.name) if found else ("", "")
+            for student in report["students"]:
+                student["name"] = students.full_name(student["student_id"]) or ""
+            return report
+        
+        self.worker.submit(compute, self.show_analytics, key="analytics")
+    
+    def show_analytics(self, report):
+        def number(value):
+            return "" if value is None else f"{value:.1f}"
+        
+        text = f"{report['grades']} grades    mean {number(report['mean'])}    std dev {number(report['stddev'])}"
+        text += "    percentiles " + "  ".join(f"P{point}: {number(value)}" for point, value in report["percentiles"].items())
+        self.analytics_summary_label.config(text=text)
+        
+        self.course_stats_tree.delete(*self.course_stats_tree.get_children())
+        for course in report["courses"]:
+            self.course_stats_tree.insert("", tk.END, values=(
+                course["code"], course["name"], course["count"], number(course["mean"]), number(course["median"]),
+                number(course["stddev"]), number(course["min"]), number(course["max"])))
+        
+        self.gpa_tree.delete(*self.gpa_tree.get_children())
+        for student in report["students"]:
+            gpa = "" if student["gpa"] is None else f"{student['gpa']:.2f}"
+            self.gpa_tree.insert("", tk.END, values=(student["name"], gpa, number(student["average"]),
+                                                     f"{student['credits']:g}"))
+        
+        self.draw_histogram(*report["histogram"])
+    
+    def draw_histogram(self, counts, edges):
+        canvas = self.histogram_canvas
+        canvas.delete("all")
+        canvas.update_idletasks()
+        width = max(canvas.winfo_width(), 400)
+        height = int(canvas["height"])
+        top = max(counts) or 1
+        bar_width = width / len(counts)
+        for index, count in enumerate(counts):
+            bar_height = (height - 30) * count / top
+            x = index * bar_width
+            canvas.create_rectangle(x + 4, height - 18 - bar_height, x + bar_width - 4, height - 18,
+                                    fill="#3498db", outline="")
+            canvas.create_text(x + bar_width / 2, height - 8, text=f"{edges[index]:g}-{edges[index + 1]:g}",
+                               font=("Arial", 8))
+            canvas.create_text(x + bar_width / 2, height - 24 - bar_height, text=str(count), font=("Arial", 8))
     
     # Data loading methods
     def load_students(self):
-        # Clear the treeview
-        for item in self.students_tree.get_children():
-            self.students_tree.delete(item)
-        
-        # Fetch students from database
-        self.cursor.execute("SELECT id, first_name, last_name, email, phone, enrollment_date FROM students")
-        students = self.cursor.fetchall()
-        
-        # Insert into treeview
-        for student in students:
-            self.students_tree.insert("", tk.END, values=student)
+        # Only the first page is fetched, more pages load while scrolling
+        self.reload_table("students")
             
         # Update comboboxes
         self.update_student_comboboxes()
         
     def load_courses(self):
-        # Clear the treeview
-        for item in self.courses_tree.get_children():
-            self.courses_tree.delete(item)
-        
-        # Fetch courses from database
-        self.cursor.execute("SELECT id, code, name, department, credits, instructor FROM courses")
-        courses = self.cursor.fetchall()
-        
-        # Insert into treeview
-        for course in courses:
-            self.courses_tree.insert("", tk.END, values=course)
+        self.reload_table("courses")
             
         # Update comboboxes
         self.update_course_comboboxes()
         
     def load_enrollments(self):
-        # Clear the treeview
-        for item in self.enrollments_tree.get_children():
-            self.enrollments_tree.delete(item)
-        
-        # Fetch enrollments from database
-        self.cursor.execute('''
-            SELECT e.id, s.first_name || ' ' || s.last_name, c.name, c.department, e.enrollment_date
-            FROM enrollments e
-            JOIN students s ON e.student_id = s.id
-            JOIN courses c ON e.course_id = c.id
-        ''')
-        enrollments = self.cursor.fetchall()
-        
-        # Insert into treeview
-        for enrollment in enrollments:
-            self.enrollments_tree.insert("", tk.END, values=enrollment)
+        self.reload_table("enrollments")
             
         # Load grades
         self.load_grades()
         
     def load_grades(self):
-        # Clear the treeview
-        for item in self.grades_tree.get_children():
-            self.grades_tree.delete(item)
-        
-        # Fetch grades from database
-        self.cursor.execute('''
-            SELECT g.id, s.first_name || ' ' || s.last_name, c.name, g.grade, g.grade_date
-            FROM grades g
-            JOIN enrollments e ON g.enrollment_id = e.id
-            JOIN students s ON e.student_id = s.id
-            JOIN courses c ON e.course_id = c.id
-        ''')
-        grades = self.cursor.fetchall()
-        
-        # Insert into treeview
-        for grade in grades:
-            self.grades_tree.insert("", tk.END, values=grade)
+        self.reload_table("grades")
         
     def update_student_comboboxes(self):
-        self.cursor.execute("SELECT id, first_name || ' ' || last_name FROM students")
-        students = self.cursor.fetchall()
-        student_dict = {name: id for id, name in students}
-        
-        self.student_combobox['values'] = [name for id, name in students]
-        self.grade_student_combobox['values'] = [name for id, name in students]
+        # The index is sorted on the worker, only the finished one is handed over
+        def show(index):
+            self.student_index = index
+            self.set_student_choices()
         
+        self.worker.submit(lambda conn: PrefixIndex(services.StudentRepository(conn).names()),
+                           show, key="student_names")
+    
     def update_course_comboboxes(self):
-        self.cursor.execute("SELECT id, name FROM courses")
-        courses = self.cursor.fetchall()
-        course_dict = {name: id for id, name in courses}
-        
-        self.course_combobox['values'] = [name for id, name in courses]
-        self.grade_course_combobox['values'] = [name for id, name in courses]
+        def show(index):
+            self.course_index = index
+            self.set_course_choices()
         
+        self.worker.submit(lambda conn: PrefixIndex(services.CourseRepository(conn).names()),
+                           show, key="course_names")
+    
+    def set_student_choices(self):
+        # Comboboxes of pages built later start from the current index
+        if "enrollments" in self.built_tabs:
+            self.student_choice.set_index(self.student_index)
+        if "grades" in self.built_tabs:
+            self.grade_student_choice.set_index(self.student_index)
+    
+    def set_course_choices(self):
+        if "enrollments" in self.built_tabs:
+            self.course_choice.set_index(self.course_index)
+        if "grades" in self.built_tabs:
+            self.grade_course_choice.set_index(self.course_index)
+    
     def update_dashboard(self):
-        # Update student count
-        self.cursor.execute("SELECT COUNT(*) FROM students")
-        student_count = self.cursor.fetchone()[0]
-        self.student_count_label.config(text=str(student_count))
+        # Counters are kept up to date by triggers, reading them is one small lookup
+        self.counts, departments = self.service.stats()
         
-        # Update course count
-        self.cursor.execute("SELECT COUNT(*) FROM courses")
-        course_count = self.cursor.fetchone()[0]
-        self.course_count_label.config(text=str(course_count))
+        self.student_count_label.config(text=str(self.counts.get("students", 0)))
+        self.course_count_label.config(text=str(self.counts.get("courses", 0)))
+        self.enrollment_count_label.config(text=str(self.counts.get("enrollments", 0)))
+        self.grade_count_label.config(text=str(self.counts.get("grades", 0)))
         
-        # Update enrollment count
-        self.cursor.execute("SELECT COUNT(*) FROM enrollments")
-        enrollment_count = self.cursor.fetchone()[0]
-        self.enrollment_count_label.config(text=str(enrollment_count))
+        self.departments_tree.delete(*self.departments_tree.get_children())
+        for department, courses, enrollments in departments:
+            self.departments_tree.insert("", tk.END, values=(department or "(none)", courses, enrollments))
+    
+    def recount_stats(self):
+        # Rebuild the counters and grade totals from the tables on the worker
+        # and report counters that had drifted
+        def recount(conn):
+            try:
+                cursor = conn.cursor()
+                mismatches = database.recount_stats(cursor)
+                database.rebuild_grade_stats(cursor)
+                conn.commit()
+                return mismatches
+            except Exception:
+                conn.rollback()
+                raise
+        
+        def show(mismatches):
+            self.update_dashboard()
+            if not mismatches:
+                messagebox.showinfo("Counters", "All counters are correct.")
+                return
+            lines = [f"{name}: {stored} -> {actual}" for name, (stored, actual) in sorted(mismatches.items())]
+            self.log_activity(f"Repaired {len(mismatches)} dashboard counters")
+            messagebox.showwarning("Counters", "Repaired counters:\n" + "\n".join(lines))
+        
+        self.worker.submit(recount, show, key="recount")
+    
+    def delete_orphans(self):
+        # Purge enrollments and grades left without their student, course or
+        # enrollment, on the worker
+        def purge(conn):
+            with database.transaction(conn) as cursor:
+                return database.delete_orphans(cursor)
+        
+        def show(deleted):
+            if not any(deleted.values()):
+                messagebox.showinfo("Orphans", "No orphaned rows found.")
+                return
+            self.load_enrollments()
+            self.update_dashboard()
+            lines = [f"{table}: {count}" for table, count in deleted.items() if count]
+            self.log_activity(f"Deleted {sum(deleted.values())} orphaned rows")
+            messagebox.showinfo("Orphans", "Deleted orphaned rows:\n" + "\n".join(lines))
+        
+        self.worker.submit(purge, show, key="orphans")
+    
+    def back_up_now(self, finished=None):
+        # Snapshot the database on its own thread; the window and the worker
+        # keep reading and writing while the pages are copied. Logged activity
+        # is written out first so the snapshot has it.
+        self.service.audit.flush()
+        
+        def work(conn, progress, cancelled):
+            return backup.backup(conn, progress=lambda done, total: progress(f"{done} of {total} pages copied", done, total),
+                                 cancelled=cancelled)
+        
+        def done(path):
+            if path is None:
+                self.log_activity("Cancelled backup")
+            else:
+                self.log_activity(f"Backed up the database to {os.path.basename(path)}")
+            if finished is not None:
+                finished(path)
+        
+        self.run_in_background("Backing Up", work, done, "Error backing up the database")
+    
+    def show_backups(self):
+        # The snapshots kept for this database, newest first, to take, verify
+        # or restore
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Backups")
+        dialog.geometry("650x400")
+        dialog.transient(self.root)
+        
+        directory_label = tk.Label(dialog, text=backup.snapshot_directory(self.conn), anchor='w')
+        directory_label.pack(fill='x', padx=10, pady=5)
+        
+        columns = ("Taken", "Size", "Compressed")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=150)
+        scrollbar = ttk.Scrollbar(dialog, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        buttons = tk.Frame(dialog)
+        buttons.pack(side=tk.BOTTOM, fill='x', padx=10, pady=5)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+        tree.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        def load():
+            if not dialog.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for snapshot in reversed(backup.snapshots(self.conn)):
+                tree.insert("", tk.END, iid=snapshot.path,
+                            values=(f"{snapshot.taken:%Y-%m-%d %H:%M:%S}", backup.format_size(snapshot.size),
+                                    "Yes" if snapshot.compressed else "No"))
+        
+        def selected():
+            selection = tree.selection()
+            if not selection:
+                messagebox.showwarning("Warning", "Please select a backup", parent=dialog)
+                return None
+            return selection[0]
+        
+        def verify():
+            path = selected()
+            if path is None:
+                return
+            
+            def work(conn, progress, cancelled):
+                progress(f"Checking {os.path.basename(path)}...", 0, None)
+                return backup.verify(path)
+            
+            def finished(problems):
+                name = os.path.basename(path)
+                if problems:
+                    self.log_activity(f"Backup {name} failed its integrity check")
+                    messagebox.showerror("Verify", f"{name} is damaged:\n" + "\n".join(problems[:10]))
+                else:
+                    messagebox.showinfo("Verify", f"{name} passed its integrity check.")
+            
+            self.run_in_background("Verifying Backup", work, finished, "Error verifying the backup")
+        
+        def restore():
+            path = selected()
+            if path is None:
+                return
+            if not messagebox.askyesno("Confirm", "Replace all data with this backup? The current data is backed up "
+                                       "first.", parent=dialog):
+                return
+            
+            def work(conn, progress, cancelled):
+                progress("Checking the backup...", 0, None)
+                return backup.restore(path, conn,
+                                      lambda done, total: progress(f"{done} of {total} pages restored", done, total))
+            
+            def finished(saved):
+                self.reload_all()
+                self.log_activity(f"Restored the database from {os.path.basename(path)}")
+                load()
+                messagebox.showinfo("Restore", f"Restored {os.path.basename(path)}. The previous data was saved as "
+                                    f"{os.path.basename(saved)}.")
+            
+            self.run_in_background("Restoring Backup", work, finished, "Error restoring the backup")
+        
+        tk.Button(buttons, text="Back Up Now", width=12, command=lambda: self.back_up_now(lambda path: load())).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Verify", width=10, command=verify).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Restore", width=10, command=restore).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Close", width=10, command=dialog.destroy).pack(side=tk.RIGHT)
+        
+        load()
+    
+    def reload_all(self):
+        # After the whole database changed underneath, e.g. a restore
+        self.load_students()
+        self.load_courses()
+        self.load_enrollments()
+        self.update_dashboard()
+    
+    # Change tracking methods
+    def apply_changes(self, changes):
+        # Apply (table, action, row id) changes to the views showing them
+        # instead of reloading whole tables after a mutation
+        changed = {}
+        for table, action, row_id in changes:
+            changed.setdefault(table, []).append(row_id)
+            
+            # Names shown in other tabs and in the comboboxes
+            if table == "students":
+                self.apply_student_name(action, row_id)
+            elif table == "courses":
+                self.apply_course_name(action, row_id)
+        
+        # Pages not built yet show the changes when they first load
+        for table, ids in changed.items():
+            if table in self.built_tabs:
+                getattr(self, f"{table}_table").refresh_rows(ids)
+        self.update_dashboard()
+    
+    def apply_deletes(self, changes):
+        # A few deleted rows are taken out of the views, a large batch reloads
+        # the tables it touched
+        if len(changes) <= PAGE_SIZE:
+            self.apply_changes(changes)
+            return
+        tables = {table for table, action, row_id in changes}
+        if "students" in tables:
+            self.load_students()
+        if "courses" in tables:
+            self.load_courses()
+        if "enrollments" in tables:
+            self.reload_table("enrollments")
+        if "grades" in tables:
+            self.reload_table("grades")
+        self.update_dashboard()
+    
+    def apply_student_name(self, action, student_id):
+        if action == "delete":
+            self.student_index.remove(student_id)
+        else:
+            self.student_index.add(student_id, self.service.students.full_name(student_id))
+            if action == "update":
+                if "enrollments" in self.built_tabs:
+                    self.enrollments_table.refresh_related("s.id = ?", (student_id,))
+                if "grades" in self.built_tabs:
+                    self.grades_table.refresh_related("s.id = ?", (student_id,))
+        self.set_student_choices()
+    
+    def apply_course_name(self, action, course_id):
+        if action == "delete":
+            self.course_index.remove(course_id)
+        else:
+            self.course_index.add(course_id, self.service.courses.name(course_id))
+            if action == "update":
+                if "enrollments" in self.built_tabs:
+                    self.enrollments_table.refresh_related("c.id = ?", (course_id,))
+                if "grades" in self.built_tabs:
+                    self.grades_table.refresh_related("c.id = ?", (course_id,))
+        self.set_course_choices()
     
     # Student management methods
     def add_student(self):
@@ -489,23 +1529,15 @@ class AcademyManagementSystem:
             dob = dob_entry.get()
             address = address_entry.get()
             
-            if not first_name or not last_name or not email:
-                messagebox.showerror("Error", "First name, last name, and email are required!")
-                return
-            
             try:
-                self.cursor.execute('''
-                    INSERT INTO students (first_name, last_name, email, phone, dob, address)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (first_name, last_name, email, phone, dob, address))
-                self.conn.commit()
-                self.load_students()
-                self.update_dashboard()
-                dialog.destroy()
-                self.log_activity(f"Added student: {first_name} {last_name}")
-                messagebox.showinfo("Success", "Student added successfully!")
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Email must be unique!")
+                student_id = self.service.students.add(first_name, last_name, email, phone, dob, address)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.apply_changes([("students", "insert", student_id)])
+            dialog.destroy()
+            self.log_activity(f"Added student: {first_name} {last_name}", "students", student_id)
+            messagebox.showinfo("Success", "Student added successfully!")
         
         tk.Button(dialog, text="Save", width=10, command=save_student).grid(row=6, column=1, pady=20, sticky='e')
     
@@ -518,8 +1550,7 @@ class AcademyManagementSystem:
         student_id = self.students_tree.item(selected_item)['values'][0]
         
         # Fetch student details
-        self.cursor.execute("SELECT * FROM students WHERE id=?", (student_id,))
-        student = self.cursor.fetchone()
+        student = self.service.students.get(student_id)
         
         dialog = tk.Toplevel(self.root)
         dialog.title("Edit Student")
@@ -565,48 +1596,41 @@ class AcademyManagementSystem:
             dob = dob_entry.get()
             address = address_entry.get()
             
-            if not first_name or not last_name or not email:
-                messagebox.showerror("Error", "First name, last name, and email are required!")
-                return
-            
             try:
-                self.cursor.execute('''
-                    UPDATE students 
-                    SET first_name=?, last_name=?, email=?, phone=?, dob=?, address=?
-                    WHERE id=?
-                ''', (first_name, last_name, email, phone, dob, address, student_id))
-                self.conn.commit()
-                self.load_students()
-                self.update_dashboard()
-                dialog.destroy()
-                self.log_activity(f"Updated student: {first_name} {last_name}")
-                messagebox.showinfo("Success", "Student updated successfully!")
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Email must be unique!")
+                changes = self.service.students.update(student_id, first_name, last_name, email, phone, dob, address)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.apply_changes(changes)
+            dialog.destroy()
+            self.log_activity(f"Updated student: {first_name} {last_name}", "students", student_id)
+            messagebox.showinfo("Success", "Student updated successfully!")
         
         tk.Button(dialog, text="Save", width=10, command=save_changes).grid(row=6, column=1, pady=20, sticky='e')
     
     def delete_student(self):
-        selected_item = self.students_tree.selection()
-        if not selected_item:
+        student_ids = self.selected_student_ids()
+        if not student_ids:
             messagebox.showinfo("Info", "Please select a student to delete")
             return
-            
-        student_id = self.students_tree.item(selected_item)['values'][0]
-        student_name = self.students_tree.item(selected_item)['values'][1] + " " + \
-                      self.students_tree.item(selected_item)['values'][2]
         
-        if messagebox.askyesno("Confirm", f"Are you sure you want to delete {student_name}?"):
+        if len(student_ids) == 1:
+            values = self.students_tree.item(student_ids[0])['values']
+            description = values[1] + " " + values[2]
+        else:
+            description = f"{len(student_ids)} students"
+        
+        if messagebox.askyesno("Confirm", f"Are you sure you want to delete {description}?"):
             try:
-                # First delete enrollments and grades for this student
-                self.cursor.execute("DELETE FROM enrollments WHERE student_id=?", (student_id,))
-                self.cursor.execute("DELETE FROM students WHERE id=?", (student_id,))
-                self.conn.commit()
-                self.load_students()
-                self.load_enrollments()
-                self.update_dashboard()
-                self.log_activity(f"Deleted student: {student_name}")
-                messagebox.showinfo("Success", "Student deleted successfully!")
+                # Enrollments and grades in other tabs go away with the students
+                changes = self.service.students.delete_many(student_ids)
+                self.apply_deletes(changes)
+                if len(student_ids) == 1:
+                    self.log_activity(f"Deleted student: {description}", "students", student_ids[0])
+                else:
+                    self.log_activity(f"Deleted {description}", "students")
+                messagebox.showinfo("Success", "Student deleted successfully!" if len(student_ids) == 1
+                                    else f"{len(student_ids)} students deleted successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Error deleting student: {str(e)}")
     
@@ -619,21 +1643,14 @@ class AcademyManagementSystem:
         student_id = self.students_tree.item(selected_item)['values'][0]
         
         # Fetch student details
-        self.cursor.execute("SELECT * FROM students WHERE id=?", (student_id,))
-        student = self.cursor.fetchone()
+        student = self.service.students.get(student_id)
         
         # Fetch enrollments
-        self.cursor.execute('''
-            SELECT c.code, c.name, e.enrollment_date 
-            FROM enrollments e
-            JOIN courses c ON e.course_id = c.id
-            WHERE e.student_id=?
-        ''', (student_id,))
-        enrollments = self.cursor.fetchall()
+        enrollments = self.service.students.enrollments(student_id)
         
         dialog = tk.Toplevel(self.root)
         dialog.title("Student Details")
-        dialog.geometry("500x400")
+        dialog.geometry("500x430")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -646,6 +1663,15 @@ class AcademyManagementSystem:
             tk.Label(info_frame, text=label, font=("Arial", 10, "bold")).grid(row=i, column=0, sticky='e', padx=5, pady=2)
             tk.Label(info_frame, text=student[i] if i < len(student) else "").grid(row=i, column=1, sticky='w', padx=5, pady=2)
         
+        # Running totals kept by triggers, nothing is aggregated here
+        stats = self.service.grades.student_stats(student_id)
+        if stats and stats[0].gpa is not None:
+            summary = f"GPA {stats[0].gpa:.2f}, average {stats[0].average:.1f} over {stats[0].grades} grades"
+        else:
+            summary = "No grades recorded"
+        tk.Label(info_frame, text="Grades:", font=("Arial", 10, "bold")).grid(row=len(labels), column=0, sticky='e', padx=5, pady=2)
+        tk.Label(info_frame, text=summary).grid(row=len(labels), column=1, sticky='w', padx=5, pady=2)
+        
         # Enrollments frame
         enroll_frame = tk.LabelFrame(dialog, text="Enrollments", padx=10, pady=10)
         enroll_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -715,29 +1741,15 @@ class AcademyManagementSystem:
             schedule = schedule_entry.get()
             room = room_entry.get()
             
-            if not code or not name:
-                messagebox.showerror("Error", "Course code and name are required!")
+            course_id = self.confirm_conflicts(lambda check: self.service.courses.add(
+                code, name, department, credits, instructor, schedule, room, check_conflicts=check), dialog)
+            if course_id is None:
                 return
-            
-            try:
-                credits = int(credits) if credits else 3
-            except ValueError:
-                messagebox.showerror("Error", "Credits must be a number")
-                return
-            
-            try:
-                self.cursor.execute('''
-                    INSERT INTO courses (code, name, department, credits, instructor, schedule, room)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (code, name, department, credits, instructor, schedule, room))
-                self.conn.commit()
-                self.load_courses()
-                self.update_dashboard()
-                dialog.destroy()
-                self.log_activity(f"Added course: {code} - {name}")
+            self.apply_changes([("courses", "insert", course_id)])
+            dialog.destroy()
+            self.log_activity(f"Added course: {code} - {name}", "courses", course_id)
+            if not self.warn_unreadable_schedule(schedule, "added"):
                 messagebox.showinfo("Success", "Course added successfully!")
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Course code must be unique!")
         
         tk.Button(dialog, text="Save", width=10, command=save_course).grid(row=7, column=1, pady=20, sticky='e')
     
@@ -750,8 +1762,7 @@ class AcademyManagementSystem:
         course_id = self.courses_tree.item(selected_item)['values'][0]
         
         # Fetch course details
-        self.cursor.execute("SELECT * FROM courses WHERE id=?", (course_id,))
-        course = self.cursor.fetchone()
+        course = self.service.courses.get(course_id)
         
         dialog = tk.Toplevel(self.root)
         dialog.title("Edit Course")
@@ -803,53 +1814,40 @@ class AcademyManagementSystem:
             schedule = schedule_entry.get()
             room = room_entry.get()
             
-            if not code or not name:
-                messagebox.showerror("Error", "Course code and name are required!")
-                return
-            
-            try:
-                credits = int(credits) if credits else 3
-            except ValueError:
-                messagebox.showerror("Error", "Credits must be a number")
+            changes = self.confirm_conflicts(lambda check: self.service.courses.update(
+                course_id, code, name, department, credits, instructor, schedule, room, check_conflicts=check), dialog)
+            if changes is None:
                 return
-            
-            try:
-                self.cursor.execute('''
-                    UPDATE courses 
-                    SET code=?, name=?, department=?, credits=?, instructor=?, schedule=?, room=?
-                    WHERE id=?
-                ''', (code, name, department, credits, instructor, schedule, room, course_id))
-                self.conn.commit()
-                self.load_courses()
-                self.update_dashboard()
-                dialog.destroy()
-                self.log_activity(f"Updated course: {code} - {name}")
+            self.apply_changes(changes)
+            dialog.destroy()
+            self.log_activity(f"Updated course: {code} - {name}", "courses", course_id)
+            if schedule == course[6] or not self.warn_unreadable_schedule(schedule, "updated"):
                 messagebox.showinfo("Success", "Course updated successfully!")
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Course code must be unique!")
         
         tk.Button(dialog, text="Save", width=10, command=save_changes).grid(row=7, column=1, pady=20, sticky='e')
     
     def delete_course(self):
-        selected_item = self.courses_tree.selection()
-        if not selected_item:
+        # Rows of the courses view are keyed by course id
+        course_ids = [int(item) for item in self.courses_tree.selection()]
+        if not course_ids:
             messagebox.showinfo("Info", "Please select a course to delete")
             return
-            
-        course_id = self.courses_tree.item(selected_item)['values'][0]
-        course_name = self.courses_tree.item(selected_item)['values'][2]
         
-        if messagebox.askyesno("Confirm", f"Are you sure you want to delete {course_name}?"):
+        if len(course_ids) == 1:
+            description = self.courses_tree.item(course_ids[0])['values'][2]
+        else:
+            description = f"{len(course_ids)} courses"
+        
+        if messagebox.askyesno("Confirm", f"Are you sure you want to delete {description}?"):
             try:
-                # First delete enrollments and grades for this course
-                self.cursor.execute("DELETE FROM enrollments WHERE course_id=?", (course_id,))
-                self.cursor.execute("DELETE FROM courses WHERE id=?", (course_id,))
-                self.conn.commit()
-                self.load_courses()
-                self.load_enrollments()
-                self.update_dashboard()
-                self.log_activity(f"Deleted course: {course_name}")
-                messagebox.showinfo("Success", "Course deleted successfully!")
+                changes = self.service.courses.delete_many(course_ids)
+                self.apply_deletes(changes)
+                if len(course_ids) == 1:
+                    self.log_activity(f"Deleted course: {description}", "courses", course_ids[0])
+                else:
+                    self.log_activity(f"Deleted {description}", "courses")
+                messagebox.showinfo("Success", "Course deleted successfully!" if len(course_ids) == 1
+                                    else f"{len(course_ids)} courses deleted successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Error deleting course: {str(e)}")
     
@@ -862,21 +1860,14 @@ class AcademyManagementSystem:
         course_id = self.courses_tree.item(selected_item)['values'][0]
         
         # Fetch course details
-        self.cursor.execute("SELECT * FROM courses WHERE id=?", (course_id,))
-        course = self.cursor.fetchone()
+        course = self.service.courses.get(course_id)
         
         # Fetch enrollments for this course
-        self.cursor.execute('''
-            SELECT s.first_name || ' ' || s.last_name, e.enrollment_date 
-            FROM enrollments e
-            JOIN students s ON e.student_id = s.id
-            WHERE e.course_id=?
-        ''', (course_id,))
-        enrollments = self.cursor.fetchall()
+        enrollments = self.service.courses.enrollments(course_id)
         
         dialog = tk.Toplevel(self.root)
         dialog.title("Course Details")
-        dialog.geometry("500x400")
+        dialog.geometry("500x430")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -889,6 +1880,15 @@ class AcademyManagementSystem:
             tk.Label(info_frame, text=label, font=("Arial", 10, "bold")).grid(row=i, column=0, sticky='e', padx=5, pady=2)
             tk.Label(info_frame, text=course[i] if i < len(course) else "").grid(row=i, column=1, sticky='w', padx=5, pady=2)
         
+        stats = self.service.grades.course_stats(course_id)
+        if stats:
+            summary = (f"mean {stats[0].mean:.1f}, std dev {stats[0].stddev:.1f}, "
+                       f"range {stats[0].minimum:g}-{stats[0].maximum:g} over {stats[0].grades} grades")
+        else:
+            summary = "No grades recorded"
+        tk.Label(info_frame, text="Grades:", font=("Arial", 10, "bold")).grid(row=len(labels), column=0, sticky='e', padx=5, pady=2)
+        tk.Label(info_frame, text=summary).grid(row=len(labels), column=1, sticky='w', padx=5, pady=2)
+        
         # Enrollments frame
         enroll_frame = tk.LabelFrame(dialog, text="Enrolled Students", padx=10, pady=10)
         enroll_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -914,46 +1914,165 @@ class AcademyManagementSystem:
     
     # Enrollment methods
     def enroll_student(self):
-        student_name = self.enrollment_student_var.get()
-        course_name = self.enrollment_course_var.get()
-        
-        if not student_name or not course_name:
+        if not self.student_choice.text() or not self.course_choice.text():
             messagebox.showerror("Error", "Please select both a student and a course")
             return
         
-        # Get student ID
-        self.cursor.execute("SELECT id FROM students WHERE first_name || ' ' || last_name = ?", (student_name,))
-        student_id = self.cursor.fetchone()
-        if not student_id:
+        # The chosen labels carry the ids, so names shared by several rows
+        # still pick the right one
+        student_id = self.student_choice.selected_id()
+        if student_id is None:
             messagebox.showerror("Error", "Selected student not found")
             return
-        student_id = student_id[0]
         
-        # Get course ID
-        self.cursor.execute("SELECT id FROM courses WHERE name = ?", (course_name,))
-        course_id = self.cursor.fetchone()
-        if not course_id:
+        course_id = self.course_choice.selected_id()
+        if course_id is None:
             messagebox.showerror("Error", "Selected course not found")
             return
-        course_id = course_id[0]
-        
-        # Check if already enrolled
-        self.cursor.execute("SELECT * FROM enrollments WHERE student_id=? AND course_id=?", (student_id, course_id))
-        if self.cursor.fetchone():
-            messagebox.showerror("Error", "Student is already enrolled in this course")
-            return
+        student_name = self.student_index.names[student_id]
+        course_name = self.course_index.names[course_id]
         
         # Enroll student
         try:
-            self.cursor.execute("INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)", (student_id, course_id))
-            self.conn.commit()
-            self.load_enrollments()
-            self.update_dashboard()
-            self.log_activity(f"Enrolled {student_name} in {course_name}")
+            enrollment_id = self.confirm_conflicts(
+                lambda check: self.service.enrollments.enroll(student_id, course_id, check))
+            if enrollment_id is None:
+                return
+            self.apply_changes([("enrollments", "insert", enrollment_id)])
+            self.log_activity(f"Enrolled {student_name} in {course_name}", "enrollments", enrollment_id)
             messagebox.showinfo("Success", "Student enrolled successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Error enrolling student: {str(e)}")
     
+    def warn_unreadable_schedule(self, text, action):
+        # A schedule such as "TBA" is saved as typed but gets no slots; say
+        # so instead of the usual success message. Returns whether it did.
+        try:
+            schedule.parse(text)
+        except ValueError as e:
+            messagebox.showwarning("Schedule Not Understood", f"Course {action}, but its schedule could not be read. "
+                                   f"It is left out of conflict checks until it can.\n\n{e}")
+            return True
+        return False
+    
+    def confirm_conflicts(self, save, parent=None):
+        # Run save(check_conflicts), offering to go ahead when it clashes with
+        # another schedule. Returns its result, or None when it failed or the
+        # user backed out.
+        try:
+            try:
+                return save(True)
+            except services.ScheduleConflict as e:
+                if not messagebox.askyesno("Schedule Conflict", f"{e}\n\nGo ahead anyway?", parent=parent):
+                    return None
+                return save(False)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=parent)
+            return None
+    
+    def selected_student_ids(self):
+        # Rows of the students view are keyed by student id
+        return [int(item) for item in self.students_tree.selection()]
+    
+    def enroll_selected_students(self):
+        student_ids = self.selected_student_ids()
+        if not student_ids:
+            messagebox.showinfo("Info", "Please select the students to enroll")
+            return
+        self.batch_enroll(student_ids)
+    
+    def save_cohort(self):
+        student_ids = self.selected_student_ids()
+        if not student_ids:
+            messagebox.showinfo("Info", "Please select the students for the cohort")
+            return
+        
+        name = simpledialog.askstring("Save Cohort", f"Name for a cohort of {len(student_ids)} students:", parent=self.root)
+        if not name:
+            return
+        try:
+            cohort_id = self.service.cohorts.save(name, student_ids=student_ids)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.log_activity(f"Saved cohort {name} with {len(student_ids)} students", "cohorts", cohort_id)
+        messagebox.showinfo("Success", "Cohort saved successfully!")
+    
+    def batch_enroll(self, student_ids=None):
+        # Enroll a group of students in one or more courses in one transaction:
+        # the students selected in the Students tab, a saved cohort, or the
+        # students taking another course
+        cohorts = self.service.cohorts.names()
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Batch Enrollment")
+        dialog.geometry("520x420")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        source_var = tk.StringVar(value="selected" if student_ids else "cohort" if cohorts else "course")
+        
+        tk.Label(dialog, text="Students:").grid(row=0, column=0, padx=10, pady=5, sticky='e')
+        tk.Radiobutton(dialog, text=f"Selected students ({len(student_ids or [])})", variable=source_var, value="selected",
+                       state=tk.NORMAL if student_ids else tk.DISABLED).grid(row=0, column=1, columnspan=2, sticky='w')
+        
+        tk.Radiobutton(dialog, text="Cohort:", variable=source_var, value="cohort",
+                       state=tk.NORMAL if cohorts else tk.DISABLED).grid(row=1, column=1, sticky='w')
+        cohort_combobox = ttk.Combobox(dialog, values=[name for _, name in cohorts], state="readonly", width=30)
+        cohort_combobox.grid(row=1, column=2, padx=10, pady=5)
+        
+        tk.Radiobutton(dialog, text="Students taking:", variable=source_var, value="course").grid(row=2, column=1, sticky='w')
+        from_course_combobox = ttk.Combobox(dialog, width=30)
+        from_course_combobox.grid(row=2, column=2, padx=10, pady=5)
+        from_course_choice = ChoiceBox(from_course_combobox, self.course_index)
+        
+        tk.Label(dialog, text="Courses:").grid(row=3, column=0, padx=10, pady=5, sticky='ne')
+        courses_listbox = tk.Listbox(dialog, selectmode=tk.EXTENDED, height=12, width=45, exportselection=False)
+        courses_listbox.grid(row=3, column=1, columnspan=2, padx=10, pady=5, sticky='w')
+        names = self.course_index.names
+        course_ids = sorted(names, key=lambda course_id: names[course_id].casefold())
+        for course_id in course_ids:
+            courses_listbox.insert(tk.END, PrefixIndex.label(course_id, names[course_id]))
+        
+        def enroll():
+            chosen = [course_ids[index] for index in courses_listbox.curselection()]
+            if not chosen:
+                messagebox.showerror("Error", "Please select at least one course", parent=dialog)
+                return
+            
+            source = source_var.get()
+            if source == "selected":
+                group = {"student_ids": student_ids}
+            elif source == "cohort":
+                if cohort_combobox.current() < 0:
+                    messagebox.showerror("Error", "Please choose a cohort", parent=dialog)
+                    return
+                group = {"cohort_id": cohorts[cohort_combobox.current()][0]}
+            else:
+                from_course_id = from_course_choice.selected_id()
+                if from_course_id is None:
+                    messagebox.showerror("Error", "Please choose the course to take students from", parent=dialog)
+                    return
+                group = {"from_course_id": from_course_id}
+            
+            try:
+                new_ids, already = self.service.enrollments.enroll_group(chosen, **group)
+            except Exception as e:
+                messagebox.showerror("Error", f"Error enrolling students: {str(e)}", parent=dialog)
+                return
+            dialog.destroy()
+            
+            # A few new rows are placed in the view, a large batch reloads it
+            if len(new_ids) <= PAGE_SIZE:
+                self.apply_changes([("enrollments", "insert", enrollment_id) for enrollment_id in new_ids])
+            else:
+                self.reload_table("enrollments")
+                self.update_dashboard()
+            self.log_activity(f"Batch enrolled {len(new_ids)} students in {len(chosen)} courses", "enrollments")
+            messagebox.showinfo("Batch Enrollment", f"{len(new_ids)} new enrollments, {already} already enrolled")
+        
+        tk.Button(dialog, text="Enroll", width=10, command=enroll).grid(row=4, column=2, pady=20, sticky='e')
+    
     def unenroll_student(self):
         selected_item = self.enrollments_tree.selection()
         if not selected_item:
@@ -966,13 +2085,9 @@ class AcademyManagementSystem:
         
         if messagebox.askyesno("Confirm", f"Unenroll {student_name} from {course_name}?"):
             try:
-                # First delete grades for this enrollment
-                self.cursor.execute("DELETE FROM grades WHERE enrollment_id IN (SELECT id FROM enrollments WHERE id=?)", (enrollment_id,))
-                self.cursor.execute("DELETE FROM enrollments WHERE id=?", (enrollment_id,))
-                self.conn.commit()
-                self.load_enrollments()
-                self.update_dashboard()
-                self.log_activity(f"Unenrolled {student_name} from {course_name}")
+                changes = self.service.enrollments.unenroll(enrollment_id)
+                self.apply_changes(changes)
+                self.log_activity(f"Unenrolled {student_name} from {course_name}", "enrollments", enrollment_id)
                 messagebox.showinfo("Success", "Student unenrolled successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Error unenrolling student: {str(e)}")
@@ -994,15 +2109,153 @@ class AcademyManagementSystem:
         
         if grade is not None:
             try:
-                self.cursor.execute("INSERT INTO grades (enrollment_id, grade, grade_date) VALUES (?, ?, ?)",
-                                   (enrollment_id, grade, datetime.now().strftime("%Y-%m-%d")))
-                self.conn.commit()
-                self.load_grades()
-                self.log_activity(f"Assigned grade {grade} to {student_name} for {course_name}")
+                grade_id = self.service.grades.assign(enrollment_id, grade, datetime.now().strftime("%Y-%m-%d"))
+                self.apply_changes([("grades", "insert", grade_id)])
+                self.log_activity(f"Assigned grade {grade} to {student_name} for {course_name}", "grades", grade_id)
                 messagebox.showinfo("Success", "Grade assigned successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Error assigning grade: {str(e)}")
     
+    def enter_grades(self):
+        # Enter grades for everyone taking a course at once. Values are checked
+        # as they are typed and all of them are saved in one transaction.
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Enter Grades")
+        dialog.geometry("720x520")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        controls_frame = tk.Frame(dialog)
+        controls_frame.pack(fill='x', padx=10, pady=10)
+        
+        tk.Label(controls_frame, text="Course:").pack(side=tk.LEFT)
+        course_combobox = ttk.Combobox(controls_frame, width=30)
+        course_combobox.pack(side=tk.LEFT, padx=5)
+        course_choice = ChoiceBox(course_combobox, self.course_index)
+        
+        tk.Label(controls_frame, text="Date (YYYY-MM-DD):").pack(side=tk.LEFT, padx=(20, 0))
+        date_entry = tk.Entry(controls_frame, width=12)
+        date_entry.pack(side=tk.LEFT, padx=5)
+        date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+        
+        columns = ("Student", "Email", "Latest Grade", "Latest Date", "New Grade")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings", height=15)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120, anchor=tk.W)
+        tree.column("Student", width=180)
+        tree.column("Email", width=180)
+        scrollbar = ttk.Scrollbar(dialog, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        status_label = tk.Label(dialog, anchor='w')
+        
+        def validate(enrollment_id, text):
+            try:
+                self.service.grades.validate((int(enrollment_id), text, None))
+            except ValueError as e:
+                return str(e)
+            return None
+        
+        def show_status():
+            status_label.config(text=f"{len(roster)} students, {len(sheet.values)} grades entered, "
+                                     f"{len(sheet.errors)} invalid")
+        
+        sheet = GradeSheet(tree, "New Grade", validate, show_status)
+        roster = {}
+        # Dates given per row in a loaded file, otherwise the date above is used
+        dates = {}
+        
+        def load_course(event=None):
+            course_id = course_choice.selected_id()
+            if course_id is None:
+                return
+            if sheet.values and not messagebox.askyesno("Confirm", "Discard the grades entered so far?", parent=dialog):
+                return
+            sheet.finish(save=False)
+            sheet.values.clear()
+            sheet.errors.clear()
+            roster.clear()
+            dates.clear()
+            tree.delete(*tree.get_children())
+            for enrollment_id, student_id, name, email, grade, grade_date in self.service.grades.roster(course_id):
+                roster[enrollment_id] = (student_id, name, email)
+                tree.insert("", tk.END, iid=str(enrollment_id),
+                            values=(name, email, "" if grade is None else grade, grade_date or "", ""))
+            show_status()
+        
+        def load_csv():
+            if not roster:
+                messagebox.showinfo("Info", "Please choose a course first", parent=dialog)
+                return
+            file_path = filedialog.askopenfilename(parent=dialog, title="Load Grades",
+                                                   filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+            if not file_path:
+                return
+            try:
+                rows = importer.read_grade_sheet(file_path)
+            except (OSError, ValueError, UnicodeDecodeError) as e:
+                messagebox.showerror("Error", f"Error reading grades: {str(e)}", parent=dialog)
+                return
+            
+            # Rows are matched to the course's students by id or email
+            by_student = {student_id: enrollment_id for enrollment_id, (student_id, _, _) in roster.items()}
+            by_email = {email.casefold(): enrollment_id for enrollment_id, (_, _, email) in roster.items()}
+            unknown = []
+            for line, student_id, email, grade, grade_date in rows:
+                enrollment_id = by_student.get(student_id) or by_email.get(email.casefold())
+                if enrollment_id is None:
+                    unknown.append(f"Line {line}: {email or student_id} does not take this course")
+                    continue
+                if grade_date:
+                    dates[enrollment_id] = grade_date
+                sheet.set_value(str(enrollment_id), grade)
+            show_status()
+            if unknown:
+                messagebox.showwarning("Load Grades", "\n".join(unknown[:10]) +
+                                       (f"\n... and {len(unknown) - 10} more" if len(unknown) > 10 else ""),
+                                       parent=dialog)
+        
+        def save():
+            sheet.finish()
+            if sheet.errors:
+                first = next(iter(sheet.errors))
+                tree.see(first)
+                messagebox.showerror("Error", f"{len(sheet.errors)} grades are invalid, e.g. "
+                                              f"{roster[int(first)][1]}: {sheet.errors[first]}", parent=dialog)
+                return
+            if not sheet.values:
+                messagebox.showinfo("Info", "No grades entered", parent=dialog)
+                return
+            grade_date = date_entry.get().strip()
+            rows = [(int(enrollment_id), text, dates.get(int(enrollment_id), grade_date))
+                    for enrollment_id, text in sheet.values.items()]
+            try:
+                grade_ids = self.service.grades.assign_many(rows)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=dialog)
+                return
+            dialog.destroy()
+            
+            if len(grade_ids) <= PAGE_SIZE:
+                self.apply_changes([("grades", "insert", grade_id) for grade_id in grade_ids])
+            else:
+                self.reload_table("grades")
+                self.update_dashboard()
+            self.log_activity(f"Entered {len(grade_ids)} grades for {course_combobox.get()}", "grades")
+            messagebox.showinfo("Success", f"{len(grade_ids)} grades saved successfully!")
+        
+        course_combobox.bind("<<ComboboxSelected>>", load_course)
+        course_combobox.bind("<Return>", load_course)
+        
+        buttons_frame = tk.Frame(dialog)
+        buttons_frame.pack(side=tk.BOTTOM, fill='x', padx=10, pady=10)
+        tk.Button(buttons_frame, text="Save", width=10, command=save).pack(side=tk.RIGHT, padx=5)
+        tk.Button(buttons_frame, text="Load CSV...", width=10, command=load_csv).pack(side=tk.RIGHT, padx=5)
+        status_label.pack(side=tk.BOTTOM, fill='x', padx=10)
+        tree.pack(side=tk.LEFT, fill='both', expand=True, padx=(10, 0))
+        scrollbar.pack(side=tk.RIGHT, fill='y', padx=(0, 10))
+    
     def view_grades(self):
         selected_item = self.enrollments_tree.selection()
         if not selected_item:
@@ -1014,8 +2267,7 @@ class AcademyManagementSystem:
         course_name = self.enrollments_tree.item(selected_item)['values'][2]
         
         # Fetch grades for this enrollment
-        self.cursor.execute("SELECT grade, grade_date FROM grades WHERE enrollment_id=?", (enrollment_id,))
-        grades = self.cursor.fetchall()
+        grades = [(grade.grade, grade.grade_date) for grade in self.service.grades.grades_for(enrollment_id=enrollment_id)]
         
         dialog = tk.Toplevel(self.root)
         dialog.title(f"Grades for {student_name} - {course_name}")
@@ -1047,144 +2299,218 @@ class AcademyManagementSystem:
             tk.Label(grades_frame, text="No grades recorded", font=("Arial", 10)).pack(pady=20)
     
     def filter_grades(self, event=None):
-        # Clear the treeview
-        for item in self.grades_tree.get_children():
-            self.grades_tree.delete(item)
-        
-        # Build query based on filters
-        query = '''
-            SELECT g.id, s.first_name || ' ' || s.last_name, c.name, g.grade, g.grade_date
-            FROM grades g
-            JOIN enrollments e ON g.enrollment_id = e.id
-            JOIN students s ON e.student_id = s.id
-            JOIN courses c ON e.course_id = c.id
-            WHERE 1=1
-        '''
+        # Build filter based on selections
+        conditions = []
         params = []
         
-        course_name = self.grade_course_var.get()
-        student_name = self.grade_student_var.get()
-        
-        if course_name:
-            query += " AND c.name = ?"
-            params.append(course_name)
-        
-        if student_name:
-            query += " AND s.first_name || ' ' || s.last_name = ?"
-            params.append(student_name)
-        
-        # Fetch filtered grades
-        self.cursor.execute(query, tuple(params))
-        grades = self.cursor.fetchall()
+        for choice, condition in ((self.grade_course_choice, "c.id = ?"), (self.grade_student_choice, "s.id = ?")):
+            if not choice.text():
+                continue
+            row_id = choice.selected_id()
+            if row_id is None:
+                # Still typing, wait for a complete choice
+                return
+            conditions.append(condition)
+            params.append(row_id)
         
-        # Insert into treeview
-        for grade in grades:
-            self.grades_tree.insert("", tk.END, values=grade)
+        # Fetch filtered grades page by page
+        self.grades_table.reload(" AND ".join(conditions), params)
     
     # Search methods
     def search_students(self, event):
-        search_term = self.student_search_entry.get().lower()
-        
-        # Clear the treeview
-        for item in self.students_tree.get_children():
-            self.students_tree.delete(item)
-        
-        # Fetch students from database
-        self.cursor.execute("SELECT id, first_name, last_name, email, phone, enrollment_date FROM students")
-        students = self.cursor.fetchall()
+        # Wait for typing to pause, replacing any search still waiting to run
+        if self.student_search_job:
+            self.root.after_cancel(self.student_search_job)
+        self.student_search_job = self.root.after(SEARCH_DELAY_MS, self.run_student_search)
+    
+    def run_student_search(self):
+        self.student_search_job = None
+        search_term = self.student_search_entry.get().strip()
+        if not search_term:
+            self.students_table.reload()
+            return
         
-        # Filter and insert into treeview
-        for student in students:
-            # Convert all values to string and search
-            if any(search_term in str(field).lower() for field in student):
-                self.students_tree.insert("", tk.END, values=student)
+        self.run_search(self.students_table, services.StudentRepository, search_term)
     
     def search_courses(self, event):
-        search_term = self.course_search_entry.get().lower()
-        
-        # Clear the treeview
-        for item in self.courses_tree.get_children():
-            self.courses_tree.delete(item)
-        
-        # Fetch courses from database
-        self.cursor.execute("SELECT id, code, name, department, credits, instructor FROM courses")
-        courses = self.cursor.fetchall()
+        if self.course_search_job:
+            self.root.after_cancel(self.course_search_job)
+        self.course_search_job = self.root.after(SEARCH_DELAY_MS, self.run_course_search)
+    
+    def run_course_search(self):
+        self.course_search_job = None
+        search_term = self.course_search_entry.get().strip()
+        if not search_term:
+            self.courses_table.reload()
+            return
         
-        # Filter and insert into treeview
-        for course in courses:
-            if any(search_term in str(field).lower() for field in course):
-                self.courses_tree.insert("", tk.END, values=course)
+        self.run_search(self.courses_table, services.CourseRepository, search_term)
+    
+    def run_search(self, view, repository, search_term):
+        # Searching on the worker under the view's key cancels an older search
+        # or page load for the same view that is still running
+        self.worker.submit(lambda conn: repository(conn).search(search_term),
+                           view.show_ids, key=view)
     
     # Export methods
     def export_students_csv(self):
+        self.export_csv("students", "Students")
+    
+    def export_courses_csv(self):
+        self.export_csv("courses", "Courses")
+    
+    def export_enrollments_csv(self):
+        self.export_csv("enrollments", "Enrollments")
+    
+    def export_grades_csv(self):
+        self.export_csv("grades", "Grades")
+    
+    def export_csv(self, table, title):
         file_path = filedialog.asksaveasfilename(
             defaultextension=".csv",
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title="Save Students as CSV"
+            title=f"Save {title} as CSV"
         )
         
         if not file_path:
             return
-            
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                # Write header
-                writer.writerow(["ID", "First Name", "Last Name", "Email", "Phone", "Date of Birth", "Address", "Enrollment Date"])
-                
-                # Fetch all students
-                self.cursor.execute("SELECT * FROM students")
-                students = self.cursor.fetchall()
-                
-                # Write data
-                for student in students:
-                    writer.writerow(student)
-            
-            self.log_activity("Exported students to CSV")
-            messagebox.showinfo("Success", "Students exported to CSV successfully!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error exporting students: {str(e)}")
+        
+        def work(conn, progress, cancelled):
+            return exporter.export_csv(conn, table, file_path,
+                                       progress=lambda done, total: progress(f"{done} of {total} rows written", done, total),
+                                       cancelled=cancelled)
+        
+        def finished(written):
+            if written is None:
+                self.log_activity(f"Cancelled {title.lower()} export")
+                return
+            self.log_activity(f"Exported {written} {title.lower()} to CSV")
+            messagebox.showinfo("Success", f"{title} exported to CSV successfully!")
+        
+        self.run_in_background(f"Exporting {title}", work, finished, f"Error exporting {title.lower()}")
     
-    def export_courses_csv(self):
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".csv",
+    # Import methods
+    def import_students_csv(self):
+        self.import_csv("students", "Students")
+    
+    def import_courses_csv(self):
+        self.import_csv("courses", "Courses")
+    
+    def import_enrollments_csv(self):
+        self.import_csv("enrollments", "Enrollments")
+    
+    def import_grades_csv(self):
+        self.import_csv("grades", "Grades")
+    
+    def import_csv(self, table, title):
+        file_path = filedialog.askopenfilename(
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title="Save Courses as CSV"
+            title=f"Import {title} from CSV"
         )
         
         if not file_path:
             return
+        
+        def work(conn, progress, cancelled):
+            return importer.import_csv(conn, table, file_path,
+                                       progress=lambda done: progress(f"{done} rows read", done, None),
+                                       cancelled=cancelled)
+        
+        def finished(result):
+            if result.cancelled:
+                self.log_activity(f"Cancelled {title.lower()} import")
+                return
             
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                # Write header
-                writer.writerow(["ID", "Code", "Name", "Department", "Credits", "Instructor", "Schedule", "Room"])
-                
-                # Fetch all courses
-                self.cursor.execute("SELECT * FROM courses")
-                courses = self.cursor.fetchall()
-                
-                # Write data
-                for course in courses:
-                    writer.writerow(course)
+            # Imported rows can be anywhere in the tables, reload them
+            if table == "students":
+                self.load_students()
+            elif table == "courses":
+                self.load_courses()
+            else:
+                self.load_enrollments()
+            self.update_dashboard()
+            self.log_activity(f"Imported {title.lower()}: {result.summary()}", table)
             
-            self.log_activity("Exported courses to CSV")
-            messagebox.showinfo("Success", "Courses exported to CSV successfully!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error exporting courses: {str(e)}")
+            message = f"{title} import finished: {result.summary()}."
+            if result.errors:
+                lines = [f"Line {line}: {error}" for line, error in result.errors[:10]]
+                if result.error_count > len(lines):
+                    lines.append(f"... and {result.error_count - len(lines)} more")
+                message += "\n\n" + "\n".join(lines)
+                messagebox.showwarning("Import", message)
+            else:
+                messagebox.showinfo("Success", message)
+        
+        self.run_in_background(f"Importing {title}", work, finished, f"Error importing {title.lower()}")
+    
+    def run_in_background(self, title, work, finished, error_message):
+        # Run a long job on its own thread and connection, so page loads and
+        # searches on the worker are not held up, with a progress dialog.
+        # work(conn, progress, cancelled) calls progress(text, done, total) from
+        # its thread; total is None when it isn't known in advance.
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("400x130")
+        dialog.transient(self.root)
+        
+        status_label = tk.Label(dialog, text="Starting...")
+        status_label.pack(pady=10)
+        progress_bar = ttk.Progressbar(dialog, length=350, mode='determinate')
+        progress_bar.pack(padx=20)
+        
+        cancel_event = threading.Event()
+        tk.Button(dialog, text="Cancel", width=10, command=cancel_event.set).pack(pady=10)
+        dialog.protocol("WM_DELETE_WINDOW", cancel_event.set)
+        
+        def show_progress(update):
+            text, done, total = update
+            if not dialog.winfo_exists():
+                return
+            if total is None:
+                progress_bar.config(mode='indeterminate')
+                progress_bar.step()
+            else:
+                progress_bar['maximum'] = max(total, 1)
+                progress_bar['value'] = done
+            status_label.config(text=text)
+        
+        def done(result):
+            dialog.destroy()
+            finished(result)
+        
+        def failed(error):
+            dialog.destroy()
+            messagebox.showerror("Error", f"{error_message}: {str(error)}")
+        
+        def run():
+            try:
+                conn = database.connect()
+                try:
+                    result = work(conn, lambda text, done, total: self.worker.post(show_progress, (text, done, total)),
+                                  cancel_event.is_set)
+                finally:
+                    conn.close()
+                self.worker.post(done, result)
+            except Exception as e:
+                self.worker.post(failed, e)
+        
+        threading.Thread(target=run, daemon=True).start()
     
     # Context menu methods
     def show_student_context_menu(self, event):
         item = self.students_tree.identify_row(event.y)
         if item:
-            self.students_tree.selection_set(item)
+            # Keep a multiple selection for the batch commands
+            if item not in self.students_tree.selection():
+                self.students_tree.selection_set(item)
             self.student_menu.post(event.x_root, event.y_root)
     
     def show_course_context_menu(self, event):
         item = self.courses_tree.identify_row(event.y)
         if item:
-            self.courses_tree.selection_set(item)
+            # Keep a multiple selection for deleting several courses
+            if item not in self.courses_tree.selection():
+                self.courses_tree.selection_set(item)
             self.course_menu.post(event.x_root, event.y_root)
     
     def show_enrollment_context_menu(self, event):
@@ -1194,12 +2520,250 @@ class AcademyManagementSystem:
             self.enrollment_menu.post(event.x_root, event.y_root)
     
     # Utility methods
-    def log_activity(self, message):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def log_activity(self, message, entity=None, entity_id=None):
+        # Record in the audit log, optionally against a table or one of its
+        # rows, and show it in the dashboard's recent activity
+        timestamp = self.service.audit.record(message, entity, entity_id)
         self.activity_listbox.insert(0, f"[{timestamp}] {message}")
-        # Keep only the last 20 activities
-        if self.activity_listbox.size() > 20:
-            self.activity_listbox.delete(20, tk.END)
+        # Keep only the last 20 activities on screen
+        if self.activity_listbox.size() > RECENT_ACTIVITY:
+            self.activity_listbox.delete(RECENT_ACTIVITY, tk.END)
+    
+    def show_schedule_conflicts(self):
+        # Every double-booked room and instructor and every student taking
+        # two courses at the same time, found in one sweep on the worker
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Schedule Conflicts")
+        dialog.geometry("850x500")
+        dialog.transient(self.root)
+        
+        summary_label = tk.Label(dialog, text="Looking for conflicts...", anchor='w', justify=tk.LEFT)
+        summary_label.pack(fill='x', padx=10, pady=5)
+        
+        columns = ("Type", "Who", "Course", "Clashes With", "When")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=160)
+        tree.column("Type", width=80)
+        tree.column("When", width=130)
+        scrollbar = ttk.Scrollbar(dialog, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+        tree.pack(fill='both', expand=True, padx=10, pady=5)
+        tk.Button(dialog, text="Close", width=10, command=dialog.destroy).pack(pady=5)
+        
+        def find(conn):
+            repository = services.ScheduleRepository(conn)
+            return repository.conflicts(), repository.unreadable()
+        
+        def show(result):
+            if not dialog.winfo_exists():
+                return
+            conflicts, unreadable = result
+            counts = {kind: 0 for kind in ("room", "instructor", "student")}
+            for conflict in conflicts:
+                counts[conflict.kind] += 1
+            text = (f"{counts['room']} room, {counts['instructor']} instructor and "
+                    f"{counts['student']} student conflicts")
+            if len(conflicts) > CONFLICT_ROWS:
+                text += f" (first {CONFLICT_ROWS} listed)"
+            if unreadable:
+                text += "\nSchedules that could not be read: " + ", ".join(code for _, code, _ in unreadable)
+            summary_label.config(text=text)
+            for conflict in conflicts[:CONFLICT_ROWS]:
+                tree.insert("", tk.END, values=(conflict.kind.title(), conflict.subject, conflict.course,
+                                                conflict.other_course, str(conflict.slot)))
+        
+        def failed(error):
+            if dialog.winfo_exists():
+                summary_label.config(text=f"Error finding conflicts: {error}")
+        
+        self.worker.submit(find, show, failed, key="schedule_conflicts")
+    
+    def show_diagnostics(self):
+        # Timings of every query shape run by the window, the worker and the
+        # background jobs, and the slow queries with their plans
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Diagnostics")
+        dialog.geometry("1000x600")
+        dialog.transient(self.root)
+        
+        recorder = diagnostics.recorder
+        if isinstance(self.conn, diagnostics.InstrumentedConnection):
+            summary = f"Slow queries take {recorder.slow_seconds * 1000:g} ms or more"
+        else:
+            summary = "Query timing is turned off, see [diagnostics] in academy.ini"
+        summary_label = tk.Label(dialog, text=summary, anchor='w')
+        summary_label.pack(fill='x', padx=10, pady=5)
+        
+        buttons = tk.Frame(dialog)
+        buttons.pack(side=tk.BOTTOM, fill='x', padx=10, pady=5)
+        
+        notebook = ttk.Notebook(dialog)
+        notebook.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        queries_frame = tk.Frame(notebook)
+        notebook.add(queries_frame, text="Queries")
+        columns = ("Query", "Calls", "Rows", "Total ms", "Mean ms", "p95 ms", "Max ms")
+        queries_tree = ttk.Treeview(queries_frame, columns=columns, show="headings")
+        for col in columns:
+            queries_tree.heading(col, text=col)
+            queries_tree.column(col, width=80, anchor=tk.E)
+        queries_tree.column("Query", width=450, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(queries_frame, orient="vertical", command=queries_tree.yview)
+        queries_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+        queries_tree.pack(fill='both', expand=True)
+        
+        slow_frame = tk.Frame(notebook)
+        notebook.add(slow_frame, text="Slow Queries")
+        columns = ("Time", "ms", "Rows", "Full Scan", "Origin", "Query")
+        slow_tree = ttk.Treeview(slow_frame, columns=columns, show="headings", height=10)
+        for col in columns:
+            slow_tree.heading(col, text=col)
+            slow_tree.column(col, width=80)
+        slow_tree.column("Time", width=130)
+        slow_tree.column("Origin", width=200)
+        slow_tree.column("Query", width=400)
+        slow_tree.pack(fill='both', expand=True)
+        details = tk.Text(slow_frame, height=10, wrap=tk.WORD)
+        details.pack(fill='x')
+        
+        slow_queries = []
+        
+        def refresh():
+            queries_tree.delete(*queries_tree.get_children())
+            for stats in recorder.query_stats():
+                queries_tree.insert("", tk.END, values=(stats["query"], stats["calls"], stats["rows"],
+                                                         f"{stats['total_ms']:.1f}", f"{stats['mean_ms']:.2f}",
+                                                         f"{stats['p95_ms']:g}", f"{stats['max_ms']:.1f}"))
+            slow_tree.delete(*slow_tree.get_children())
+            slow_queries[:] = recorder.slow_queries()
+            for index, entry in enumerate(slow_queries):
+                slow_tree.insert("", tk.END, iid=str(index),
+                                 values=(entry["time"], f"{entry['ms']:.1f}", entry["rows"],
+                                         "Yes" if entry["full_scans"] else "", entry["origin"], entry["query"]))
+            details.delete("1.0", tk.END)
+        
+        def show_slow_query(event):
+            selection = slow_tree.selection()
+            if not selection:
+                return
+            entry = slow_queries[int(selection[0])]
+            text = f"{entry['sql']}\n\nParameters: {entry['parameters']}\n\nQuery plan:\n"
+            text += "\n".join(("FULL SCAN: " if step in entry["full_scans"] else "") + step for step in entry["plan"])
+            details.delete("1.0", tk.END)
+            details.insert("1.0", text)
+        
+        slow_tree.bind("<<TreeviewSelect>>", show_slow_query)
+        
+        def reset():
+            recorder.reset()
+            refresh()
+        
+        def save():
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".json",
+                filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+                title="Save Diagnostics as JSON",
+                parent=dialog
+            )
+            if not file_path:
+                return
+            try:
+                recorder.dump(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Error saving diagnostics: {str(e)}", parent=dialog)
+        
+        tk.Button(buttons, text="Refresh", width=10, command=refresh).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Reset", width=10, command=reset).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Save JSON...", width=12, command=save).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Close", width=10, command=dialog.destroy).pack(side=tk.RIGHT)
+        
+        refresh()
+    
+    def show_audit_log(self):
+        # Page through the audit log, newest first, optionally for one table or
+        # row and a range of dates
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Audit Log")
+        dialog.geometry("800x500")
+        dialog.transient(self.root)
+        
+        filter_frame = tk.Frame(dialog)
+        filter_frame.pack(fill='x', padx=10, pady=5)
+        tk.Label(filter_frame, text="Table:").pack(side=tk.LEFT)
+        entity_combobox = ttk.Combobox(filter_frame, values=["", "students", "courses", "enrollments", "grades", "cohorts"],
+                                       state="readonly", width=12)
+        entity_combobox.pack(side=tk.LEFT, padx=5)
+        tk.Label(filter_frame, text="ID:").pack(side=tk.LEFT)
+        entity_id_entry = tk.Entry(filter_frame, width=8)
+        entity_id_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(filter_frame, text="From:").pack(side=tk.LEFT)
+        start_entry = tk.Entry(filter_frame, width=12)
+        start_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(filter_frame, text="To:").pack(side=tk.LEFT)
+        end_entry = tk.Entry(filter_frame, width=12)
+        end_entry.pack(side=tk.LEFT, padx=5)
+        
+        columns = ("Time", "Table", "ID", "Activity")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+        tree.column("Time", width=140)
+        tree.column("Table", width=90)
+        tree.column("ID", width=60)
+        tree.column("Activity", width=450)
+        tree.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        # Pages are fetched by keyset: each one starts after the last entry of
+        # the previous one, so paging stays fast however long the log gets
+        pages = []
+        shown = []
+        
+        def show_page(before):
+            entity = entity_combobox.get() or None
+            entity_id = entity_id_entry.get().strip()
+            if entity_id and not entity_id.isdigit():
+                messagebox.showerror("Error", "ID must be a number", parent=dialog)
+                return
+            for value in (start_entry.get().strip(), end_entry.get().strip()):
+                if value and not importer.valid_date(value):
+                    messagebox.showerror("Error", f"Dates must be YYYY-MM-DD: {value}", parent=dialog)
+                    return
+            entries = self.service.audit.entries(entity, int(entity_id) if entity_id else None,
+                                                 start_entry.get().strip(), end_entry.get().strip(), before)
+            if before is not None and not entries:
+                return
+            pages.append(before)
+            tree.delete(*tree.get_children())
+            for entry in entries:
+                tree.insert("", tk.END, values=(entry.logged_at, entry.entity or "", "" if entry.entity_id is None
+                                                else entry.entity_id, entry.message))
+            shown[:] = entries
+        
+        def first_page():
+            pages.clear()
+            show_page(None)
+        
+        def older():
+            if shown:
+                show_page(shown[-1])
+        
+        def newer():
+            if len(pages) > 1:
+                pages.pop()
+                show_page(pages.pop())
+        
+        tk.Button(filter_frame, text="Filter", command=first_page).pack(side=tk.LEFT, padx=5)
+        buttons = tk.Frame(dialog)
+        buttons.pack(fill='x', padx=10, pady=5)
+        tk.Button(buttons, text="Newer", width=10, command=newer).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Older", width=10, command=older).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Close", width=10, command=dialog.destroy).pack(side=tk.RIGHT)
+        
+        first_page()
 
 if __name__ == "__main__":
     root = tk.Tk()
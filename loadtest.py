@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+import database
+import generator
+
+# Load test of api.py. Starts the server on a copy of a database (or on a
+# generated one) unless --url points at a running one, keeps a number of
+# keep-alive connections busy with a mix of reads and some writes, and
+# reports requests per second and latencies of each endpoint as JSON. Exits
+# with status 1 if a request failed or the reads fall short of --target.
+
+DURATION = 10
+WARMUP = 2
+CONNECTIONS = 32
+
+# Reads per second the server is expected to sustain on localhost
+TARGET_READS = 2000
+
+# Dataset generated when no database is given
+DEFAULT_DATASET = {"students": 20000, "courses": 200, "enrollments_per_student": 5, "grades_per_enrollment": 2}
+
+# Seconds to wait for the server to start
+STARTUP_TIMEOUT = 60
+
+SEARCH_TERMS = ["smi", "john", "garcia", "lee", "ann", "wang", "mar", "patel", "son", "kim"]
+
+# (name, weight, method, statuses that are a correct answer, request) of
+# each kind of request; request(rng, counts) gives the path and JSON body
+MIX = [
+    ("list_students", 20, "GET", {200},
+     lambda rng, counts: (f"/students?after={rng.randrange(counts['students'])}&limit=20", None)),
+    ("get_student", 27, "GET", {200, 404}, lambda rng, counts: (f"/students/{rng.randint(1, counts['students'])}", None)),
+    ("search_students", 3, "GET", {200},
+     lambda rng, counts: (f"/students/search?q={rng.choice(SEARCH_TERMS)}&limit=20", None)),
+    ("get_course", 10, "GET", {200, 404}, lambda rng, counts: (f"/courses/{rng.randint(1, counts['courses'])}", None)),
+    ("student_enrollments", 15, "GET", {200},
+     lambda rng, counts: (f"/enrollments?student_id={rng.randint(1, counts['students'])}", None)),
+    ("student_grades", 15, "GET", {200},
+     lambda rng, counts: (f"/grades?student_id={rng.randint(1, counts['students'])}", None)),
+    ("stats", 5, "GET", {200}, lambda rng, counts: ("/stats", None)),
+    ("enroll", 2, "POST", {201, 404, 409}, lambda rng, counts: ("/enrollments", {
+        "student_id": rng.randint(1, counts["students"]), "course_id": rng.randint(1, counts["courses"])})),
+    ("assign_grade", 3, "POST", {201, 404}, lambda rng, counts: ("/grades", {
+        "enrollment_id": rng.randint(1, counts["enrollments"]), "grade": round(rng.uniform(40, 100), 1)})),
+]
+
+async def send(reader, writer, host, method, path, body):
+    # One request on a keep-alive connection; returns the status
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("The server closed the connection")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+async def client(host, port, seed, counts, until, results):
+    # Send requests one after another until the deadline, recording
+    # (name, status or None if it failed, seconds) for each
+    rng = random.Random(seed)
+    names = [name for name, _, _, _, _ in MIX]
+    weights = [weight for _, weight, _, _, _ in MIX]
+    requests = {name: (method, request) for name, _, method, _, request in MIX}
+    connection = None
+    while time.perf_counter() < until:
+        name = rng.choices(names, weights)[0]
+        method, request = requests[name]
+        path, body = request(rng, counts)
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            status = await send(*connection, host, method, path, body)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            status = None
+            if connection is not None:
+                connection[1].close()
+                connection = None
+        results.append((name, status, time.perf_counter() - start))
+    if connection is not None:
+        connection[1].close()
+
+async def load(host, port, counts, connections, duration, seed):
+    results = []
+    until = time.perf_counter() + duration
+    await asyncio.gather(*(client(host, port, seed + number, counts, until, results) for number in range(connections)))
+    return results
+
+async def fetch_counts(host, port):
+    # Row counts from /stats, ids are drawn up to them
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET /stats HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        data = await reader.read()
+    finally:
+        writer.close()
+    counts = json.loads(data.split(b"\r\n\r\n", 1)[1])["counts"]
+    return {table: max(counts.get(table, 0), 1) for table in ("students", "courses", "enrollments")}
+
+def percentile(values, fraction):
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+def summarize(results, duration):
+    expected = {name: statuses for name, _, _, statuses, _ in MIX}
+    writes = {name for name, _, method, _, _ in MIX if method != "GET"}
+    endpoints = {}
+    for name in expected:
+        rows = [(status, elapsed) for result_name, status, elapsed in results if result_name == name]
+        if not rows:
+            continue
+        latencies = sorted(elapsed * 1000 for _, elapsed in rows)
+        statuses = {}
+        for status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        endpoints[name] = {
+            "requests": len(rows),
+            "per_second": round(len(rows) / duration, 1),
+            "errors": sum(status not in expected[name] for status, _ in rows),
+            "statuses": statuses,
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "p50_ms": round(percentile(latencies, 0.5), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "max_ms": round(latencies[-1], 3),
+        }
+    reads = sum(stats["requests"] for name, stats in endpoints.items() if name not in writes)
+    return {
+        "requests": len(results),
+        "requests_per_second": round(len(results) / duration, 1),
+        "reads_per_second": round(reads / duration, 1),
+        "writes_per_second": round((len(results) - reads) / duration, 1),
+        "errors": sum(stats["errors"] for stats in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+def prepare_database(path, args, report):
+    # A copy of the given database, or a generated one, at path
+    conn = database.connect(path)
+    try:
+        if args.database:
+            # Work on a copy, the test enrolls students and assigns grades
+            source = sqlite3.connect(args.database)
+            source.backup(conn)
+            source.close()
+            report["database"] = os.path.abspath(args.database)
+        else:
+            database.migrate(conn)
+            report["generator"] = {"students": args.students, "courses": args.courses,
+                                   "enrollments_per_student": args.enrollments,
+                                   "grades_per_enrollment": args.grades, "seed": args.seed}
+            generator.generate(conn, args.students, args.courses, args.enrollments, args.grades, args.seed)
+    finally:
+        conn.close()
+
+def start_server(path, readers):
+    # api.py on a free port; returns the process, host and port once it listens
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api.py"),
+                               "--database", path, "--port", "0", "--readers", str(readers)],
+                              stdout=subprocess.PIPE, text=True)
+    started = time.perf_counter()
+    line = server.stdout.readline()
+    if not line.startswith("Serving on ") or time.perf_counter() - started > STARTUP_TIMEOUT:
+        server.kill()
+        raise RuntimeError(f"The server did not start: {line.strip()}")
+    url = urlsplit(line.split()[-1])
+    return server, url.hostname, url.port
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the academy JSON API")
+    parser.add_argument("--url", help="running server to test, e.g. http://127.0.0.1:8080; one is started if not given")
+    parser.add_argument("--database", help="database to serve a copy of; one is generated if not given")
+    parser.add_argument("--students", type=int, default=DEFAULT_DATASET["students"])
+    parser.add_argument("--courses", type=int, default=DEFAULT_DATASET["courses"])
+    parser.add_argument("--enrollments", type=int, default=DEFAULT_DATASET["enrollments_per_student"],
+                        help="courses per student, on average")
+    parser.add_argument("--grades", type=int, default=DEFAULT_DATASET["grades_per_enrollment"],
+                        help="grades per enrollment, on average")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--readers", type=int, default=4, help="reader threads of the started server")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds to measure")
+    parser.add_argument("--warmup", type=float, default=WARMUP, help="seconds of load before measuring")
+    parser.add_argument("--target", type=float, default=TARGET_READS, help="reads per second required")
+    parser.add_argument("--output", help="write the JSON results to this file instead of printing them")
+    args = parser.parse_args(argv)
+    
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "connections": args.connections,
+        "duration_s": args.duration,
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = None
+        try:
+            if args.url:
+                url = urlsplit(args.url)
+                host, port = url.hostname, url.port or 80
+            else:
+                path = os.path.join(work_dir, "loadtest.db")
+                prepare_database(path, args, report)
+                report["readers"] = args.readers
+                server, host, port = start_server(path, args.readers)
+            
+            counts = asyncio.run(fetch_counts(host, port))
+            if args.warmup > 0:
+                asyncio.run(load(host, port, counts, args.connections, args.warmup, args.seed + 1000))
+            results = asyncio.run(load(host, port, counts, args.connections, args.duration, args.seed))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    report.update(summarize(results, args.duration))
+    report["target_reads_per_second"] = args.target
+    
+    for name, stats in report["endpoints"].items():
+        print(f"{name:24} {stats['per_second']:9.1f}/s  p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms"
+              f"  {stats['errors']} errors", file=sys.stderr)
+    print(f"{report['reads_per_second']:.1f} reads/s, {report['writes_per_second']:.1f} writes/s, "
+          f"{report['errors']} errors", file=sys.stderr)
+    
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    
+    if report["errors"]:
+        print(f"{report['errors']} requests failed", file=sys.stderr)
+        return 1
+    if report["reads_per_second"] < args.target:
+        print(f"Below the target of {args.target:g} reads per second", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import re
+from typing import NamedTuple
+
+# Course meeting times. courses.schedule stays free text as typed, such as
+# "Mon/Wed 09:00-10:15" or "TTh 1:30-2:45pm; F 9-11"; parse() turns it into
+# weekly slots, which are kept in the course_slots table for conflict checks.
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+DAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Letters of compact day lists such as MWF or TTh
+COMPACT_DAYS = {"M": 0, "T": 1, "Tu": 1, "W": 2, "R": 3, "Th": 3, "F": 4, "S": 5, "Sa": 5, "U": 6, "Su": 6}
+COMPACT_PATTERN = re.compile(r"Th|Tu|Sa|Su|[MTWRFSU]")
+
+TIME = r"(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?"
+MEETING_PATTERN = re.compile(rf"([A-Za-z][A-Za-z/,&.\s–-]*?)\s*{TIME}\s*(?:-|–|to)\s*{TIME}", re.IGNORECASE)
+
+EXAMPLE = "Mon/Wed 09:00-10:15"
+
+class Slot(NamedTuple):
+    # A weekly meeting: day 0-6 from Monday, start and end in minutes from
+    # midnight
+    day: int
+    start: int
+    end: int
+    
+    def __str__(self):
+        return f"{DAYS[self.day]} {format_time(self.start)}-{format_time(self.end)}"
+
+def format_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def day_number(name):
+    # A day from its name or an abbreviation of two or more letters
+    name = name.lower().rstrip(".")
+    if len(name) >= 2:
+        for number, day in enumerate(DAY_NAMES):
+            if day.startswith(name):
+                return number
+    return None
+
+def range_day(name):
+    # A day at either end of a range: a name or abbreviation, or one of the
+    # compact letters, as in M-F
+    number = day_number(name)
+    if number is None:
+        number = COMPACT_DAYS.get(name.rstrip(".").capitalize())
+    return number
+
+def parse_days(text):
+    days = []
+    # "Mon - Fri" and "Mon–Fri" are the range Mon-Fri
+    text = re.sub(r"\s*[-–]\s*", "-", text.strip())
+    for part in re.split(r"(?:\band\b|[/,&\s])+", text, flags=re.IGNORECASE):
+        if not part:
+            continue
+        if "-" in part:
+            # A range such as Mon-Fri
+            first, _, last = part.partition("-")
+            first, last = range_day(first), range_day(last)
+            if first is None or last is None or first > last:
+                return None
+            days += range(first, last + 1)
+            continue
+        number = day_number(part)
+        if number is not None:
+            days.append(number)
+        elif re.fullmatch(f"(?:{COMPACT_PATTERN.pattern})+", part):
+            days += [COMPACT_DAYS[letter] for letter in COMPACT_PATTERN.findall(part)]
+        else:
+            return None
+    return days
+
+def to_minutes(hours, minutes, suffix):
+    hours = int(hours)
+    minutes = int(minutes or 0)
+    if suffix:
+        if hours > 12:
+            return None
+        hours = hours % 12 + (12 if suffix.lower().startswith("p") else 0)
+    if hours > 24 or minutes > 59 or hours * 60 + minutes > 24 * 60:
+        return None
+    return hours * 60 + minutes
+
+def parse(text):
+    # The weekly slots of a schedule, in order. An empty schedule has none;
+    # text that can't be read raises ValueError.
+    text = (text or "").strip()
+    if not text:
+        return []
+    slots = set()
+    position = 0
+    for match in MEETING_PATTERN.finditer(text):
+        # Only separators may be left between the meetings
+        if text[position:match.start()].strip(" ,;"):
+            break
+        position = match.end()
+        days = parse_days(match.group(1))
+        start_suffix, end_suffix = match.group(4), match.group(7)
+        if end_suffix and not start_suffix:
+            # "1:30-2:45pm": the start shares the end's half of the day
+            # unless that would put it after the end
+            start = to_minutes(match.group(2), match.group(3), end_suffix)
+            end = to_minutes(match.group(5), match.group(6), end_suffix)
+            if start is not None and end is not None and start >= end:
+                start = to_minutes(match.group(2), match.group(3), "am")
+        else:
+            start = to_minutes(match.group(2), match.group(3), start_suffix)
+            end = to_minutes(match.group(5), match.group(6), end_suffix)
+        if not days or start is None or end is None or start >= end:
+            break
+        slots.update(Slot(day, start, end) for day in days)
+    else:
+        if slots and not text[position:].strip(" ,;"):
+            return sorted(slots)
+    raise ValueError(f"Schedule not understood: {text}. Give days and times such as {EXAMPLE}")
+
+def format_slots(slots):
+    return ", ".join(str(slot) for slot in slots)
+
+def overlapping_pairs(slots):
+    # Sweep (key, slot) pairs in order of time, keeping the slots still in
+    # progress, and yield (key, other key, overlap) for every two that meet at
+    # the same time. One pass over the sorted slots, plus the overlaps found.
+    active = []
+    for key, slot in sorted(slots, key=lambda item: item[1]):
+        active = [(other_key, other) for other_key, other in active
+                  if other.day == slot.day and other.end > slot.start]
+        for other_key, other in active:
+            yield other_key, key, Slot(slot.day, slot.start, min(slot.end, other.end))
+        active.append((key, slot))
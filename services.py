@@ -0,0 +1,869 @@
+import json
+import math
+from contextlib import contextmanager
+import sqlite3
+from datetime import date, datetime
+from typing import NamedTuple
+import database
+import schedule
+from importer import valid_date
+
+# Data access for the academy, independent of the Tk interface so it can be
+# scripted, batch processed and benchmarked without a display. Every write
+# method runs in one transaction and returns what it changed as
+# (table, action, row id) tuples or the new row ids.
+
+# Number of ranked matches a search returns
+SEARCH_LIMIT = 200
+
+# Batches at least this large skip the per-row insert triggers and update the
+# search index and counters once at the end
+BULK_THRESHOLD = 1000
+
+# Rows on a page of a list unless asked for another number
+PAGE_LIMIT = 100
+
+# Audit entries held in memory before they are written as one batch
+AUDIT_BATCH = 100
+
+# Audit entries per page
+AUDIT_PAGE = 50
+
+# Conflicts listed in the message of a ScheduleConflict
+CONFLICTS_SHOWN = 10
+
+class Student(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone: str
+    dob: str
+    address: str
+    enrollment_date: str
+    
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+class Course(NamedTuple):
+    id: int
+    code: str
+    name: str
+    department: str
+    credits: int
+    instructor: str
+    schedule: str
+    room: str
+
+class Enrollment(NamedTuple):
+    id: int
+    student_id: int
+    course_id: int
+    enrollment_date: str
+
+class Grade(NamedTuple):
+    id: int
+    enrollment_id: int
+    student_id: int
+    course_id: int
+    grade: float
+    grade_date: str
+
+class StudentStats(NamedTuple):
+    student_id: int
+    grades: int
+    credits: float
+    average: float
+    gpa: float
+
+class CourseStats(NamedTuple):
+    course_id: int
+    grades: int
+    mean: float
+    stddev: float
+    minimum: float
+    maximum: float
+
+class Conflict(NamedTuple):
+    # Two courses meeting at the same time in the same room, with the same
+    # instructor or with a student taking both. subject is the room,
+    # instructor or student name; subject_id the student's id.
+    kind: str
+    subject_id: int
+    subject: str
+    course_id: int
+    course: str
+    other_course_id: int
+    other_course: str
+    slot: schedule.Slot
+    
+    def __str__(self):
+        verb = {"room": "Room {} is booked for", "instructor": "{} teaches", "student": "{} takes"}[self.kind]
+        return f"{verb.format(self.subject)} {self.other_course} on {self.slot}"
+
+class ScheduleConflict(ValueError):
+    # A save or enrollment refused because of clashing schedules; pass
+    # check_conflicts=False to go ahead anyway
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        lines = [str(conflict) for conflict in conflicts[:CONFLICTS_SHOWN]]
+        if len(conflicts) > CONFLICTS_SHOWN:
+            lines.append(f"and {len(conflicts) - CONFLICTS_SHOWN} more")
+        super().__init__("Schedule conflict:\n" + "\n".join(lines))
+
+class AuditEntry(NamedTuple):
+    id: int
+    logged_at: str
+    entity: str
+    entity_id: int
+    message: str
+
+def search_ids(cursor, table, columns, search_term, limit=SEARCH_LIMIT):
+    # Ranked ids of the rows matching a search term, best matches first
+    ids = []
+    if search_term.isdigit():
+        cursor.execute(f"SELECT id FROM {table} WHERE id=?", (int(search_term),))
+        ids += [row[0] for row in cursor.fetchall()]
+    
+    if len(search_term) >= 3:
+        # The trigram index matches any substring of three or more characters
+        phrase = '"' + search_term.replace('"', '""') + '"'
+        cursor.execute(f'''
+            SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?
+            ORDER BY rank LIMIT ?
+        ''', (phrase, limit))
+    else:
+        # Too short for trigrams, fall back to a prefix match
+        pattern = search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where = " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in columns)
+        cursor.execute(f"SELECT id FROM {table} WHERE {where} LIMIT ?",
+                       [f"{pattern}%"] * len(columns) + [limit])
+    ids += [row[0] for row in cursor.fetchall() if row[0] not in ids]
+    return ids
+
+def id_condition(column, ids):
+    # "column = ?" for one id, or a condition matching any of a list of ids
+    # passed as a single JSON parameter so there is no limit on their number
+    if isinstance(ids, int):
+        return f"{column} = ?", ids
+    return f"{column} IN (SELECT value FROM json_each(?))", json.dumps(list(ids))
+
+def id_filter(filters):
+    # A condition and its parameters for (column, ids) pairs, each an id or a
+    # list of ids; columns given None are not filtered on
+    conditions = []
+    params = []
+    for column, ids in filters:
+        if ids is not None:
+            condition, param = id_condition(column, ids)
+            conditions.append(condition)
+            params.append(param)
+    return " AND ".join(conditions) or "1", params
+
+def rows_by_id(rows, ids, row_type):
+    # Rows in the order of a list of ids, e.g. ranked search results, leaving
+    # out ids that have no row
+    found = {row[0]: row_type(*row) for row in rows}
+    return [found[row_id] for row_id in ids if row_id in found]
+
+@contextmanager
+def new_rows(cursor, table, bulk):
+    # Collect the ids of the rows inserted into a table inside the block.
+    # Bulk inserts update the search index and counters once at the end
+    # instead of row by row.
+    if bulk:
+        last_id = database.suspend_insert_triggers(cursor, table)
+    else:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        last_id = cursor.fetchone()[0]
+    ids = []
+    yield ids
+    if bulk:
+        database.resume_insert_triggers(cursor, table, last_id)
+    # The write lock is held, so every row after last_id is one of ours
+    cursor.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY id", (last_id,))
+    ids.extend(row[0] for row in cursor.fetchall())
+
+def insert_many(cursor, table, insert, rows):
+    # executemany for a batch of inserts, returning the new ids
+    with new_rows(cursor, table, len(rows) >= BULK_THRESHOLD) as ids:
+        cursor.executemany(insert, rows)
+    return ids
+
+def student_source(student_ids=None, cohort_id=None, course_id=None):
+    # A subquery for a group of students: a list of ids, the members of a
+    # saved cohort or the students taking a course
+    if student_ids is not None:
+        return "SELECT value FROM json_each(?)", json.dumps(list(student_ids))
+    if cohort_id is not None:
+        return "SELECT student_id FROM cohort_members WHERE cohort_id = ?", cohort_id
+    if course_id is not None:
+        return "SELECT student_id FROM enrollments WHERE course_id = ?", course_id
+    raise ValueError("No students given")
+
+def delete_grades(cursor, condition, params):
+    # Delete the grades of the enrollments "e" matching a condition. Large
+    # deletes adjust the grade totals once for the whole set.
+    cursor.execute(f"SELECT COUNT(*) FROM grades WHERE enrollment_id IN (SELECT e.id FROM enrollments e WHERE {condition})",
+                   params)
+    if cursor.fetchone()[0] >= BULK_THRESHOLD:
+        database.bulk_delete_grades(cursor, condition, params)
+    else:
+        cursor.execute(f"DELETE FROM grades WHERE enrollment_id IN (SELECT e.id FROM enrollments e WHERE {condition})",
+                       params)
+
+COURSE_LABEL = "{0}.code || ' - ' || {0}.name"
+
+def conflict_rows(cursor, kind, query, params):
+    cursor.execute(query, params)
+    return [Conflict(kind, subject_id, subject, course_id, course, other_id, other, schedule.Slot(day, start, end))
+            for subject_id, subject, course_id, course, other_id, other, day, start, end in cursor.fetchall()]
+
+def booking_conflicts(cursor, course_ids):
+    # Other courses in the same room or with the same instructor at the same
+    # time as any of the given courses. Slots that overlap one must start
+    # less than the longest slot before it, so each slot is one index range
+    # on (room or instructor, day, start).
+    cursor.execute("SELECT COALESCE(MAX(end_minute - start_minute), 0) FROM course_slots")
+    longest = cursor.fetchone()[0]
+    condition, param = id_condition("t.course_id", course_ids)
+    conflicts = []
+    for column in ("room", "instructor"):
+        conflicts += conflict_rows(cursor, column, f'''
+            SELECT NULL, t.{column}, t.course_id, {COURSE_LABEL.format("c")}, o.course_id, {COURSE_LABEL.format("oc")},
+                   t.day, MAX(t.start_minute, o.start_minute), MIN(t.end_minute, o.end_minute)
+            FROM course_slots t
+            JOIN course_slots o ON o.{column} = t.{column} AND o.day = t.day
+                AND o.start_minute > t.start_minute - ? AND o.start_minute < t.end_minute
+                AND o.end_minute > t.start_minute AND o.course_id <> t.course_id
+            JOIN courses c ON c.id = t.course_id
+            JOIN courses oc ON oc.id = o.course_id
+            WHERE {condition}
+            ORDER BY t.course_id, t.day, t.start_minute
+        ''', (longest, param))
+    # Two of the given courses clashing with each other are listed once
+    seen = set()
+    unique = []
+    for conflict in conflicts:
+        key = (conflict.kind, min(conflict.course_id, conflict.other_course_id),
+               max(conflict.course_id, conflict.other_course_id), conflict.slot)
+        if key not in seen:
+            seen.add(key)
+            unique.append(conflict)
+    return unique
+
+def student_conflicts(cursor, student_id, course_id):
+    # The student's other courses meeting at the same time as a course, one
+    # index range per slot of the course and course the student takes
+    return conflict_rows(cursor, "student", f'''
+        SELECT s.id, s.first_name || ' ' || s.last_name, t.course_id, {COURSE_LABEL.format("c")},
+               o.course_id, {COURSE_LABEL.format("oc")},
+               t.day, MAX(t.start_minute, o.start_minute), MIN(t.end_minute, o.end_minute)
+        FROM course_slots t
+        JOIN enrollments e ON e.student_id = ? AND e.course_id <> t.course_id
+        JOIN course_slots o ON o.course_id = e.course_id AND o.day = t.day
+            AND o.start_minute < t.end_minute AND o.end_minute > t.start_minute
+        JOIN students s ON s.id = e.student_id
+        JOIN courses c ON c.id = t.course_id
+        JOIN courses oc ON oc.id = o.course_id
+        WHERE t.course_id = ?
+        ORDER BY t.day, t.start_minute
+    ''', (student_id, course_id))
+
+def insert_enrollments(cursor, pairs):
+    # Insert (student id, course id) pairs, skipping those already enrolled,
+    # and return the ids of the new enrollments
+    return insert_many(cursor, "enrollments", '''
+        INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)
+        ON CONFLICT (student_id, course_id) DO NOTHING
+    ''', pairs)
+
+class Repository:
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def dependent_changes(self, condition, params):
+        # Enrollment and grade rows matching a condition on enrollments "e",
+        # which go away along with the rows being deleted
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT e.id FROM enrollments e WHERE {condition}", params)
+        changes = [("enrollments", "delete", row[0]) for row in cursor.fetchall()]
+        cursor.execute(f'''
+            SELECT g.id FROM grades g
+            JOIN enrollments e ON g.enrollment_id = e.id
+            WHERE {condition}
+        ''', params)
+        changes += [("grades", "delete", row[0]) for row in cursor.fetchall()]
+        return changes
+
+class StudentRepository(Repository):
+    FIELDS = ["first_name", "last_name", "email", "phone", "dob", "address"]
+    
+    def get(self, student_id):
+        row = self.conn.execute("SELECT * FROM students WHERE id=?", (student_id,)).fetchone()
+        return Student(*row) if row else None
+    
+    def get_many(self, student_ids):
+        student_ids = list(student_ids)
+        rows = self.conn.execute("SELECT * FROM students WHERE id IN (SELECT value FROM json_each(?))",
+                                 (json.dumps(student_ids),)).fetchall()
+        return rows_by_id(rows, student_ids, Student)
+    
+    def page(self, after=0, limit=PAGE_LIMIT):
+        # Students in order of id from the one after a given id; pass the last
+        # id of a page to get the next
+        rows = self.conn.execute("SELECT * FROM students WHERE id > ? ORDER BY id LIMIT ?", (after, limit)).fetchall()
+        return [Student(*row) for row in rows]
+    
+    def full_name(self, student_id):
+        row = self.conn.execute("SELECT first_name || ' ' || last_name FROM students WHERE id=?",
+                                (student_id,)).fetchone()
+        return row[0] if row else None
+    
+    def names(self):
+        # (id, full name) of every student, for choosing one by name
+        return self.conn.execute("SELECT id, first_name || ' ' || last_name FROM students").fetchall()
+    
+    def search(self, search_term, limit=SEARCH_LIMIT):
+        return search_ids(self.conn.cursor(), "students", database.SEARCH_COLUMNS["students"], search_term, limit)
+    
+    def validate(self, values):
+        values = tuple(values)
+        if len(values) != len(self.FIELDS):
+            raise ValueError(f"A student has {len(self.FIELDS)} fields: {', '.join(self.FIELDS)}")
+        first_name, last_name, email = values[:3]
+        if not first_name or not last_name or not email:
+            raise ValueError("First name, last name, and email are required!")
+        return values
+    
+    def add(self, first_name, last_name, email, phone="", dob="", address=""):
+        return self.add_many([(first_name, last_name, email, phone, dob, address)])[0]
+    
+    def add_many(self, rows):
+        # Insert (first_name, last_name, email, phone, dob, address) rows,
+        # all or none, and return their ids in order
+        rows = [self.validate(row) for row in rows]
+        try:
+            with database.transaction(self.conn) as cursor:
+                return insert_many(cursor, "students", '''
+                    INSERT INTO students (first_name, last_name, email, phone, dob, address)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+        except sqlite3.IntegrityError:
+            raise ValueError("Email must be unique!")
+    
+    def update(self, student_id, first_name, last_name, email, phone="", dob="", address=""):
+        values = self.validate((first_name, last_name, email, phone, dob, address))
+        try:
+            with database.transaction(self.conn) as cursor:
+                cursor.execute('''
+                    UPDATE students
+                    SET first_name=?, last_name=?, email=?, phone=?, dob=?, address=?
+                    WHERE id=?
+                ''', values + (student_id,))
+        except sqlite3.IntegrityError:
+            raise ValueError("Email must be unique!")
+        return [("students", "update", student_id)]
+    
+    def delete(self, student_id):
+        # Delete a student with their enrollments and grades
+        return self.delete_many([student_id])
+    
+    def delete_many(self, student_ids):
+        # Delete several students with their enrollments and grades in one
+        # transaction. The grades go first as one set so their totals are
+        # adjusted in bulk; the enrollments cascade.
+        student_ids = sorted(set(student_ids))
+        condition, param = id_condition("e.student_id", student_ids)
+        with database.transaction(self.conn) as cursor:
+            changes = self.dependent_changes(condition, (param,))
+            delete_grades(cursor, condition, (param,))
+            cursor.execute("DELETE FROM students WHERE id IN (SELECT value FROM json_each(?))", (param,))
+        return changes + [("students", "delete", student_id) for student_id in student_ids]
+    
+    def enrollments(self, student_id):
+        # (course code, course name, enrollment date) of a student's courses
+        return self.conn.execute('''
+            SELECT c.code, c.name, e.enrollment_date
+            FROM enrollments e
+            JOIN courses c ON e.course_id = c.id
+            WHERE e.student_id=?
+        ''', (student_id,)).fetchall()
+
+class CourseRepository(Repository):
+    FIELDS = ["code", "name", "department", "credits", "instructor", "schedule", "room"]
+    
+    def get(self, course_id):
+        row = self.conn.execute("SELECT * FROM courses WHERE id=?", (course_id,)).fetchone()
+        return Course(*row) if row else None
+    
+    def get_many(self, course_ids):
+        course_ids = list(course_ids)
+        rows = self.conn.execute("SELECT * FROM courses WHERE id IN (SELECT value FROM json_each(?))",
+                                 (json.dumps(course_ids),)).fetchall()
+        return rows_by_id(rows, course_ids, Course)
+    
+    def page(self, after=0, limit=PAGE_LIMIT):
+        rows = self.conn.execute("SELECT * FROM courses WHERE id > ? ORDER BY id LIMIT ?", (after, limit)).fetchall()
+        return [Course(*row) for row in rows]
+    
+    def name(self, course_id):
+        row = self.conn.execute("SELECT name FROM courses WHERE id=?", (course_id,)).fetchone()
+        return row[0] if row else None
+    
+    def names(self):
+        return self.conn.execute("SELECT id, name FROM courses").fetchall()
+    
+    def search(self, search_term, limit=SEARCH_LIMIT):
+        return search_ids(self.conn.cursor(), "courses", database.SEARCH_COLUMNS["courses"], search_term, limit)
+    
+    def validate(self, values):
+        values = list(values)
+        if len(values) != len(self.FIELDS):
+            raise ValueError(f"A course has {len(self.FIELDS)} fields: {', '.join(self.FIELDS)}")
+        code, name, credits = values[0], values[1], values[3]
+        if not code or not name:
+            raise ValueError("Course code and name are required!")
+        try:
+            values[3] = int(credits) if credits not in (None, "") else 3
+        except ValueError:
+            raise ValueError("Credits must be a number")
+        # A schedule that can't be read, such as "TBA", is saved as typed
+        # but gets no slots, so it takes no part in conflict checks
+        return tuple(values)
+    
+    def add(self, code, name, department="", credits=3, instructor="", schedule="", room="", check_conflicts=True):
+        return self.add_many([(code, name, department, credits, instructor, schedule, room)], check_conflicts)[0]
+    
+    def add_many(self, rows, check_conflicts=True):
+        # Insert (code, name, department, credits, instructor, schedule, room)
+        # rows, all or none, and return their ids in order. Rooms or
+        # instructors booked twice at the same time raise ScheduleConflict.
+        rows = [self.validate(row) for row in rows]
+        try:
+            with database.transaction(self.conn) as cursor:
+                ids = insert_many(cursor, "courses", '''
+                    INSERT INTO courses (code, name, department, credits, instructor, schedule, room)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                self.index_schedules(cursor, ids, check_conflicts)
+                return ids
+        except sqlite3.IntegrityError:
+            raise ValueError("Course code must be unique!")
+    
+    def update(self, course_id, code, name, department="", credits=3, instructor="", schedule="", room="",
+               check_conflicts=True):
+        values = self.validate((code, name, department, credits, instructor, schedule, room))
+        try:
+            with database.transaction(self.conn) as cursor:
+                cursor.execute('''
+                    UPDATE courses
+                    SET code=?, name=?, department=?, credits=?, instructor=?, schedule=?, room=?
+                    WHERE id=?
+                ''', values + (course_id,))
+                self.index_schedules(cursor, [course_id], check_conflicts)
+        except sqlite3.IntegrityError:
+            raise ValueError("Course code must be unique!")
+        return [("courses", "update", course_id)]
+    
+    def index_schedules(self, cursor, course_ids, check_conflicts):
+        # Store the slots of saved courses, then look for double bookings
+        # with the new slots in place, which rolls the save back
+        condition, param = id_condition("id", course_ids)
+        database.index_schedules(cursor, condition, (param,))
+        if check_conflicts:
+            conflicts = booking_conflicts(cursor, course_ids)
+            if conflicts:
+                raise ScheduleConflict(conflicts)
+    
+    def delete(self, course_id):
+        # Delete a course with its enrollments and their grades
+        return self.delete_many([course_id])
+    
+    def delete_many(self, course_ids):
+        # Delete several courses with their enrollments and grades in one
+        # transaction, like StudentRepository.delete_many
+        course_ids = sorted(set(course_ids))
+        condition, param = id_condition("e.course_id", course_ids)
+        with database.transaction(self.conn) as cursor:
+            changes = self.dependent_changes(condition, (param,))
+            delete_grades(cursor, condition, (param,))
+            cursor.execute("DELETE FROM courses WHERE id IN (SELECT value FROM json_each(?))", (param,))
+        return changes + [("courses", "delete", course_id) for course_id in course_ids]
+    
+    def enrollments(self, course_id):
+        # (student name, enrollment date) of the students taking a course
+        return self.conn.execute('''
+            SELECT s.first_name || ' ' || s.last_name, e.enrollment_date
+            FROM enrollments e
+            JOIN students s ON e.student_id = s.id
+            WHERE e.course_id=?
+        ''', (course_id,)).fetchall()
+
+class EnrollmentRepository(Repository):
+    def get(self, enrollment_id):
+        row = self.conn.execute("SELECT id, student_id, course_id, enrollment_date FROM enrollments WHERE id=?",
+                                (enrollment_id,)).fetchone()
+        return Enrollment(*row) if row else None
+    
+    def page(self, after=0, limit=PAGE_LIMIT, student_id=None, course_id=None):
+        # Enrollments in order of id, optionally of some students or courses
+        # (an id or a list of ids), like StudentRepository.page
+        where, params = id_filter([("student_id", student_id), ("course_id", course_id)])
+        rows = self.conn.execute(f'''
+            SELECT id, student_id, course_id, enrollment_date FROM enrollments
+            WHERE {where} AND id > ? ORDER BY id LIMIT ?
+        ''', params + [after, limit]).fetchall()
+        return [Enrollment(*row) for row in rows]
+    
+    def find(self, student_id, course_id):
+        row = self.conn.execute("SELECT id FROM enrollments WHERE student_id=? AND course_id=?",
+                                (student_id, course_id)).fetchone()
+        return row[0] if row else None
+    
+    def enroll(self, student_id, course_id, check_conflicts=True):
+        # Enroll one student, refusing with ScheduleConflict if the course
+        # meets at the same time as one they already take. The check runs in
+        # the write transaction, so no other writer can enroll them in a
+        # clashing course between the check and the insert.
+        with database.transaction(self.conn) as cursor:
+            if check_conflicts:
+                conflicts = student_conflicts(cursor, student_id, course_id)
+                if conflicts:
+                    raise ScheduleConflict(conflicts)
+            ids = insert_enrollments(cursor, [(student_id, course_id)])
+        if not ids:
+            raise ValueError("Student is already enrolled in this course")
+        return ids[0]
+    
+    def enroll_many(self, pairs):
+        # Enroll (student id, course id) pairs and return the ids of the new
+        # enrollments; pairs that are already enrolled are left as they are
+        pairs = [(student_id, course_id) for student_id, course_id in pairs]
+        with database.transaction(self.conn) as cursor:
+            return insert_enrollments(cursor, pairs)
+    
+    def enroll_group(self, course_ids, student_ids=None, cohort_id=None, from_course_id=None):
+        # Enroll a group of students (see student_source) in one or more
+        # courses with a single INSERT ... SELECT. Returns the ids of the new
+        # enrollments and the number of pairs that were already enrolled.
+        source, source_param = student_source(student_ids, cohort_id, from_course_id)
+        courses = json.dumps(sorted(set(course_ids)))
+        with database.transaction(self.conn) as cursor:
+            cursor.execute(f'''
+                SELECT (SELECT COUNT(*) FROM students WHERE id IN ({source}))
+                     * (SELECT COUNT(*) FROM courses WHERE id IN (SELECT value FROM json_each(?)))
+            ''', (source_param, courses))
+            pairs = cursor.fetchone()[0]
+            with new_rows(cursor, "enrollments", pairs >= BULK_THRESHOLD) as ids:
+                cursor.execute(f'''
+                    INSERT INTO enrollments (student_id, course_id)
+                    SELECT s.id, c.id FROM students s CROSS JOIN courses c
+                    WHERE s.id IN ({source}) AND c.id IN (SELECT value FROM json_each(?))
+                    ON CONFLICT (student_id, course_id) DO NOTHING
+                ''', (source_param, courses))
+        return ids, pairs - len(ids)
+    
+    def unenroll(self, enrollment_id):
+        # Remove an enrollment with its grades
+        with database.transaction(self.conn) as cursor:
+            changes = self.dependent_changes("e.id = ?", (enrollment_id,))
+            delete_grades(cursor, "e.id = ?", (enrollment_id,))
+            cursor.execute("DELETE FROM enrollments WHERE id=?", (enrollment_id,))
+        return changes
+
+class GradeRepository(Repository):
+    def validate(self, values):
+        enrollment_id, grade, grade_date = values
+        try:
+            grade = float(grade)
+        except (TypeError, ValueError):
+            raise ValueError(f"Grade must be a number: {grade}")
+        if not 0 <= grade <= 100:
+            raise ValueError(f"Grade must be between 0 and 100: {grade}")
+        if grade_date and not valid_date(grade_date):
+            raise ValueError(f"Grade date must be YYYY-MM-DD: {grade_date}")
+        return (enrollment_id, grade, grade_date or date.today().isoformat())
+    
+    def assign(self, enrollment_id, grade, grade_date=None):
+        return self.assign_many([(enrollment_id, grade, grade_date)])[0]
+    
+    def assign_many(self, rows):
+        # Record (enrollment id, grade, date or None for today) rows, all or
+        # none, and return their ids in order
+        rows = [self.validate(row) for row in rows]
+        try:
+            with database.transaction(self.conn) as cursor:
+                return insert_many(cursor, "grades",
+                                   "INSERT INTO grades (enrollment_id, grade, grade_date) VALUES (?, ?, ?)", rows)
+        except sqlite3.IntegrityError:
+            raise ValueError("Grades can only be assigned to existing enrollments")
+    
+    def roster(self, course_id):
+        # (enrollment id, student id, name, email, latest grade, its date) of
+        # everyone taking a course, for entering the course's grades
+        return self.conn.execute('''
+            SELECT e.id, s.id, s.first_name || ' ' || s.last_name, s.email, g.grade, g.grade_date
+            FROM enrollments e
+            JOIN students s ON e.student_id = s.id
+            LEFT JOIN grades g ON g.id = (SELECT MAX(id) FROM grades WHERE enrollment_id = e.id)
+            WHERE e.course_id = ?
+            ORDER BY s.last_name, s.first_name, s.id
+        ''', (course_id,)).fetchall()
+    
+    def student_stats(self, student_ids):
+        # Credit-weighted average and GPA of one or more students (an id or a
+        # list of ids) from the totals kept by triggers. Students without
+        # grades are left out.
+        condition, param = id_condition("student_id", student_ids)
+        rows = self.conn.execute(f'''
+            SELECT student_id, grades, credits, weighted_sum, weighted_points
+            FROM student_grade_stats WHERE {condition}
+        ''', (param,)).fetchall()
+        return [StudentStats(student_id, grades, credits,
+                             weighted_sum / credits if credits else None, weighted_points / credits if credits else None)
+                for student_id, grades, credits, weighted_sum, weighted_points in rows]
+    
+    def top_students(self, limit):
+        # The students with the best GPA, from the same totals
+        rows = self.conn.execute('''
+            SELECT student_id, grades, credits, weighted_sum, weighted_points
+            FROM student_grade_stats WHERE credits > 0
+            ORDER BY weighted_points / credits DESC, student_id LIMIT ?
+        ''', (limit,)).fetchall()
+        return [StudentStats(student_id, grades, credits, weighted_sum / credits, weighted_points / credits)
+                for student_id, grades, credits, weighted_sum, weighted_points in rows]
+    
+    def course_stats(self, course_ids):
+        # Mean, standard deviation, minimum and maximum grade of one or more
+        # courses from the totals kept by triggers
+        condition, param = id_condition("course_id", course_ids)
+        rows = self.conn.execute(f'''
+            SELECT course_id, grades, total, total_squares, minimum, maximum
+            FROM course_grade_stats WHERE {condition}
+        ''', (param,)).fetchall()
+        result = []
+        for course_id, grades, total, total_squares, minimum, maximum in rows:
+            mean = total / grades
+            result.append(CourseStats(course_id, grades, mean, math.sqrt(max(total_squares / grades - mean * mean, 0)),
+                                      minimum, maximum))
+        return result
+    
+    def grades_for(self, enrollment_id=None, student_id=None, course_id=None):
+        # Grades of one or more enrollments, students or courses (each an id
+        # or a list of ids), oldest first within each enrollment
+        where, params = id_filter([("g.enrollment_id", enrollment_id), ("e.student_id", student_id),
+                                   ("e.course_id", course_id)])
+        rows = self.conn.execute(f'''
+            SELECT g.id, g.enrollment_id, e.student_id, e.course_id, g.grade, g.grade_date
+            FROM grades g
+            JOIN enrollments e ON g.enrollment_id = e.id
+            WHERE {where}
+            ORDER BY g.enrollment_id, g.id
+        ''', params).fetchall()
+        return [Grade(*row) for row in rows]
+    
+    def page(self, after=0, limit=PAGE_LIMIT, enrollment_id=None, student_id=None, course_id=None):
+        # Grades in order of id, filtered like grades_for and paged like
+        # StudentRepository.page
+        where, params = id_filter([("g.enrollment_id", enrollment_id), ("e.student_id", student_id),
+                                   ("e.course_id", course_id)])
+        rows = self.conn.execute(f'''
+            SELECT g.id, g.enrollment_id, e.student_id, e.course_id, g.grade, g.grade_date
+            FROM grades g
+            JOIN enrollments e ON g.enrollment_id = e.id
+            WHERE {where} AND g.id > ?
+            ORDER BY g.id LIMIT ?
+        ''', params + [after, limit]).fetchall()
+        return [Grade(*row) for row in rows]
+
+class CohortRepository(Repository):
+    def names(self):
+        return self.conn.execute("SELECT id, name FROM cohorts ORDER BY name").fetchall()
+    
+    def members(self, cohort_id):
+        return [row[0] for row in self.conn.execute(
+            "SELECT student_id FROM cohort_members WHERE cohort_id = ?", (cohort_id,))]
+    
+    def save(self, name, student_ids=None, cohort_id=None, course_id=None):
+        # Save a group of students (see student_source) under a name,
+        # replacing the members of a cohort with that name. Returns its id.
+        name = (name or "").strip()
+        if not name:
+            raise ValueError("A cohort needs a name")
+        source, source_param = student_source(student_ids, cohort_id, course_id)
+        with database.transaction(self.conn) as cursor:
+            # Materialise the group first, it may be the cohort being replaced
+            cursor.execute(f"SELECT id FROM students WHERE id IN ({source})", (source_param,))
+            members = json.dumps([row[0] for row in cursor.fetchall()])
+            cursor.execute("INSERT INTO cohorts (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (name,))
+            cursor.execute("SELECT id FROM cohorts WHERE name = ?", (name,))
+            saved_id = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM cohort_members WHERE cohort_id = ?", (saved_id,))
+            cursor.execute('''
+                INSERT INTO cohort_members (cohort_id, student_id)
+                SELECT ?, value FROM json_each(?)
+            ''', (saved_id, members))
+        return saved_id
+    
+    def delete(self, cohort_id):
+        with database.transaction(self.conn) as cursor:
+            cursor.execute("DELETE FROM cohorts WHERE id = ?", (cohort_id,))
+
+class ScheduleRepository(Repository):
+    def slots(self, course_id):
+        return [schedule.Slot(*row) for row in self.conn.execute('''
+            SELECT day, start_minute, end_minute FROM course_slots WHERE course_id = ? ORDER BY day, start_minute
+        ''', (course_id,))]
+    
+    def unreadable(self):
+        # (id, code, schedule) of the courses whose schedule has no slots
+        # because it could not be read
+        return self.conn.execute('''
+            SELECT id, code, schedule FROM courses
+            WHERE TRIM(COALESCE(schedule, '')) <> ''
+            AND NOT EXISTS (SELECT 1 FROM course_slots WHERE course_id = courses.id)
+            ORDER BY code
+        ''').fetchall()
+    
+    def booking_conflicts(self, course_ids):
+        return booking_conflicts(self.conn.cursor(), course_ids)
+    
+    def student_conflicts(self, student_id, course_id):
+        return student_conflicts(self.conn.cursor(), student_id, course_id)
+    
+    def conflicts(self):
+        # Every conflict in the catalogue. One sweep over all slots in order
+        # of time finds the pairs of courses that meet at the same time; the
+        # pairs sharing a room or instructor are conflicts, and the students
+        # taking both courses of a pair are found with one join.
+        rows = self.conn.execute(
+            "SELECT course_id, day, start_minute, end_minute, room, instructor FROM course_slots").fetchall()
+        bookings = {course_id: (room, instructor) for course_id, _, _, _, room, instructor in rows}
+        labels = dict(self.conn.execute(f"SELECT id, {COURSE_LABEL.format('courses')} FROM courses"))
+        
+        conflicts = []
+        pairs = {}
+        slots = [(course_id, schedule.Slot(day, start, end)) for course_id, day, start, end, _, _ in rows]
+        for course_id, other_id, slot in schedule.overlapping_pairs(slots):
+            if course_id == other_id:
+                continue
+            course_id, other_id = min(course_id, other_id), max(course_id, other_id)
+            pairs.setdefault((course_id, other_id), slot)
+            for kind, value, other in zip(("room", "instructor"), bookings[course_id], bookings[other_id]):
+                if value is not None and other is not None and value.lower() == other.lower():
+                    conflicts.append(Conflict(kind, None, value, course_id, labels[course_id],
+                                              other_id, labels[other_id], slot))
+        
+        # The students of each course in a pair, read in one pass over the
+        # (student, course) index, then intersected in memory
+        courses = sorted({course_id for pair in pairs for course_id in pair})
+        students = {course_id: set() for course_id in courses}
+        cursor = self.conn.execute('''
+            SELECT student_id, course_id FROM enrollments INDEXED BY idx_enrollments_student_course
+            WHERE course_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(courses),))
+        for student_id, course_id in cursor:
+            students[course_id].add(student_id)
+        clashes = [(student_id, course_id, other_id) for (course_id, other_id) in pairs
+                   for student_id in students[course_id] & students[other_id]]
+        clashes.sort()
+        names = dict(self.conn.execute('''
+            SELECT id, first_name || ' ' || last_name FROM students WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted({student_id for student_id, _, _ in clashes})),)))
+        for student_id, course_id, other_id in clashes:
+            conflicts.append(Conflict("student", student_id, names[student_id], course_id, labels[course_id],
+                                      other_id, labels[other_id], pairs[course_id, other_id]))
+        return conflicts
+
+class AuditLog(Repository):
+    # The persistent activity log. Entries are buffered and written a batch
+    # at a time, so recording one costs a list append; call flush() to write
+    # them out sooner, e.g. on a timer and before closing.
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.pending = []
+    
+    def record(self, message, entity=None, entity_id=None):
+        # Log a message, optionally about one table ("students") or one of its
+        # rows. Returns the time it was logged at.
+        logged_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.pending.append((logged_at, entity, entity_id, message))
+        if len(self.pending) >= AUDIT_BATCH:
+            self.flush()
+        return logged_at
+    
+    def flush(self):
+        if not self.pending:
+            return 0
+        rows, self.pending = self.pending, []
+        try:
+            with database.transaction(self.conn) as cursor:
+                cursor.executemany("INSERT INTO audit_log (logged_at, entity, entity_id, message) VALUES (?, ?, ?, ?)",
+                                   rows)
+        except Exception:
+            self.pending[:0] = rows
+            raise
+        return len(rows)
+    
+    def entries(self, entity=None, entity_id=None, start=None, end=None, before=None, limit=AUDIT_PAGE):
+        # Newest entries first, optionally about one entity and between two
+        # times (inclusive; a date alone covers the whole day). For the next
+        # page pass the last entry of this one as before.
+        self.flush()
+        conditions = []
+        params = []
+        if entity is not None:
+            conditions.append("entity = ?")
+            params.append(entity)
+            if entity_id is not None:
+                conditions.append("entity_id = ?")
+                params.append(entity_id)
+        if start:
+            conditions.append("logged_at >= ?")
+            params.append(start)
+        if end:
+            conditions.append("logged_at <= ?")
+            params.append(end if len(end) > 10 else end + " 23:59:59")
+        if before is not None:
+            conditions.append("(logged_at, id) < (?, ?)")
+            params += [before.logged_at, before.id]
+        where = " AND ".join(conditions) or "1"
+        rows = self.conn.execute(f'''
+            SELECT id, logged_at, entity, entity_id, message FROM audit_log
+            WHERE {where}
+            ORDER BY logged_at DESC, id DESC LIMIT ?
+        ''', params + [limit]).fetchall()
+        return [AuditEntry(*row) for row in rows]
+
+class AcademyService:
+    # The repositories of one connection
+    def __init__(self, conn):
+        self.conn = conn
+        self.students = StudentRepository(conn)
+        self.courses = CourseRepository(conn)
+        self.enrollments = EnrollmentRepository(conn)
+        self.grades = GradeRepository(conn)
+        self.cohorts = CohortRepository(conn)
+        self.schedule = ScheduleRepository(conn)
+        self.audit = AuditLog(conn)
+    
+    @classmethod
+    def open(cls, path=None, profile=None):
+        # Connect to the configured database and bring its schema up to date
+        conn = database.connect(path, profile)
+        database.migrate(conn)
+        return cls(conn)
+    
+    def stats(self):
+        return database.read_stats(self.conn.cursor())
+    
+    def delete_orphans(self):
+        # Purge rows left pointing at deleted ones, see database.delete_orphans
+        with database.transaction(self.conn) as cursor:
+            return database.delete_orphans(cursor)
+    
+    def close(self):
+        self.audit.flush()
+        self.conn.close()
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import database
+
+class MigrateTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.work_dir.name, "academy.db")
+    
+    def tearDown(self):
+        self.work_dir.cleanup()
+    
+    def test_baseline_database_with_orphans(self):
+        # A database from before migrations, where deleting a student or an
+        # enrollment left its enrollments and grades behind
+        conn = sqlite3.connect(self.path)
+        database.create_base_tables(conn.cursor())
+        conn.executescript('''
+            INSERT INTO students (id, first_name, last_name, email) VALUES (1, 'Ada', 'Lovelace', 'ada@example.com');
+            INSERT INTO students (id, first_name, last_name, email) VALUES (2, 'Alan', 'Turing', 'alan@example.com');
+            INSERT INTO courses (id, code, name, credits) VALUES (1, 'CS101', 'Programming', 3);
+            INSERT INTO enrollments (id, student_id, course_id) VALUES (1, 1, 1);
+            INSERT INTO enrollments (id, student_id, course_id) VALUES (2, 2, 1);
+            INSERT INTO grades (enrollment_id, grade) VALUES (1, 90);
+            INSERT INTO grades (enrollment_id, grade) VALUES (2, 70);
+            INSERT INTO grades (enrollment_id, grade) VALUES (3, 80);
+            DELETE FROM students WHERE id = 2;
+        ''')
+        conn.commit()
+        conn.close()
+        
+        conn = database.connect(self.path)
+        try:
+            self.assertEqual(database.migrate(conn), len(database.MIGRATIONS))
+            self.assertEqual(conn.execute("SELECT id FROM enrollments").fetchall(), [(1,)])
+            self.assertEqual(conn.execute("SELECT enrollment_id, grade FROM grades").fetchall(), [(1, 90.0)])
+            self.assertEqual(conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+            counts, _ = database.read_stats(conn.cursor())
+            self.assertEqual((counts["students"], counts["enrollments"], counts["grades"]), (1, 1, 1))
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from schedule import Slot, parse
+
+WEEKDAYS_9_TO_10 = [Slot(day, 9 * 60, 10 * 60) for day in range(5)]
+
+class ParseTest(unittest.TestCase):
+    def test_day_lists(self):
+        self.assertEqual(parse("Mon/Wed 09:00-10:15"), [Slot(0, 540, 615), Slot(2, 540, 615)])
+        self.assertEqual(parse("MWF 9-10"), [Slot(0, 540, 600), Slot(2, 540, 600), Slot(4, 540, 600)])
+        self.assertEqual(parse("TTh 1:30-2:45pm; F 9-11"),
+                         [Slot(1, 810, 885), Slot(3, 810, 885), Slot(4, 540, 660)])
+    
+    def test_day_ranges(self):
+        for text in ["Mon-Fri 9-10", "Mon - Fri 9-10", "Mon – Fri 9-10", "monday-friday 9-10", "M-F 9-10",
+                     "M - F 9:00-10:00", "m-f 9am-10am"]:
+            with self.subTest(text=text):
+                self.assertEqual(parse(text), WEEKDAYS_9_TO_10)
+        self.assertEqual(parse("T-R 1-2pm"), [Slot(day, 780, 840) for day in (1, 2, 3)])
+        self.assertEqual(parse("Tu - Th 9-10; Sat 10:00-12:00"),
+                         [Slot(1, 540, 600), Slot(2, 540, 600), Slot(3, 540, 600), Slot(5, 600, 720)])
+    
+    def test_empty(self):
+        self.assertEqual(parse(""), [])
+        self.assertEqual(parse(None), [])
+    
+    def test_unreadable(self):
+        for text in ["TBA", "Online", "Fri-Mon 9-10", "X-F 9-10", "Mon 10-9", "Mon 9-10 and later"]:
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse(text)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import queue
+import sqlite3
+import threading
+
+class DatabaseWorker:
+    # Runs database jobs on a background thread with its own connection, so
+    # slow queries never block the Tk main loop. Results are queued and handed
+    # to their callbacks by deliver(), which the UI calls from root.after.
+    def __init__(self, connect, on_error=None):
+        self.on_error = on_error
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.current = None
+        self.conn = None
+        self.thread = threading.Thread(target=self.run, args=(connect,), daemon=True)
+        self.thread.start()
+    
+    def submit(self, job, callback=None, error=None, key=None):
+        # job(conn) runs on the worker thread, callback(result) or error(exc)
+        # on the thread calling deliver(). A newer job with the same key
+        # supersedes older ones: they are skipped or interrupted, and their
+        # results are dropped.
+        with self.lock:
+            generation = self.generations.get(key, 0) + 1
+            if key is not None:
+                self.generations[key] = generation
+                if self.current is not None and self.current[0] == key and self.conn is not None:
+                    self.conn.interrupt()
+        self.jobs.put((job, callback, error, key, generation))
+    
+    def cancel(self, key):
+        # Drop whatever is pending or running for a key
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            if self.current is not None and self.current[0] == key and self.conn is not None:
+                self.conn.interrupt()
+    
+    def is_stale(self, key, generation):
+        with self.lock:
+            return key is not None and self.generations.get(key) != generation
+    
+    def run(self, connect):
+        self.conn = connect()
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+            job, callback, error, key, generation = item
+            if self.is_stale(key, generation):
+                continue
+            
+            with self.lock:
+                self.current = (key, generation)
+            try:
+                result = job(self.conn)
+                self.results.put((callback, result, key, generation))
+            except Exception as e:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                # An interrupted query was superseded, nobody is waiting for it
+                if not (isinstance(e, sqlite3.OperationalError) and self.is_stale(key, generation)):
+                    self.results.put((error or self.on_error, e, key, generation))
+            finally:
+                with self.lock:
+                    self.current = None
+        self.conn.close()
+    
+    def post(self, callback, value):
+        # Queue a call for the UI thread from any thread, e.g. progress updates
+        self.results.put((callback, value, None, 0))
+    
+    def deliver(self):
+        # Call from the UI thread: run callbacks for jobs that are still current
+        while True:
+            try:
+                callback, value, key, generation = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if callback is not None and not self.is_stale(key, generation):
+                callback(value)
+    
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join(timeout=5)